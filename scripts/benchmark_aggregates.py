@@ -0,0 +1,94 @@
+# Micro benchmark of the queries behind the two plots in src/app.py,
+# for a sample of date slider ranges:
+#  - pandas:       filter the raw plays + groupby + sort_values + head(20) (the original update_plots)
+#  - cube:         slice + groupby of the (month x artist) cube (aggregates.build_month_artist_cube)
+#  - prefix sums:  subtraction of prefix sums + argpartition (aggregates.PrefixSumIndex)
+#
+# Usage (from the root of the repo):
+#   python scripts/benchmark_aggregates.py [csv file] [--ranges N]
+
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import aggregates
+import data_store
+
+parser = argparse.ArgumentParser()
+parser.add_argument('csv', nargs='?', default='src/data/extended_streaming_Sept2020-Jun2024.csv')
+parser.add_argument('--ranges', type=int, default=200)
+parser.add_argument('--seed', type=int, default=0)
+args = parser.parse_args()
+
+data = data_store.load_plays(args.csv)
+# The columns the original update_plots filtered and grouped the plays by
+data['date'] = data['ts'].dt.date
+data['year-month'] = data['ts'].dt.strftime('%Y-%m')
+
+start = time.perf_counter()
+cube = aggregates.build_month_artist_cube(data)
+cube_time = time.perf_counter() - start
+
+start = time.perf_counter()
+prefix_sums = aggregates.PrefixSumIndex(cube)
+prefix_time = time.perf_counter() - start
+
+months = list(prefix_sums.months)
+random.seed(args.seed)
+ranges = [tuple(sorted(random.sample(range(len(months)), 2))) for _ in range(args.ranges)]
+
+def pandas_query(start_month, end_month):
+    # The filter + groupby chain update_plots used before the aggregates
+    # (month indices are months since Jan 1970, the same as numpy's datetime64[M])
+    start_date = np.datetime64(int(start_month), 'M').astype('datetime64[D]').astype(object)
+    end_date = (np.datetime64(int(end_month), 'M') + 1).astype('datetime64[D]').astype(object)
+    selected = data[(data['date'] >= start_date) & (data['date'] < end_date)]
+    df_hist = selected.groupby('year-month').size().reset_index(name='count').sort_values(by='year-month')
+    df_summary = (selected
+        .groupby(aggregates.ARTIST_COLUMN, observed=True)['ms_played'].sum()
+        .reset_index(name='total')
+        .sort_values(by='total', ascending=False)
+        .head(20)
+        .sort_values(by='total'))
+    return df_hist, df_summary
+
+def cube_query(start_month, end_month):
+    # Months are month indices (see data_store.month_index) so the slice is two integer comparisons
+    cube_slice = cube[(cube['month'] >= start_month) & (cube['month'] <= end_month)]
+    df_hist = (cube_slice
+        .groupby('month')['count'].sum()
+        .reset_index(name='count')
+        .sort_values(by='month'))
+    df_summary = (cube_slice
+        .groupby(aggregates.ARTIST_COLUMN, observed=True)['ms_played'].sum()
+        .reset_index(name='total')
+        .sort_values(by='total', ascending=False)
+        .head(20)
+        .sort_values(by='total'))
+    return df_hist, df_summary
+
+def prefix_query(start_month, end_month):
+    return (prefix_sums.monthly_counts(start_month, end_month),
+            prefix_sums.top_artists(start_month, end_month))
+
+def time_queries(query):
+    timings = []
+    for i, j in ranges:
+        start = time.perf_counter()
+        query(months[i], months[j])
+        timings.append(time.perf_counter() - start)
+    return np.array(timings) * 1000
+
+print(f"{len(data)} plays, {len(months)} months, {len(prefix_sums.artists)} artists, {len(ranges)} ranges")
+print(f"build: cube {cube_time * 1000:.1f}ms, prefix sums {prefix_time * 1000:.1f}ms")
+print(f"{'path':<12} {'mean (ms)':>10} {'p50 (ms)':>10} {'p95 (ms)':>10}")
+
+for name, query in [('pandas', pandas_query), ('cube', cube_query), ('prefix sums', prefix_query)]:
+    timings = time_queries(query)
+    print(f"{name:<12} {timings.mean():>10.3f} {np.percentile(timings, 50):>10.3f} {np.percentile(timings, 95):>10.3f}")
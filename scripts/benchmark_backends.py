@@ -0,0 +1,119 @@
+# Benchmark of the two data backends of src/dataset.py (DATA_BACKEND):
+#  - pandas:  the plays loaded into memory and aggregated into prefix sums (aggregates.py)
+#  - sqlite:  the plays in a SQLite database file, queried per slider range (plays_database.py)
+#
+# Each backend is measured in a fresh process: the time to get the dataset
+# ready, the latency of working out the plot data of a slider range (without
+# the plot cache or the precomputed ranges), the memory the dataset takes and
+# the peak RSS of the process. It also checks both backends give exactly the
+# same plot data for every range timed.
+#
+# Meant for big synthetic datasets, eg. 10M plays:
+#   python scripts/generate_history.py --rows 10000000 --store /tmp/synthetic_10M.columns
+#   python scripts/benchmark_backends.py /tmp/synthetic_10M.columns [--ranges N]
+# The SQLite database is built next to the data first (and its build time and size reported),
+# unless there is an up to date one already.
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import load_test
+
+def slider_ranges(n_months, n_ranges, seed):
+    # The full range plus a random sample of the others
+    ranges = [(start, end) for start in range(1, n_months + 1) for end in range(start, n_months + 1)]
+    random.Random(seed).shuffle(ranges)
+    return [(1, n_months)] + [r for r in ranges if r != (1, n_months)][:n_ranges - 1]
+
+def measure(data_path, backend, n_ranges, seed):
+    os.environ['FIGURE_CACHE_SIZE'] = '0'
+    os.environ.pop('FIGURE_CACHE_DIR', None)
+
+    import dataset as dataset_module
+
+    start = time.perf_counter()
+    dataset = dataset_module.Dataset(data_path, backend=backend)
+    ready_seconds = time.perf_counter() - start
+
+    query_ms, digests = [], []
+    for s, e in slider_ranges(len(dataset.date_range_dictionary), n_ranges, seed):
+        start = time.perf_counter()
+        plot_data = dataset.build_plot_data(s, e)
+        query_ms.append((time.perf_counter() - start) * 1000)
+        digests.append(hashlib.sha256(json.dumps(plot_data).encode()).hexdigest())
+
+    results = {'ready_seconds': ready_seconds,
+               'dataset_memory_mb': dataset.memory_bytes() / 1e6,
+               # ru_maxrss is in KB on Linux
+               'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3}
+    for percentile, value in load_test.percentiles(query_ms).items():
+        results[f'plot_data_{percentile}_ms'] = value
+    return results, digests
+
+def build_database(data_path):
+    import plays_database
+
+    database_path = plays_database.database_path_for(data_path)
+    build_seconds = None
+    if not plays_database.database_is_fresh(data_path):
+        start = time.perf_counter()
+        plays_database.ensure_database(data_path)
+        build_seconds = time.perf_counter() - start
+    return {'path': database_path,
+            'build_seconds': build_seconds,
+            'size_mb': os.path.getsize(database_path) / 1e6,
+            'rows': int(plays_database.read_meta(database_path)['rows'])}
+
+def run_in_subprocess(data_path, *args):
+    # A fresh process for each step, so the peak memory of one doesn't show up in the next
+    # (ru_maxrss is kept across exec, so the parent process stays small too)
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), os.path.abspath(data_path), *args],
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the pandas and sqlite data backends.')
+    parser.add_argument('data', nargs='?', default='src/data/extended_streaming_Sept2020-Jun2024.csv',
+                        help='CSV file or columnar store')
+    parser.add_argument('--ranges', type=int, default=200, help='number of slider ranges timed')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--measure', help=argparse.SUPPRESS)
+    parser.add_argument('--build', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.data, args.measure, args.ranges, args.seed)))
+        sys.exit()
+    if args.build:
+        print(json.dumps(build_database(args.data)))
+        sys.exit()
+
+    database = run_in_subprocess(args.data, '--build')
+    if database['build_seconds'] is not None:
+        print(f"Built {database['path']} in {database['build_seconds']:.1f}s")
+    print(f"{database['path']}: {database['size_mb']:.1f}MB, {database['rows']} plays")
+
+    results, digests = {}, {}
+    for backend in ('pandas', 'sqlite'):
+        results[backend], digests[backend] = run_in_subprocess(args.data, '--measure', backend, '--ranges', str(args.ranges),
+                                                               '--seed', str(args.seed))
+
+    print()
+    print(f"{'metric':<24}" + ''.join(f"{backend:>12}" for backend in results))
+    for metric in results['pandas']:
+        print(f"{metric:<24}" + ''.join(f"{round(values[metric], 2):>12}" for values in results.values()))
+
+    mismatches = sum(a != b for a, b in zip(digests['pandas'], digests['sqlite']))
+    print()
+    print(f"{mismatches} of {len(digests['pandas'])} slider ranges give different plot data")
+    if mismatches:
+        sys.exit(1)
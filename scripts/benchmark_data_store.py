@@ -0,0 +1,44 @@
+# Benchmark of the start up data load in src/app.py:
+# parsing the CSV (read_csv + pd.to_datetime) vs. reading the columnar store.
+#
+# Usage (from the root of the repo):
+#   python scripts/benchmark_data_store.py [csv files...] [--repeat N]
+# By default the bundled src/data/extended_streaming_*.csv files are used.
+# Stores are written to a temporary directory so src/data is left untouched.
+
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import data_store
+
+parser = argparse.ArgumentParser()
+parser.add_argument('csv', nargs='*', default=sorted(glob.glob('src/data/extended_streaming_*.csv')))
+parser.add_argument('--repeat', type=int, default=5)
+args = parser.parse_args()
+
+def best_of(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+print(f"{'file':<45} {'rows':>9} {'csv (s)':>9} {'store (s)':>10} {'speedup':>8}")
+
+with tempfile.TemporaryDirectory() as tmp:
+    for csv_path in args.csv:
+        data = data_store.read_csv(csv_path)
+        store_path = os.path.join(tmp, os.path.basename(csv_path) + data_store.STORE_SUFFIX)
+        data_store.write_store(data, store_path)
+
+        csv_time = best_of(lambda: data_store.read_csv(csv_path), args.repeat)
+        store_time = best_of(lambda: data_store.read_store(store_path), args.repeat)
+
+        print(f"{os.path.basename(csv_path):<45} {len(data):>9} {csv_time:>9.3f} {store_time:>10.3f} {csv_time / store_time:>7.1f}x")
@@ -0,0 +1,91 @@
+# Benchmark of building the two plots of src/app.py for a sample of date slider ranges:
+#  - plotly express: px.bar + update_xaxes / update_yaxes / update_layout (how the plots used to be built)
+#  - figures.py:     the figure dicts built directly from the pre-resolved template
+# timing the build on its own and the build plus serialization to JSON (what
+# each callback does). It also checks both give the same JSON for every range.
+#
+# Usage (from the root of the repo):
+#   python scripts/benchmark_figures.py [csv file] [--ranges N]
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+import plotly.express as px
+from plotly.utils import PlotlyJSONEncoder
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import data_store
+import dataset as dataset_module
+import figures
+
+parser = argparse.ArgumentParser()
+parser.add_argument('csv', nargs='?', default='src/data/extended_streaming_Sept2020-Jun2024.csv')
+parser.add_argument('--ranges', type=int, default=200)
+parser.add_argument('--seed', type=int, default=0)
+args = parser.parse_args()
+
+os.environ['FIGURE_CACHE_SIZE'] = '0'
+dataset = dataset_module.Dataset(args.csv)
+prefix_sums = dataset.month_prefix_sums
+
+months = list(prefix_sums.months)
+random.seed(args.seed)
+ranges = [tuple(sorted(random.sample(range(len(months)), 2))) for _ in range(args.ranges)]
+
+# The data for each range, so only the figures are timed
+plot_data = []
+for i, j in ranges:
+    df_hist = prefix_sums.monthly_counts(months[i], months[j])
+    df_hist['month-year'] = [data_store.month_label(month) for month in df_hist['month']]
+    summary = prefix_sums.top_artists(months[i], months[j], n=20)
+    summary['hours'] = round(summary['total'] / (1000 * 60 * 60), 2)
+    plot_data.append((df_hist, summary))
+
+def express_figures(df_hist, summary):
+    histogram = px.bar(df_hist, x='month-year', y='count',
+                       labels={'month-year': 'Month', 'count': 'Number of songs'}, template='custom')
+    histogram.update_xaxes(tickangle=45)
+    histogram.update_xaxes(tickmode='array', tickvals=df_hist['month-year'], ticktext=df_hist['month-year'])
+
+    top_artists = px.bar(summary, y='master_metadata_album_artist_name', x='hours',
+                         labels={'master_metadata_album_artist_name': 'Artist', 'hours': 'Hours Streamed'},
+                         template='custom')
+    top_artists.update_layout(margin=dict(b=112))
+    top_artists.update_yaxes(tickmode='array', tickvals=summary['master_metadata_album_artist_name'],
+                             ticktext=summary['master_metadata_album_artist_name'])
+    return histogram, top_artists
+
+def dict_figures(df_hist, summary):
+    return (figures.histogram_figure(df_hist['month-year'].tolist(), df_hist['count'].tolist()),
+            figures.top_artists_figure(summary['master_metadata_album_artist_name'].tolist(), summary['hours'].tolist()))
+
+def serialize(plots):
+    return json.dumps(plots, cls=PlotlyJSONEncoder)
+
+def time_builds(build, and_serialize):
+    timings = []
+    for df_hist, summary in plot_data:
+        start = time.perf_counter()
+        plots = build(df_hist, summary)
+        if and_serialize:
+            serialize(plots)
+        timings.append(time.perf_counter() - start)
+    return np.array(timings) * 1000
+
+# Same JSON both ways
+mismatches = sum(json.loads(serialize(express_figures(*data))) != json.loads(serialize(dict_figures(*data)))
+                 for data in plot_data)
+
+print(f"{len(ranges)} ranges, {mismatches} with different figures")
+print(f"{'path':<16} {'step':<18} {'mean (ms)':>10} {'p50 (ms)':>10} {'p95 (ms)':>10}")
+
+for name, build in [('plotly express', express_figures), ('figures.py', dict_figures)]:
+    for step, and_serialize in [('build', False), ('build + serialize', True)]:
+        timings = time_builds(build, and_serialize)
+        print(f"{name:<16} {step:<18} {timings.mean():>10.3f} {np.percentile(timings, 50):>10.3f} {np.percentile(timings, 95):>10.3f}")
@@ -0,0 +1,50 @@
+# Benchmark of scripts/ingest.py with 1..N worker processes.
+# Reports the throughput in JSON records / second and checks every worker
+# count writes exactly the same CSV as the serial path.
+#
+# Usage (from the root of the repo):
+#   python scripts/benchmark_ingest.py --input 'src/data/Streaming_History_Audio_*.json' --max-workers 4
+
+import argparse
+import contextlib
+import glob
+import hashlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import ingest
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--input', default='src/data/Streaming_History_Audio_*.json')
+parser.add_argument('--max-workers', type=int, default=os.cpu_count())
+args = parser.parse_args()
+
+paths = sorted(glob.glob(args.input))
+if not paths:
+    sys.exit(f"No files match {args.input}")
+
+records = sum(1 for path in paths for _ in ingest.iter_json_records(path))
+print(f"{len(paths)} files, {records} records")
+print(f"{'workers':>7} {'time (s)':>9} {'records/s':>11} {'same output':>12}")
+
+serial_digest = None
+
+with tempfile.TemporaryDirectory() as tmp:
+    for workers in range(1, args.max_workers + 1):
+        output = os.path.join(tmp, f'workers_{workers}.csv')
+
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            ingest.main(['--input', args.input, '--output', output, '--workers', str(workers)])
+        elapsed = time.perf_counter() - start
+
+        with open(output, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        serial_digest = serial_digest or digest
+
+        print(f"{workers:>7} {elapsed:>9.2f} {records / elapsed:>11.0f} {str(digest == serial_digest):>12}")
@@ -0,0 +1,112 @@
+# Benchmark of bucketing the plays by month, before and after switching to month indices:
+#  - before: a Python date object per play (ts.dt.date) and a 'YYYY-MM' string per
+#            play (ts.dt.strftime), date object comparisons to filter a slider range,
+#            a groupby of the strings, and slider values turned into dates through
+#            month name strings and pd.to_datetime
+#  - after:  the int16 month index of data_store.month_index (months since Jan 1970),
+#            integer comparisons, np.bincount, and slider value -> month index arithmetic
+# for each step: making the month column(s), mapping the slider values of a range to
+# months, the monthly counts of a range straight from the plays, and building the
+# (month x artist) cube at start up. It also checks both give the same counts.
+#
+# Usage (from the root of the repo):
+#   python scripts/benchmark_months.py [csv files...] [--ranges N]
+# By default the bundled src/data/extended_streaming_*.csv files are used.
+
+import argparse
+import glob
+import os
+import random
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import aggregates
+import data_store
+
+parser = argparse.ArgumentParser()
+parser.add_argument('csv', nargs='*')
+parser.add_argument('--ranges', type=int, default=200)
+parser.add_argument('--seed', type=int, default=0)
+args = parser.parse_args()
+
+csv_paths = args.csv or sorted(glob.glob('src/data/extended_streaming_*.csv'))
+
+def time_ms(function):
+    start = time.perf_counter()
+    result = function()
+    return (time.perf_counter() - start) * 1000, result
+
+# ------------------------------------
+# Before: dates and 'YYYY-MM' strings
+
+def string_columns(data):
+    return data['ts'].dt.date, data['ts'].dt.strftime('%Y-%m')
+
+def slider_dates(date_range_dictionary, start_value, end_value):
+    # The old get_date_from_slider_value_start / _end
+    start_date = (pd.to_datetime(date_range_dictionary[start_value]) + pd.offsets.MonthBegin(0)).date()
+    end_date = (pd.to_datetime(date_range_dictionary[end_value]) + pd.offsets.MonthEnd(0)).date()
+    return start_date, end_date
+
+def string_counts(date, year_month, start_date, end_date):
+    selected = year_month[(date >= start_date) & (date <= end_date)]
+    return selected.groupby(selected).size().sort_index()
+
+def string_cube(data, year_month):
+    return (data.assign(**{'year-month': year_month})
+        .groupby(['year-month', aggregates.ARTIST_COLUMN], dropna=False, observed=True)
+        .agg(count=('ms_played', 'size'), ms_played=('ms_played', 'sum'))
+        .reset_index())
+
+# ------------------------------------
+# After: month indices
+
+def month_counts(month, start_month, end_month):
+    selected = month[(month >= start_month) & (month <= end_month)]
+    counts = np.bincount(selected - start_month, minlength=end_month - start_month + 1)
+    return counts[counts > 0]
+
+print(f"{'file':<45} {'step':<20} {'before (ms)':>12} {'after (ms)':>11} {'speed up':>9}")
+
+for csv_path in csv_paths:
+    data = data_store.load_plays(csv_path)
+
+    before_columns, (date, year_month) = time_ms(lambda: string_columns(data))
+    after_columns, month = time_ms(lambda: data_store.month_index(data['ts']))
+    month = month.to_numpy()
+
+    first_month = int(month.min())
+    n_months = int(month.max()) - first_month + 1
+    date_range_dictionary = {value: data_store.month_label(first_month + value - 1) for value in range(1, n_months + 1)}
+    random.seed(args.seed)
+    ranges = [tuple(sorted(random.sample(range(1, n_months + 1), 2))) for _ in range(args.ranges)]
+
+    before_slider, _ = time_ms(lambda: [slider_dates(date_range_dictionary, s, e) for s, e in ranges])
+    after_slider, _ = time_ms(lambda: [(first_month + s - 1, first_month + e - 1) for s, e in ranges])
+
+    mismatches = 0
+    before_counts = after_counts = 0
+    for s, e in ranges:
+        elapsed, expected = time_ms(lambda: string_counts(date, year_month, *slider_dates(date_range_dictionary, s, e)))
+        before_counts += elapsed
+        elapsed, counts = time_ms(lambda: month_counts(month, first_month + s - 1, first_month + e - 1))
+        after_counts += elapsed
+        mismatches += not np.array_equal(expected.to_numpy(), counts)
+
+    before_cube, _ = time_ms(lambda: string_cube(data, year_month))
+    after_cube, _ = time_ms(lambda: aggregates.build_month_artist_cube(data))
+
+    name = os.path.basename(csv_path)
+    steps = [('month columns', before_columns, after_columns),
+             ('slider -> months', before_slider / len(ranges), after_slider / len(ranges)),
+             ('counts of a range', before_counts / len(ranges), after_counts / len(ranges)),
+             ('month x artist cube', before_cube, after_cube)]
+    for step, before, after in steps:
+        print(f"{name:<45} {step:<20} {before:>12.4f} {after:>11.4f} {before / after:>8.0f}x")
+    print(f"{name:<45} {len(data)} plays, month columns {(date.memory_usage(deep=True) + year_month.memory_usage(deep=True)) / len(data):.1f} "
+          f"-> {month.nbytes / len(data):.1f} B/row, {mismatches} of {len(ranges)} ranges with different counts")
@@ -0,0 +1,235 @@
+# Benchmark suite for the data and callback paths of src/app.py, on the bundled
+# CSV and on synthetic copies of it scaled up 10x, 100x, 1000x...
+#
+# For each dataset it measures, in a fresh process:
+#  - load:           reading + parsing the CSV (data_store.read_csv + compact_plays,
+#                    even when there is a columnar store next to it)
+#  - store_load:     reading the same plays from a columnar store (data_store.read_store,
+#                    of a store written to a temporary directory)
+#  - import:         importing src/app.py with the data loaded before it returns
+#                    (LOAD_DATA_IN_BACKGROUND=false), so everything done at start up
+#  - update_plots:   latency of the slider callback for a spread of date ranges,
+#                    built from scratch and served from the plot cache
+#  - serialization:  size and time of the JSON the callback sends to the browser
+#  - memory:         peak RSS of the process and the size of the plays data frame
+# and with --load-test it also runs scripts/load_test.py against gunicorn.
+#
+# The synthetic datasets repeat every play of the CSV `scale` times, so they
+# cover the same months (and slider positions) with `scale` times the plays.
+#
+# --output saves the results as JSON and --baseline compares them with a
+# previous run, listing (and exiting with 1 for) anything more than
+# --tolerance slower or bigger.
+#
+# Usage (from the root of the repo):
+#   python scripts/benchmark_suite.py
+#   python scripts/benchmark_suite.py --scales 1 10 100 1000 --load-test --output results.json
+#   python scripts/benchmark_suite.py --baseline results.json
+# The synthetic CSVs are written to a temporary directory, or to --work-dir to keep them between runs
+# (the 1000x one is several GB).
+
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import load_test
+
+# ------------------------------------
+# Synthetic datasets
+
+def synthetic_csv(data_path, scale, directory):
+    if scale == 1:
+        return data_path
+    path = os.path.join(directory, f'{os.path.splitext(os.path.basename(data_path))[0]}_x{scale}.csv')
+    if not os.path.exists(path):
+        data = pd.read_csv(data_path)
+        tmp_path = path + '.tmp'
+        data.to_csv(tmp_path, index=False)
+        for _ in range(scale - 1):
+            data.to_csv(tmp_path, mode='a', header=False, index=False)
+        os.replace(tmp_path, path)
+    return path
+
+# ------------------------------------
+# Measurements (run in a child process per dataset, see measure_in_subprocess)
+
+def slider_ranges(n_months, n_ranges, seed):
+    # The full range, the first and last month and a random sample of the rest
+    ranges = {(1, n_months), (1, 1), (n_months, n_months)}
+    all_ranges = [(start, end) for start in range(1, n_months + 1) for end in range(start, n_months + 1)]
+    random.Random(seed).shuffle(all_ranges)
+    for slider_range in all_ranges:
+        if len(ranges) >= n_ranges:
+            break
+        ranges.add(slider_range)
+    return sorted(ranges)
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, (time.perf_counter() - start) * 1000
+
+def measure(data_path, n_ranges, seed):
+    # No plot cache, no plot data precomputed in the background (or read back from a
+    # .plots.json.gz artifact) and no data file watcher, so the timings below are
+    # of the plots built from scratch with nothing else running
+    os.environ.update(DATA_PATH=data_path, LOAD_DATA_IN_BACKGROUND='false', FIGURE_CACHE_SIZE='0',
+                      WARM_PLOT_DATA='false', DATA_RELOAD_SECONDS='0')
+    os.environ.pop('FIGURE_CACHE_DIR', None)
+
+    import data_store
+
+    # CSV load and parse (not load_plays, which would read a columnar store built from the CSV)
+    data, load_ms = timed(lambda: data_store.compact_plays(data_store.read_csv(data_path)))
+    rows = len(data)
+
+    # Columnar store load, timed on a store of its own so one next to the CSV is left alone
+    store_dir = tempfile.mkdtemp(prefix='spotify-benchmark-store-')
+    try:
+        store_path = os.path.join(store_dir, 'plays' + data_store.STORE_SUFFIX)
+        data_store.write_store(data, store_path)
+        del data
+        _, store_load_ms = timed(lambda: data_store.read_store(store_path))
+    finally:
+        shutil.rmtree(store_dir, ignore_errors=True)
+
+    # Everything done when the app is imported
+    _, import_ms = timed(lambda: __import__('app'))
+
+    import app
+    import figure_cache
+    from plotly.utils import PlotlyJSONEncoder
+
+    dataset = app.app.dataset_loader.wait()
+    assert dataset.precomputed == {}, 'the plot data was precomputed, the timings would be of lookups'
+    ranges = slider_ranges(len(dataset.date_range_dictionary), n_ranges, seed)
+
+    # Plot updates built from scratch, and what the callback sends back (serialized like Dash does)
+    build_ms, serialize_ms, response_bytes = [], [], []
+    for start, end in ranges:
+        plots, elapsed = timed(lambda: dataset.update_plots_patch([start, end]))
+        build_ms.append(elapsed)
+        body, elapsed = timed(lambda: json.dumps(plots, cls=PlotlyJSONEncoder))
+        serialize_ms.append(elapsed)
+        response_bytes.append(len(body))
+
+    # Plot updates served from the (in-memory) plot cache
+    dataset.plot_cache = figure_cache.FigureCache(max_size=len(ranges))
+    for start, end in ranges:
+        dataset.update_plots_patch([start, end])
+    cached_ms = [timed(lambda: dataset.update_plots_patch([start, end]))[1] for start, end in ranges]
+
+    results = {'rows': rows,
+               'ranges': len(ranges),
+               'load_ms': load_ms,
+               'store_load_ms': store_load_ms,
+               'import_ms': import_ms,
+               'data_memory_mb': dataset.data.memory_usage(index=True, deep=True).sum() / 1e6,
+               # ru_maxrss is in KB on Linux
+               'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3}
+    for name, values in [('update_plots', build_ms), ('cached', cached_ms),
+                         ('serialize', serialize_ms), ('response_bytes', response_bytes)]:
+        unit = '' if name == 'response_bytes' else '_ms'
+        for percentile, value in load_test.percentiles(values).items():
+            results[f'{name}_{percentile}{unit}'] = value
+    return results
+
+def measure_in_subprocess(data_path, n_ranges, seed):
+    # A fresh process per dataset, so the import time and peak memory are not
+    # affected by the datasets measured before
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--measure', os.path.abspath(data_path),
+                             '--ranges', str(n_ranges), '--seed', str(seed)],
+                            cwd=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'),
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+# ------------------------------------
+# Reporting
+
+# Metrics where a bigger number is worse, compared with --baseline
+# (counts like rows and requests, and throughput, are left out)
+def is_cost(metric):
+    return metric.endswith(('_ms', '_mb', '_seconds')) or '_bytes' in metric or metric == 'errors'
+
+def print_table(results):
+    scales = list(results.keys())
+    metrics = list(dict.fromkeys(metric for scale in scales for metric in results[scale]))
+    print(f"{'metric':<28}" + ''.join(f"{scale + 'x':>14}" for scale in scales))
+    for metric in metrics:
+        values = [results[scale].get(metric) for scale in scales]
+        print(f"{metric:<28}" + ''.join(f"{'-' if value is None else round(value, 2):>14}" for value in values))
+
+def regressions(results, baseline, tolerance):
+    found = []
+    for scale, metrics in results.items():
+        for metric, value in metrics.items():
+            old = baseline.get(scale, {}).get(metric)
+            if is_cost(metric) and value is not None and old and value > old * (1 + tolerance):
+                found.append(f"{scale}x {metric}: {old:.2f} -> {value:.2f} (+{(value / old - 1) * 100:.0f}%)")
+    return found
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the data and callback paths of the dashboard.')
+    parser.add_argument('--data', default='src/data/extended_streaming_Sept2020-Jun2024.csv')
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100],
+                        help='sizes of the synthetic datasets, as multiples of --data')
+    parser.add_argument('--ranges', type=int, default=200, help='number of slider ranges timed')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--work-dir', help='where to keep the synthetic datasets (a temporary directory by default)')
+    parser.add_argument('--load-test', action='store_true', help='also load test gunicorn on each dataset')
+    parser.add_argument('--users', type=int, default=8, help='concurrent simulated users in the load test')
+    parser.add_argument('--requests', type=int, default=50, help='slider moves per user in the load test')
+    parser.add_argument('--output', help='save the results to this JSON file')
+    parser.add_argument('--baseline', help='JSON file of a previous run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='how much slower or bigger than the baseline counts as a regression')
+    parser.add_argument('--measure', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.measure, args.ranges, args.seed)))
+        sys.exit()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='spotify-benchmark-')
+    os.makedirs(work_dir, exist_ok=True)
+
+    results = {}
+    try:
+        for scale in args.scales:
+            data_path = synthetic_csv(args.data, scale, work_dir)
+            print(f"{scale}x: {data_path}", flush=True)
+            results[str(scale)] = measure_in_subprocess(data_path, args.ranges, args.seed)
+            if args.load_test:
+                load_results = load_test.load_test(data_path, args.users, args.requests, seed=args.seed)
+                results[str(scale)].update({f'load_{name}': value for name, value in load_results.items()})
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print()
+    print_table(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        print()
+        print(f"{len(found)} regressions compared with {args.baseline}")
+        for line in found:
+            print(f"  {line}")
+        if found:
+            sys.exit(1)
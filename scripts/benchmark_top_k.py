@@ -0,0 +1,108 @@
+# Accuracy of the approximate top artists and tracks (src/heavy_hitters.py,
+# TOP_K_ENGINE=sketch) against the exact ones, for every slider range
+#
+# For each data file, for the artists and the tracks, and for each capacity
+# (items kept per month) it reports:
+#  - the time to build the monthly summaries and the memory they take, next to
+#    the memory of the exact months x items prefix sums
+#  - the median time of a top n query
+#  - recall: the share of the exact top n found (mean and worst range)
+#  - the share of ranges with exactly the same top n, in the same order
+#  - the share of ranges the summaries can guarantee their top n is right for
+#  - the error of the estimated hours of the top n (mean and p99, relative to
+#    the exact hours)
+#  - how many items had their exact hours outside the bounds given (should be 0)
+#
+# Usage (from the root of the repo):
+#   python scripts/benchmark_top_k.py [csv files or columnar stores...] [--capacities 50 100 200 500]
+# By default the bundled src/data/extended_streaming_*.csv files are used.
+# --chunk-rows adds the plays to the summaries that many at a time (default
+# heavy_hitters.CHUNK_ROWS, more than the bundled files have), to see how
+# adding the plays in several chunks affects the accuracy.
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import aggregates
+import data_store
+import heavy_hitters
+
+COLUMNS = {'artists': aggregates.ARTIST_COLUMN, 'tracks': 'master_metadata_track_name'}
+
+parser = argparse.ArgumentParser()
+parser.add_argument('data', nargs='*')
+parser.add_argument('--capacities', type=int, nargs='+', default=[50, 100, 200, 500])
+parser.add_argument('--n', type=int, default=20, help='size of the top n')
+parser.add_argument('--chunk-rows', type=int, default=heavy_hitters.CHUNK_ROWS)
+args = parser.parse_args()
+
+heavy_hitters.CHUNK_ROWS = args.chunk_rows
+data_paths = args.data or sorted(glob.glob('src/data/extended_streaming_*.csv'))
+
+def exact_prefix(months, codes, weights, n_items):
+    # Cumulative ms_played of each item over the months (like aggregates.PrefixSumIndex)
+    first_month = int(months.min())
+    n_months = int(months.max()) - first_month + 1
+    has_item = codes >= 0
+    cells = (months[has_item].astype('int64') - first_month) * n_items + codes[has_item]
+    monthly = np.bincount(cells, weights=weights[has_item], minlength=n_months * n_items).astype('int64')
+    prefix = np.vstack([np.zeros((1, n_items), dtype='int64'),
+                        np.cumsum(monthly.reshape(n_months, n_items), axis=0)])
+    return first_month, prefix
+
+def exact_top(totals, names, n):
+    listened = np.flatnonzero(totals)
+    order = np.lexsort((names[listened], -totals[listened]))
+    return listened[order[:n]]
+
+print(f"{'file':<40} {'items':<8} {'capacity':>8} {'build (ms)':>10} {'memory (KB)':>11} {'query (ms)':>10} "
+      f"{'recall':>7} {'worst':>6} {'same':>6} {'sure':>6} {'err mean':>9} {'err p99':>8} {'outside':>8}")
+
+for data_path in data_paths:
+    data = data_store.load_plays(data_path)
+    months = data['month'].to_numpy()
+    weights = data['ms_played'].to_numpy()
+    month_values = np.arange(int(months.min()), int(months.max()) + 1)
+    ranges = [(s, e) for s in month_values for e in month_values if e >= s]
+    name = os.path.basename(data_path.rstrip(os.sep))
+
+    for items, column in COLUMNS.items():
+        codes = data[column].cat.codes.to_numpy().astype('int64')
+        names = np.asarray(data[column].cat.categories, dtype=object)
+        first_month, prefix = exact_prefix(months, codes, weights, len(names))
+        print(f"{name:<40} {items:<8} {'exact':>8} {'':>10} {prefix.nbytes / 1e3:>11.0f}   "
+              f"({len(names)} {items}, {len(ranges)} slider ranges)")
+
+        for capacity in args.capacities:
+            start = time.perf_counter()
+            sketches = heavy_hitters.MonthlyTopK(months, codes, weights, names, capacity=capacity)
+            build_ms = (time.perf_counter() - start) * 1000
+
+            query_ms, recall, same, sure, errors = [], [], 0, 0, []
+            outside = 0
+            for s, e in ranges:
+                start = time.perf_counter()
+                result = sketches.top(s, e, args.n)
+                query_ms.append((time.perf_counter() - start) * 1000)
+
+                totals = prefix[e - first_month + 1] - prefix[s - first_month]
+                expected = exact_top(totals, names, args.n)
+                exact_values = totals[result.items]
+
+                recall.append(len(set(result.items) & set(expected)) / max(len(expected), 1))
+                same += list(result.items) == list(expected)
+                sure += result.guaranteed()
+                errors.extend(np.abs(result.estimates - exact_values) / np.maximum(exact_values, 1))
+                outside += int(((exact_values < result.lower) | (exact_values > result.upper)).sum())
+
+            print(f"{name:<40} {items:<8} {capacity:>8} {build_ms:>10.1f} {sketches.nbytes() / 1e3:>11.0f} "
+                  f"{np.median(query_ms):>10.3f} {np.mean(recall):>7.3f} {np.min(recall):>6.2f} "
+                  f"{same / len(ranges):>6.2f} {sure / len(ranges):>6.2f} {np.mean(errors):>9.4f} "
+                  f"{np.percentile(errors, 99):>8.4f} {outside:>8}")
@@ -0,0 +1,177 @@
+# Bytes on the wire for a visit to the dashboard, with and without compression
+#
+# Simulates a browser against gunicorn (started on --data, or a server that
+# is already running with --url): loading the page, the scripts and styles it
+# links to (plus the plotly.js chunks the graphs load), the layout and the
+# first render of the plots, then a number of slider moves. The visit is done
+# twice with a simple browser cache in between, which keeps responses with a
+# max-age until they expire and sends If-None-Match for the ones with an
+# ETag, so the second visit shows what a returning visitor downloads. The
+# plots come from callbacks (POSTs), which are never cached, so a returning
+# visitor downloads those again.
+#
+# Bytes are the response bodies as sent (compressed or not), without the
+# headers. Each visit is repeated with Accept-Encoding: identity, gzip and br
+# (br is shown as unavailable if the brotli package isn't installed here or
+# the server never answers with brotli, rather than as uncompressed bytes).
+#
+# Usage (from the root of the repo):
+#   python scripts/benchmark_wire_bytes.py [--data src/data/extended_streaming_Sept2020-Jun2024.csv] [--moves 20]
+#   python scripts/benchmark_wire_bytes.py --url http://127.0.0.1:8050
+
+import argparse
+import gzip
+import json
+import random
+import re
+import time
+import urllib.error
+import urllib.request
+
+import load_test
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# The dcc chunks loaded once the page is up (the graphs and the slider), and plotly.js
+# which the graphs load from the plotly package
+DCC_CHUNKS = ['async-graph', 'async-slider']
+PLOTLY_JS = '/_dash-component-suites/plotly/package_data/plotly.{fingerprint}.min.js'
+
+class Browser:
+    def __init__(self, url, encoding):
+        self.url = url
+        self.encoding = encoding
+        self.cache = {}  # url -> (etag, fresh until, body)
+        self.requests = 0
+        self.not_modified = 0
+        self.bytes = 0
+        # Content-Encoding of the responses received (identity if none)
+        self.encodings_received = set()
+
+    def fetch(self, path, body=None):
+        url = self.url + path
+        cached = self.cache.get(url) if body is None else None
+        if cached is not None and cached[1] > time.time():
+            return cached[2]
+
+        headers = {'Accept-Encoding': self.encoding}
+        if body is not None:
+            headers['Content-Type'] = 'application/json'
+        if cached is not None and cached[0]:
+            headers['If-None-Match'] = cached[0]
+        request = urllib.request.Request(url, data=None if body is None else json.dumps(body).encode(), headers=headers)
+
+        self.requests += 1
+        try:
+            with urllib.request.urlopen(request, timeout=120) as response:
+                data = response.read()
+                response_headers = response.headers
+        except urllib.error.HTTPError as error:
+            if error.code != 304:
+                raise
+            self.not_modified += 1
+            return cached[2]
+        self.bytes += len(data)
+        self.encodings_received.add(response_headers.get('Content-Encoding', 'identity'))
+
+        if body is None:
+            max_age = re.search(r'max-age=(\d+)', response_headers.get('Cache-Control', ''))
+            fresh_until = time.time() + int(max_age.group(1)) if max_age else 0
+            if response_headers.get('ETag') or fresh_until:
+                self.cache[url] = (response_headers.get('ETag'), fresh_until, data)
+        return data
+
+    def usage(self):
+        usage = (self.requests, self.not_modified, self.bytes)
+        self.requests = self.not_modified = self.bytes = 0
+        return usage
+
+def decompress(data, encoding):
+    if encoding == 'gzip' and data[:2] == b'\x1f\x8b':
+        return gzip.decompress(data)
+    if encoding == 'br':
+        try:
+            return brotli.decompress(data)
+        except brotli.error:
+            # Too small to be compressed
+            return data
+    return data
+
+def visit(browser, n_moves, seed):
+    # The page and everything it loads
+    index = decompress(browser.fetch('/'), browser.encoding).decode()
+    paths = [path for path in re.findall(r'(?:src|href)="(/[^"]+)"', index)]
+    for path in paths:
+        browser.fetch(path)
+    dcc_path = next((path for path in paths if '/dcc/dash_core_components.' in path), None)
+    if dcc_path is not None:
+        for chunk in DCC_CHUNKS:
+            browser.fetch(dcc_path.replace('/dash_core_components.', f'/{chunk}.'))
+        # Any fingerprint gets the same file (with a year long max-age)
+        fingerprint = re.search(r'\.(v[\w]+m\d+)\.js$', dcc_path).group(1)
+        browser.fetch(PLOTLY_JS.format(fingerprint=fingerprint))
+    browser.fetch('/_dash-layout')
+    browser.fetch('/_dash-dependencies')
+    page = json.loads(decompress(browser.fetch('/_dash-update-component', load_test.render_page_body('')),
+                                 browser.encoding))
+    page_usage = browser.usage()
+
+    # Slider moves
+    n_months = load_test.find_prop(page, 'date-slider', 'max')
+    dataset_name = load_test.find_prop(page, 'dataset-name', 'data')
+    rng = random.Random(seed)
+    for _ in range(n_moves):
+        start, end = sorted(rng.sample(range(1, n_months + 1), 2))
+        browser.fetch('/_dash-update-component', load_test.update_component_body(start, end, dataset_name))
+    return page_usage, browser.usage()
+
+def measure(url, n_moves, seed):
+    # (encoding, visit, requests, 304s, page bytes, bytes per move), or (encoding, why it is unavailable)
+    rows = []
+    for encoding in ('identity', 'gzip', 'br'):
+        if encoding == 'br' and brotli is None:
+            rows.append((encoding, 'unavailable: the brotli package is not installed here'))
+            continue
+        browser = Browser(url, encoding)
+        visits = []
+        for name in ('first visit', 'repeat visit'):
+            (requests, not_modified, page_bytes), (_, _, move_bytes) = visit(browser, n_moves, seed)
+            visits.append((encoding, name, requests, not_modified, page_bytes, move_bytes / n_moves))
+        if encoding != 'identity' and encoding not in browser.encodings_received:
+            rows.append((encoding, 'unavailable: the server sent nothing with this encoding'))
+            continue
+        rows += visits
+    return rows
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Bytes on the wire for a visit to the dashboard.')
+    parser.add_argument('--data', default='src/data/extended_streaming_Sept2020-Jun2024.csv',
+                        help='data file for the local server')
+    parser.add_argument('--url', help='measure a server that is already running instead of starting one')
+    parser.add_argument('--moves', type=int, default=20, help='slider moves per visit')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.url:
+        load_test.wait_until_ready(args.url, 600)
+        rows = measure(args.url, args.moves, args.seed)
+    else:
+        port = load_test.free_port()
+        url = f'http://127.0.0.1:{port}'
+        process = load_test.start_server(args.data, port)
+        try:
+            load_test.wait_until_ready(url, 600, process)
+            rows = measure(url, args.moves, args.seed)
+        finally:
+            load_test.stop_server(process)
+
+    print(f"{'encoding':<10} {'visit':<14} {'requests':>9} {'304s':>6} {'page bytes':>12} {'bytes/move':>12}")
+    for row in rows:
+        if len(row) == 2:
+            print(f"{row[0]:<10} {row[1]}")
+            continue
+        encoding, name, requests, not_modified, page_bytes, move_bytes = row
+        print(f"{encoding:<10} {name:<14} {requests:>9} {not_modified:>6} {page_bytes:>12} {move_bytes:>12.0f}")
@@ -0,0 +1,69 @@
+# Memory and time until ready of gunicorn with 1..N workers, in three modes:
+#  - default:  every worker loads its own copy of the data (in the background)
+#  - preload:  the data is loaded once in the gunicorn master before forking (--preload)
+#  - mmap:     DATA_MMAP, every worker memory-maps the same columnar store (but builds its own aggregates)
+#
+# Memory is the total PSS (proportional set size, so shared pages are only
+# counted once) of the master and its workers. Linux only (reads /proc).
+#
+# Usage (from the root of the repo):
+#   python scripts/benchmark_workers.py [--data src/data/extended_streaming_Sept2020-Jun2024.csv] [--max-workers 4]
+
+import argparse
+import os
+import signal
+import subprocess
+import time
+import urllib.request
+
+import load_test
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--data', default='src/data/extended_streaming_Sept2020-Jun2024.csv')
+parser.add_argument('--max-workers', type=int, default=4)
+parser.add_argument('--timeout', type=float, default=300)
+args = parser.parse_args()
+
+MODES = {
+    'default': ([], {}),
+    'preload': (['--preload'], {}),
+    'mmap': ([], {'DATA_MMAP': 'true'}),
+}
+
+def wait_until_ready(port, workers, process):
+    # Ready once all the workers are up and /ready has answered 200 a few times in a row
+    # (gunicorn spreads the requests across the workers)
+    url = f'http://127.0.0.1:{port}/ready'
+    deadline = time.perf_counter() + args.timeout
+    ready_in_a_row = 0
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('gunicorn exited')
+        try:
+            urllib.request.urlopen(url, timeout=5).read()
+            ready_in_a_row += 1
+            if ready_in_a_row >= 4 * workers and len(load_test.process_tree(process.pid)) == workers + 1:
+                return
+        except OSError:
+            ready_in_a_row = 0
+            time.sleep(0.1)
+    raise TimeoutError('gunicorn did not become ready')
+
+print(f"{'mode':<8} {'workers':>7} {'ready (s)':>9} {'total PSS (MB)':>15}")
+
+for mode, (flags, env) in MODES.items():
+    for workers in range(1, args.max_workers + 1):
+        port = load_test.free_port()
+        process = subprocess.Popen(
+            ['gunicorn', '--chdir', 'src', '--workers', str(workers), '--bind', f'127.0.0.1:{port}', *flags, 'app:server'],
+            env=dict(os.environ, DATA_PATH=os.path.abspath(args.data), **env),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+        try:
+            start = time.perf_counter()
+            wait_until_ready(port, workers, process)
+            boot = time.perf_counter() - start
+            total = sum(load_test.pss_bytes(pid) for pid in load_test.process_tree(process.pid))
+            print(f"{mode:<8} {workers:>7} {boot:>9.2f} {total / 1e6:>15.1f}")
+        finally:
+            os.killpg(process.pid, signal.SIGTERM)
+            process.wait()
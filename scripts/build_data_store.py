@@ -0,0 +1,29 @@
+# This script converts the CSV used by src/app.py into a typed columnar store
+# (see src/data_store.py), which the app loads instead of the CSV when it exists.
+#
+# Usage (from the root of the repo):
+#   python scripts/build_data_store.py src/data/extended_streaming_Sept2020-Jun2024.csv
+# If no path is given DATA_PATH from the environment / .env is used.
+
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import data_store
+
+load_dotenv()
+
+data_paths = sys.argv[1:] or [os.environ.get('DATA_PATH')]
+
+for data_path in data_paths:
+    start = time.perf_counter()
+
+    data = data_store.read_csv(data_path)
+    store_path = data_store.store_path_for(data_path)
+    data_store.write_store(data, store_path)
+
+    print(f"{data_path} -> {store_path} ({len(data)} rows, {time.perf_counter() - start:.2f}s)")
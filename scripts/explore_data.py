@@ -1,4 +1,5 @@
 # This script creates the data used in src/app.py
+# (to add new exports to an existing CSV incrementally, use scripts/ingest.py instead)
 
 import pandas as pd
 import simplejson as json
@@ -0,0 +1,350 @@
+# This script generates synthetic Spotify streaming histories, for testing the
+# dashboard (and scripts/ingest.py) on much more data than the bundled CSVs.
+#
+# It can write any of:
+#  --json DIR     Streaming_History_Audio_*.json files like a Spotify "Extended
+#                 streaming history" export (input for scripts/ingest.py)
+#  --csv FILE     the CSV read by src/app.py (same columns as scripts/ingest.py writes)
+#  --store DIR    a columnar store (see src/data_store.py) that DATA_PATH can point at
+#
+# The history looks roughly like a real one:
+#  - a catalogue of artists, each with a few albums and tracks (and track lengths)
+#  - artist popularity follows a Zipf distribution, and the ranking drifts a bit
+#    from one year to the next (--drift) so the top artists change over time
+#  - more plays at weekends and in the evening, quiet spells and busier months
+#  - some plays are skipped early, and a few have no track metadata (eg. podcasts)
+#
+# The same --seed gives the same catalogue, and --user changes who is listening:
+# each user gets their own history and tastes from the same catalogue.
+#
+# The plays are generated in time order in batches of --batch-size rows, so
+# memory use doesn't depend on --rows (100M rows is fine).
+#
+# Usage (from the root of the repo):
+#   python scripts/generate_history.py --rows 1000000 --csv src/data/synthetic_1M.csv
+#   python scripts/generate_history.py --rows 100000000 --store src/data/synthetic_100M.columns
+#   python scripts/generate_history.py --rows 200000 --user alice --json exports/alice
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import data_store
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ra', 'ven', 'tor', 'sa', 'bel', 'dun', 'ri', 'mo', 'ne', 'shi', 'ta', 'vo',
+             'lin', 'gar', 'e', 'o', 'an', 'el', 'is', 'ur', 'cha', 'dre', 'fen', 'hol', 'jas', 'kru', 'pel']
+
+WORDS = ['Love', 'Night', 'Blue', 'River', 'Fire', 'Dream', 'Heart', 'City', 'Rain', 'Gold', 'Summer',
+         'Shadow', 'Light', 'Home', 'Road', 'Dance', 'Stone', 'Moon', 'Wild', 'Echo', 'Silver', 'Ocean',
+         'Morning', 'Paper', 'Glass', 'Electric', 'Slow', 'Lost', 'Young', 'Velvet']
+
+PLATFORMS = ['android', 'ios', 'windows', 'osx', 'web_player']
+REASONS_START = ['trackdone', 'clickrow', 'fwdbtn', 'playbtn', 'appload']
+REASONS_END = ['trackdone', 'fwdbtn', 'endplay', 'logout']
+
+# Share of the plays in each hour of the day (quiet at night, busiest in the evening)
+HOURLY_PROFILE = np.array([2, 1, 1, 1, 1, 2, 4, 6, 7, 7, 6, 6, 7, 6, 6, 6, 7, 8, 9, 10, 10, 9, 7, 4], dtype=float)
+
+BASE62 = np.array(list('0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'))
+
+# ------------------------------------
+# Catalogue
+
+def unique_names(names):
+    # Number any repeated names, eg. 'Intro', 'Intro (2)'
+    seen = {}
+    unique = []
+    for name in names:
+        count = seen.get(name, 0) + 1
+        seen[name] = count
+        unique.append(name if count == 1 else f'{name} ({count})')
+    return unique
+
+def made_up_word(rng):
+    return ''.join(rng.choice(SYLLABLES, size=rng.integers(2, 4))).capitalize()
+
+class Catalogue:
+    def __init__(self, rng, n_artists, tracks_per_artist):
+        self.artists = unique_names(
+            made_up_word(rng) + (' ' + made_up_word(rng) if rng.random() < 0.6 else '')
+            for _ in range(n_artists))
+
+        # Number of tracks of each artist (popular artists don't get more tracks, their rank is decided per user)
+        track_counts = 1 + rng.poisson(tracks_per_artist - 1, size=n_artists)
+        self.track_start = np.concatenate([[0], np.cumsum(track_counts)[:-1]])
+        self.track_count = track_counts
+        n_tracks = int(track_counts.sum())
+
+        self.track_artist = np.repeat(np.arange(n_artists), track_counts)
+        self.track_names = unique_names(
+            ' '.join(rng.choice(WORDS, size=rng.integers(1, 5))) for _ in range(n_tracks))
+
+        # A few albums per artist
+        album_of_track = (rng.random(n_tracks) * (1 + track_counts[self.track_artist] // 8)).astype(int)
+        self.track_albums = [f'{self.track_names[self.track_start[artist]]} Vol. {album + 1}'
+                             for artist, album in zip(self.track_artist, album_of_track)]
+
+        # spotify:track: followed by 22 base 62 characters
+        self.track_uris = ['spotify:track:' + ''.join(chars) for chars in BASE62[rng.integers(0, 62, size=(n_tracks, 22))]]
+
+        # Track lengths, mostly 2.5 to 5 minutes
+        self.track_duration_ms = np.clip(rng.lognormal(np.log(215_000), 0.3, size=n_tracks), 30_000, 1_200_000).astype('int64')
+
+    def categories(self):
+        # The categories of the columnar store, the codes are the artist and track numbers
+        return {'master_metadata_track_name': self.track_names,
+                'master_metadata_album_artist_name': self.artists,
+                'spotify_track_uri': self.track_uris}
+
+# ------------------------------------
+# When the plays happen
+
+def plays_per_day(rng, days, n_rows):
+    # Weekends are busier, some weeks are quiet and others busy, and there are some days with no plays
+    weekday = days.dayofweek.to_numpy()
+    weights = np.where(weekday >= 5, 1.3, 1.0)
+    weights *= np.exp(np.convolve(rng.normal(0, 0.5, len(days)), np.ones(14) / 14, mode='same') * 3)
+    weights *= rng.gamma(4, 0.25, len(days))
+    weights[rng.random(len(days)) < 0.05] = 0
+    return rng.multinomial(n_rows, weights / weights.sum())
+
+def popularity_by_year(rng, years, n_artists, zipf, drift):
+    # Cumulative probabilities of playing each artist, one row per year.
+    # The user's ranking of the artists is shuffled a little more each year.
+    weights = 1 / np.arange(1, n_artists + 1) ** zipf
+    score = rng.gumbel(size=n_artists)
+    cdfs = []
+    for _ in years:
+        ranking = np.argsort(-score)
+        year_weights = np.empty(n_artists)
+        year_weights[ranking] = weights
+        cdfs.append(np.cumsum(year_weights) / year_weights.sum())
+        score += rng.gumbel(size=n_artists) * drift
+    return np.array(cdfs)
+
+# ------------------------------------
+# Generator
+
+def generate_batches(catalogue, rng, n_rows, start_date, end_date, batch_size,
+                     zipf=1.1, drift=0.5, null_fraction=0.006):
+    # Yields dicts of arrays, in time order, of about batch_size plays each
+    days = pd.date_range(start_date, end_date, freq='D', inclusive='left')
+    counts = plays_per_day(rng, days, n_rows)
+    years = sorted(set(days.year))
+    cdfs = popularity_by_year(rng, years, len(catalogue.artists), zipf, drift)
+
+    day_starts = days.to_numpy().astype('datetime64[s]').astype('int64')
+    day_years = np.searchsorted(years, days.year)
+    hour_cdf = np.cumsum(HOURLY_PROFILE) / HOURLY_PROFILE.sum()
+
+    first_day = 0
+    while first_day < len(days):
+        # Whole days, adding up to at least batch_size plays (or the last days)
+        last_day = first_day + max(1, int(np.searchsorted(np.cumsum(counts[first_day:]), batch_size)) + 1)
+        last_day = min(last_day, len(days))
+        batch_counts = counts[first_day:last_day]
+        n = int(batch_counts.sum())
+        day = np.repeat(np.arange(first_day, last_day), batch_counts)
+        first_day = last_day
+        if n == 0:
+            continue
+
+        hour = np.minimum(np.searchsorted(hour_cdf, rng.random(n)), 23)
+        seconds = day_starts[day] + hour * 3600 + rng.integers(0, 3600, n)
+        order = np.argsort(seconds, kind='stable')
+        seconds, day = seconds[order], day[order]
+
+        # Artist from the user's popularity that year, then one of their tracks (favourites played more)
+        artist = np.empty(n, dtype='int64')
+        year = day_years[day]
+        for y in np.unique(year):
+            rows = year == y
+            artist[rows] = np.searchsorted(cdfs[y], rng.random(rows.sum()))
+        artist = np.minimum(artist, len(catalogue.artists) - 1)
+        track = catalogue.track_start[artist] + (catalogue.track_count[artist] * rng.random(n) ** 3).astype('int64')
+
+        # Played to the end, skipped in the first 30 seconds or stopped part way through
+        duration = catalogue.track_duration_ms[track]
+        outcome = rng.random(n)
+        ms_played = np.where(outcome < 0.25, (rng.random(n) * 30_000).astype('int64'),
+                             np.where(outcome < 0.4, (duration * rng.random(n)).astype('int64'), duration))
+
+        # Plays without track metadata
+        missing = rng.random(n) < null_fraction
+        artist[missing] = -1
+        track[missing] = -1
+
+        yield {'ts': seconds.astype('datetime64[s]'),
+               'ms_played': ms_played.astype('int32'),
+               'artist': artist,
+               'track': track,
+               'platform': rng.integers(0, len(PLATFORMS), n),
+               'reason': rng.integers(0, len(REASONS_START), n),
+               'shuffle': rng.random(n) < 0.4,
+               'skipped': outcome < 0.25}
+
+# ------------------------------------
+# Writers
+
+def csv_field(value):
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='').writerow([value])
+    return buffer.getvalue()
+
+class CSVWriter:
+    # The CSV read by src/app.py
+    def __init__(self, path, catalogue):
+        # Each string in the catalogue is quoted once, rows are then just joined together
+        # (index -1, a play without metadata, is the empty string at the end)
+        self.tracks = [csv_field(name) for name in catalogue.track_names] + ['']
+        self.artists = [csv_field(name) for name in catalogue.artists] + ['']
+        self.uris = catalogue.track_uris + ['']
+        self.f = open(path, 'w')
+        self.f.write('date,ts,ms_played,master_metadata_track_name,master_metadata_album_artist_name,spotify_track_uri\n')
+
+    def write(self, batch, catalogue):
+        ts = np.datetime_as_string(batch['ts'], unit='s')
+        self.f.writelines(
+            f'{t[:10]},{t[:10]} {t[11:]}+00:00,{ms},{self.tracks[track]},{self.artists[artist]},{self.uris[track]}\n'
+            for t, ms, track, artist in zip(ts, batch['ms_played'].tolist(), batch['track'].tolist(), batch['artist'].tolist()))
+
+    def close(self):
+        self.f.close()
+
+class JSONWriter:
+    # Streaming_History_Audio_<first year>-<last year>_<n>.json files of records_per_file plays
+    def __init__(self, directory, catalogue, username, records_per_file):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.records_per_file = records_per_file
+        self.username = json.dumps(username)
+        self.tracks = [json.dumps(name) for name in catalogue.track_names] + ['null']
+        self.artists = [json.dumps(name) for name in catalogue.artists] + ['null']
+        self.albums = [json.dumps(name) for name in catalogue.track_albums] + ['null']
+        self.uris = [json.dumps(uri) for uri in catalogue.track_uris] + ['null']
+        self.f = None
+        self.files = 0
+
+    def open_file(self, first_ts):
+        self.tmp_path = os.path.join(self.directory, f'.Streaming_History_Audio_{self.files}.json.tmp')
+        self.f = open(self.tmp_path, 'w', encoding='utf-8')
+        self.f.write('[\n')
+        self.first_year = first_ts[:4]
+        self.records = 0
+
+    def close_file(self, last_ts):
+        self.f.write('\n]\n')
+        self.f.close()
+        self.f = None
+        os.replace(self.tmp_path, os.path.join(self.directory,
+                   f'Streaming_History_Audio_{self.first_year}-{last_ts[:4]}_{self.files}.json'))
+        self.files += 1
+
+    def write(self, batch, catalogue):
+        ts = np.datetime_as_string(batch['ts'], unit='s')
+        records = zip(ts, batch['ms_played'].tolist(), batch['track'].tolist(), batch['artist'].tolist(),
+                      batch['platform'].tolist(), batch['reason'].tolist(),
+                      batch['shuffle'].tolist(), batch['skipped'].tolist())
+        for t, ms, track, artist, platform, reason, shuffle, skipped in records:
+            if self.f is None:
+                self.open_file(t)
+            elif self.records:
+                self.f.write(',\n')
+            self.f.write(
+                f'{{"ts": "{t}Z", "username": {self.username}, "platform": "{PLATFORMS[platform]}", '
+                f'"ms_played": {ms}, "conn_country": "GB", '
+                f'"master_metadata_track_name": {self.tracks[track]}, '
+                f'"master_metadata_album_artist_name": {self.artists[artist]}, '
+                f'"master_metadata_album_album_name": {self.albums[track]}, '
+                f'"spotify_track_uri": {self.uris[track]}, '
+                f'"reason_start": "{REASONS_START[reason]}", '
+                f'"reason_end": "{REASONS_END[1] if skipped else REASONS_END[0]}", '
+                f'"shuffle": {"true" if shuffle else "false"}, "skipped": {"true" if skipped else "false"}, '
+                f'"offline": false, "incognito_mode": false}}')
+            self.records += 1
+            self.last_ts = t
+            if self.records == self.records_per_file:
+                self.close_file(t)
+
+    def close(self):
+        if self.f is not None:
+            self.close_file(self.last_ts)
+
+class StoreWriter:
+    # A columnar store (data_store.StoreWriter), the category codes are the artist and track numbers
+    def __init__(self, path, catalogue, rows):
+        self.writer = data_store.StoreWriter(path, rows, catalogue.categories())
+
+    def write(self, batch, catalogue):
+        self.writer.append({'ts': batch['ts'],
+                            'ms_played': batch['ms_played'],
+                            'master_metadata_track_name': batch['track'],
+                            'master_metadata_album_artist_name': batch['artist'],
+                            'spotify_track_uri': batch['track']})
+
+    def close(self):
+        self.writer.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate a synthetic Spotify streaming history.')
+    parser.add_argument('--rows', type=int, default=1_000_000, help='number of plays')
+    parser.add_argument('--json', help='directory to write Streaming_History_Audio_*.json files to')
+    parser.add_argument('--csv', help='CSV file to write (the format read by src/app.py)')
+    parser.add_argument('--store', help='columnar store directory to write (see src/data_store.py)')
+    parser.add_argument('--start-date', default='2020-09-01', help='first day of the history')
+    parser.add_argument('--end-date', default='2024-07-01', help='day after the end of the history')
+    parser.add_argument('--artists', type=int, default=5000, help='number of artists in the catalogue')
+    parser.add_argument('--tracks-per-artist', type=float, default=12, help='average number of tracks per artist')
+    parser.add_argument('--zipf', type=float, default=1.1, help='exponent of the Zipf distribution of artist popularity')
+    parser.add_argument('--drift', type=float, default=0.5, help='how much the favourite artists change each year')
+    parser.add_argument('--null-fraction', type=float, default=0.006, help='share of plays without track metadata')
+    parser.add_argument('--user', default='user', help='username, each user gets a different history')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--batch-size', type=int, default=1_000_000, help='number of plays generated at a time')
+    parser.add_argument('--records-per-file', type=int, default=20_000, help='plays per JSON file')
+    args = parser.parse_args(argv)
+
+    if not (args.json or args.csv or args.store):
+        parser.error('give at least one of --json, --csv or --store')
+
+    start = time.perf_counter()
+
+    # The catalogue only depends on the seed, the plays also depend on the user
+    catalogue = Catalogue(np.random.default_rng(args.seed), args.artists, args.tracks_per_artist)
+    rng = np.random.default_rng([args.seed, zlib.crc32(args.user.encode())])
+
+    writers = []
+    if args.json:
+        writers.append(JSONWriter(args.json, catalogue, args.user, args.records_per_file))
+    if args.csv:
+        writers.append(CSVWriter(args.csv, catalogue))
+    if args.store:
+        writers.append(StoreWriter(args.store, catalogue, args.rows))
+
+    rows = 0
+    for batch in generate_batches(catalogue, rng, args.rows, args.start_date, args.end_date, args.batch_size,
+                                  zipf=args.zipf, drift=args.drift, null_fraction=args.null_fraction):
+        for writer in writers:
+            writer.write(batch, catalogue)
+        rows += len(batch['ts'])
+        elapsed = time.perf_counter() - start
+        print(f"{rows}/{args.rows} plays ({rows / elapsed:,.0f} plays/s)", flush=True)
+
+    for writer in writers:
+        writer.close()
+
+    print(f"Generated {rows} plays of {len(catalogue.artists)} artists and {len(catalogue.track_names)} tracks "
+          f"in {time.perf_counter() - start:.2f}s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,331 @@
+# This script ingests Spotify "Extended streaming history" exports
+# (src/data/Streaming_History_Audio_*.json) into the CSV used by src/app.py.
+#
+# It is incremental:
+#  - the JSON files are streamed record by record in batches, so memory use
+#    doesn't grow with the size of the export
+#  - only plays that aren't already in the CSV are appended, plays are
+#    identified by (ts, spotify_track_uri). The plays already in the CSV (and
+#    the ones added since) are kept as one sorted array of exact keys: the
+#    timestamp and the index of the uri in a table of the distinct uris
+#    (12 bytes a play, plus one copy of each uri), read a chunk at a time, so
+#    memory doesn't grow much with the size of the history
+#  - a manifest of the files already ingested (with their size and mtime)
+#    is kept next to the CSV, so re-running with no new exports does nothing
+#
+# Each batch of records is parsed, filtered, projected, keyed and turned into
+# CSV lines in one go (prepare_batch), which leaves only looking up the keys
+# and writing the new lines. With --workers N the files are prepared by a pool
+# of N processes, at most 2 x N files ahead of the one being written so memory
+# stays bounded. The results are merged in file order, so the output is the
+# same row for row as the serial (default) path.
+#
+# Usage (from the root of the repo):
+#   python scripts/ingest.py
+#   python scripts/ingest.py --workers 4
+#   python scripts/ingest.py --input 'exports/Streaming_History_Audio_*.json' --output src/data/my_data.csv
+
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import glob
+import json
+import os
+import re
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import data_store
+
+# Columns we keep from the export
+# (this removes potentially personally sensitive data eg. IP address, type of browser etc.)
+RAW_COLUMNS = ['ts',
+               'ms_played',
+               'master_metadata_track_name',
+               'master_metadata_album_artist_name',
+               'spotify_track_uri']
+
+OUTPUT_COLUMNS = ['date'] + RAW_COLUMNS
+
+# Spotify use picked up from Sept 2020 (see scripts/explore_data.py)
+DEFAULT_START_DATE = '2020-09-01'
+DEFAULT_END_DATE = '2024-07-01'
+
+# Rows of the output CSV read at a time when collecting the plays already in it
+KEY_CHUNK_ROWS = 1_000_000
+
+# ------------------------------------
+# Streaming JSON reader
+
+# Whitespace and the commas between the records of the array
+SEPARATORS = re.compile(r'[\s,]*')
+
+def iter_json_records(path, read_size=1 << 20):
+    # Yield the records of a file containing one JSON array of objects,
+    # only holding about read_size characters of the file in memory at a time
+    decoder = json.JSONDecoder()
+
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer = f.read(read_size).lstrip()
+        if not buffer.startswith('['):
+            raise ValueError(f"{path} does not contain a JSON array")
+
+        position = 1
+        eof = False
+
+        while True:
+            position = SEPARATORS.match(buffer, position).end()
+            if position < len(buffer) and buffer[position] == ']':
+                return
+
+            try:
+                record, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # The next record is cut off by the end of the buffer, read some more
+                if eof:
+                    raise
+                chunk = f.read(read_size)
+                eof = not chunk
+                buffer = buffer[position:] + chunk
+                position = 0
+                continue
+
+            yield record
+
+def iter_batches(records, batch_size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+# ------------------------------------
+# Filtering and projecting a batch of records
+
+def timestamp_text(ts):
+    # The timestamps as pandas writes them to the CSV ('2021-10-24 19:29:09+00:00'), formatted once
+    # so the keys and the CSV share them (formatting them is the slowest part of writing the CSV)
+    if ts.dt.tz is None or str(ts.dt.tz) != 'UTC' or (ts.dt.nanosecond != 0).any() or (ts.dt.microsecond != 0).any():
+        return ts.astype(str)
+    seconds = np.datetime_as_string(ts.dt.tz_localize(None).to_numpy(), unit='s')
+    return pd.Series(np.char.add(np.char.replace(seconds, 'T', ' '), '+00:00'), index=ts.index, dtype=object)
+
+def records_to_frame(records, start_date, end_date):
+    frame = pd.DataFrame.from_records(records, columns=RAW_COLUMNS)
+
+    frame['ts'] = timestamp_text(pd.to_datetime(frame['ts']))
+    frame['date'] = frame['ts'].str[:10]
+
+    frame = frame.loc[(frame['date'] >= start_date.isoformat()) & (frame['date'] < end_date.isoformat())]
+
+    return frame[OUTPUT_COLUMNS]
+
+def play_keys(frame):
+    # (ts, spotify_track_uri) identifies a play. The timestamps are all written
+    # to the CSV in UTC, so two of them are the same text when they are the same instant
+    ts = pd.to_datetime(frame['ts'], utc=True)
+    return pd.DataFrame({'ts': ts.to_numpy(dtype='datetime64[ns]').view('int64'),
+                         'uri': frame['spotify_track_uri'].fillna('').to_numpy(dtype=object)})
+
+def csv_lines(frame):
+    # The CSV line of each row (without the header)
+    lines = frame.to_csv(header=False, index=False, lineterminator='\n').split('\n')[:-1]
+    if len(lines) != len(frame):
+        # A line break inside a (quoted) field
+        lines = [frame.iloc[[i]].to_csv(header=False, index=False, lineterminator='\n')[:-1] for i in range(len(frame))]
+    return np.array(lines, dtype=object)
+
+def prepare_batch(records, start_date, end_date):
+    # The keys and CSV lines of the plays of a batch of records in the date window
+    frame = records_to_frame(records, start_date, end_date)
+    return play_keys(frame), csv_lines(frame)
+
+# A play's key: its timestamp (ns since 1970) and the index of its uri in SeenPlays.uri_codes.
+# numpy sorts and compares these field by field, so they can be kept in a sorted array
+KEY_DTYPE = np.dtype([('ts', 'int64'), ('uri', 'int32')])
+
+class SeenPlays:
+    # The keys of the plays already in the output and of the ones added by this run (one sorted array)
+    def __init__(self):
+        self.uri_codes = {}
+        self.keys = np.zeros(0, dtype=KEY_DTYPE)
+
+    @classmethod
+    def from_output(cls, output_path):
+        seen = cls()
+        if os.path.exists(output_path):
+            chunks = pd.read_csv(output_path, usecols=['ts', 'spotify_track_uri'], dtype=str, chunksize=KEY_CHUNK_ROWS)
+            seen.keys = np.unique(np.concatenate([seen.keys] + [seen.encode(play_keys(chunk)) for chunk in chunks]))
+        return seen
+
+    def encode(self, keys):
+        # play_keys -> array of KEY_DTYPE (only the distinct uris of the batch are looked up)
+        codes, uris = pd.factorize(keys['uri'])
+        uri_codes = np.array([self.uri_codes.setdefault(uri, len(self.uri_codes)) for uri in uris], dtype='int32')
+        encoded = np.empty(len(keys), dtype=KEY_DTYPE)
+        encoded['ts'] = keys['ts'].to_numpy()
+        encoded['uri'] = uri_codes[codes]
+        return encoded
+
+    def new(self, keys):
+        # Which of the keys are new plays (remembering them, so a play is only added once)
+        keys = self.encode(keys)
+        if len(self.keys):
+            found = self.keys[np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)]
+            candidates = np.flatnonzero(found != keys)
+        else:
+            candidates = np.arange(len(keys))
+
+        # Only the first of the plays repeated within the batch
+        added, first = np.unique(keys[candidates], return_index=True)
+        new = np.zeros(len(keys), dtype=bool)
+        new[candidates[first]] = True
+
+        self.keys = np.insert(self.keys, np.searchsorted(self.keys, added), added)
+        return new
+
+
+# ------------------------------------
+# Manifest of the files already ingested
+
+def manifest_path_for(output_path):
+    return os.path.splitext(output_path)[0] + '.manifest.json'
+
+def read_manifest(output_path):
+    path = manifest_path_for(output_path)
+    if not os.path.exists(path):
+        return {'files': {}}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def write_manifest(output_path, manifest):
+    path = manifest_path_for(output_path)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+def file_signature(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+def pending_files(paths, manifest):
+    pending = []
+    for path in paths:
+        entry = manifest['files'].get(path)
+        signature = file_signature(path)
+        if entry is None or entry['size'] != signature['size'] or entry['mtime'] != signature['mtime']:
+            pending.append(path)
+    return pending
+
+# ------------------------------------
+# Ingest
+
+def append_new_lines(keys, lines, output_path, seen_keys):
+    # Append the lines of the plays that aren't already in the output (or earlier in this run)
+    lines = lines[seen_keys.new(keys)]
+    if len(lines):
+        write_header = not os.path.exists(output_path)
+        with open(output_path, 'a', encoding='utf-8', newline='') as f:
+            if write_header:
+                f.write(','.join(OUTPUT_COLUMNS) + '\n')
+            f.write('\n'.join(lines) + '\n')
+    return len(lines)
+
+def ingest_file(path, output_path, seen_keys, start_date, end_date, batch_size):
+    rows_added = 0
+    for batch in iter_batches(iter_json_records(path), batch_size):
+        rows_added += append_new_lines(*prepare_batch(batch, start_date, end_date), output_path, seen_keys)
+    return rows_added
+
+def parse_shard(path, start_date, end_date, batch_size):
+    # Run in the worker processes: the keys and CSV lines of the plays of a whole file
+    batches = [prepare_batch(batch, start_date, end_date)
+               for batch in iter_batches(iter_json_records(path), batch_size)]
+    return (pd.concat([play_keys(pd.DataFrame(columns=OUTPUT_COLUMNS))] + [keys for keys, _ in batches], ignore_index=True),
+            np.concatenate([np.zeros(0, dtype=object)] + [lines for _, lines in batches]))
+
+def iter_parsed_shards(paths, start_date, end_date, batch_size, workers):
+    # Yield (path, keys, lines) in the same order as paths, whatever order the workers finish in.
+    # Only 2 x workers files are submitted ahead of the one being written, so parsed files
+    # don't pile up in memory when writing them is slower than parsing them
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = deque()
+        for path in paths:
+            in_flight.append((path, pool.submit(parse_shard, path, start_date, end_date, batch_size)))
+            if len(in_flight) >= 2 * workers:
+                path, future = in_flight.popleft()
+                yield (path, *future.result())
+        while in_flight:
+            path, future = in_flight.popleft()
+            yield (path, *future.result())
+
+def refresh_data_store(output_path):
+    # Keep the columnar store (if one has been built) in step with the CSV
+    store_path = data_store.store_path_for(output_path)
+    if os.path.exists(store_path):
+        data_store.write_store(data_store.read_csv(output_path), store_path)
+        print(f"Rebuilt {store_path}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Incrementally ingest Spotify streaming history exports.')
+    parser.add_argument('--input', default='src/data/Streaming_History_Audio_*.json',
+                        help='glob of the exported JSON files')
+    parser.add_argument('--output', default='src/data/extended_streaming_Sept2020-Jun2024.csv',
+                        help='CSV to append new plays to')
+    parser.add_argument('--start-date', default=DEFAULT_START_DATE,
+                        help='keep plays on or after this date')
+    parser.add_argument('--end-date', default=DEFAULT_END_DATE,
+                        help='keep plays before this date')
+    parser.add_argument('--batch-size', type=int, default=50_000,
+                        help='number of JSON records processed at a time')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of processes used to parse the files (1 = no process pool)')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+
+    manifest = read_manifest(args.output)
+    paths = sorted(glob.glob(args.input))
+    pending = pending_files(paths, manifest)
+
+    if not pending:
+        print(f"Nothing to ingest ({len(paths)} files unchanged)")
+        return
+
+    start_date = pd.to_datetime(args.start_date).date()
+    end_date = pd.to_datetime(args.end_date).date()
+
+    seen_keys = SeenPlays.from_output(args.output)
+    total_added = 0
+
+    if args.workers > 1:
+        results = ((path, append_new_lines(keys, lines, args.output, seen_keys))
+                   for path, keys, lines in iter_parsed_shards(pending, start_date, end_date, args.batch_size, args.workers))
+    else:
+        results = ((path, ingest_file(path, args.output, seen_keys, start_date, end_date, args.batch_size))
+                   for path in pending)
+
+    for path, rows_added in results:
+        total_added += rows_added
+
+        # Record each file as soon as it is done so an interrupted run can carry on
+        manifest['files'][path] = dict(file_signature(path), rows_added=rows_added)
+        write_manifest(args.output, manifest)
+
+        print(f"{path}: {rows_added} new plays")
+
+    if total_added:
+        refresh_data_store(args.output)
+
+    print(f"Added {total_added} plays from {len(pending)} files to {args.output} in {time.perf_counter() - start:.2f}s")
+
+if __name__ == '__main__':
+    main()
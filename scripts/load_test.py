@@ -0,0 +1,214 @@
+# Load test of the date slider callback in src/app.py
+#
+# Starts gunicorn on a local port (or uses a server that is already running,
+# with --url), waits for /ready and then drives the Dash _dash-update-component
+# endpoint with a number of concurrent simulated users. Each user moves the
+# slider to a random range, waits for the plots and does it again.
+#
+# Reports the p50/p95/p99 latency, throughput, response size and the memory
+# (total PSS of gunicorn and its workers, Linux only) of the server.
+#
+# Usage (from the root of the repo):
+#   python scripts/load_test.py [--data src/data/extended_streaming_Sept2020-Jun2024.csv] [--users 8] [--requests 50]
+#   python scripts/load_test.py --url http://127.0.0.1:8050
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import numpy as np
+
+# The outputs and inputs of the update_plots callback
+OUTPUTS = [{'id': 'fig_histogram', 'property': 'figure'},
+           {'id': 'fig_top_artists', 'property': 'figure'},
+           {'id': 'dateRangeText', 'property': 'children'},
+           {'id': 'histogram-title', 'property': 'children'}]
+
+def update_component_body(start, end, dataset_name, resolution='auto'):
+    # What the browser sends when the slider is moved to [start, end]
+    return {'output': '..fig_histogram.figure...fig_top_artists.figure...dateRangeText.children...histogram-title.children..',
+            'outputs': OUTPUTS,
+            'inputs': [{'id': 'date-slider', 'property': 'value', 'value': [start, end]},
+                       {'id': 'histogram-resolution', 'property': 'value', 'value': resolution}],
+            'changedPropIds': ['date-slider.value'],
+            'state': [{'id': 'dataset-name', 'property': 'data', 'value': dataset_name}]}
+
+def render_page_body(search):
+    # What the browser sends to get the page for a URL (eg. ?dataset=alice)
+    return {'output': 'page.children',
+            'outputs': {'id': 'page', 'property': 'children'},
+            'inputs': [{'id': 'url', 'property': 'search', 'value': search}],
+            'changedPropIds': ['url.search'],
+            'state': []}
+
+def post_json(url, body, timeout=120):
+    request = urllib.request.Request(url, data=json.dumps(body).encode(), headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return response.read()
+
+def percentiles(values):
+    if not len(values):
+        return {'p50': None, 'p95': None, 'p99': None}
+    return {f'p{q}': float(np.percentile(values, q)) for q in (50, 95, 99)}
+
+# ------------------------------------
+# Local server (these helpers are also used by scripts/benchmark_workers.py)
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def start_server(data_path, port, workers=1, threads=1, env=None):
+    return subprocess.Popen(
+        ['gunicorn', '--chdir', 'src', '--workers', str(workers), '--threads', str(threads),
+         '--timeout', '600', '--bind', f'127.0.0.1:{port}', 'app:server'],
+        env=dict(os.environ, DATA_PATH=os.path.abspath(data_path), **(env or {})),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+
+def stop_server(process):
+    os.killpg(process.pid, signal.SIGTERM)
+    process.wait()
+
+def wait_until_ready(url, timeout, process=None):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError('gunicorn exited')
+        try:
+            urllib.request.urlopen(url + '/ready', timeout=5).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError(f'{url} did not become ready')
+
+def process_tree(pid):
+    pids = [pid]
+    for child in open(f'/proc/{pid}/task/{pid}/children').read().split():
+        pids.extend(process_tree(int(child)))
+    return pids
+
+def pss_bytes(pid):
+    for line in open(f'/proc/{pid}/smaps_rollup'):
+        if line.startswith('Pss:'):
+            return int(line.split()[1]) * 1024
+    return 0
+
+def server_memory_mb(process):
+    if process is None or not os.path.exists('/proc/self/smaps_rollup'):
+        return None
+    return sum(pss_bytes(pid) for pid in process_tree(process.pid)) / 1e6
+
+# ------------------------------------
+# Simulated users
+
+def find_prop(component, component_id, prop):
+    # A property of a component in a layout
+    if isinstance(component, dict):
+        if component.get('props', {}).get('id') == component_id:
+            return component['props'][prop]
+        children = [find_prop(value, component_id, prop) for value in component.values()]
+    elif isinstance(component, list):
+        children = [find_prop(value, component_id, prop) for value in component]
+    else:
+        return None
+    return next((value for value in children if value is not None), None)
+
+def dataset_page(url, dataset=None, timeout=600):
+    # The number of months on the slider and the name of the dataset, from the page
+    # (asked for again until the dataset has loaded)
+    search = '?' + urllib.parse.urlencode({'dataset': dataset}) if dataset else ''
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        page = json.loads(post_json(url + '/_dash-update-component', render_page_body(search)))
+        n_months = find_prop(page, 'date-slider', 'max')
+        if n_months is not None:
+            return n_months, find_prop(page, 'dataset-name', 'data')
+        if find_prop(page, 'loading-interval', 'id') is None:
+            raise ValueError(f'there is no dataset called {dataset}')
+        time.sleep(0.5)
+    raise TimeoutError(f'{dataset or "the default dataset"} did not load')
+
+def simulate_user(url, n_requests, n_months, dataset_name, seed):
+    rng = random.Random(seed)
+    latencies, sizes, errors = [], [], 0
+    for _ in range(n_requests):
+        start, end = sorted(rng.sample(range(1, n_months + 1), 2)) if n_months > 1 else (1, 1)
+        request_start = time.perf_counter()
+        try:
+            body = post_json(url + '/_dash-update-component', update_component_body(start, end, dataset_name))
+        except (urllib.error.URLError, OSError):
+            errors += 1
+            continue
+        latencies.append((time.perf_counter() - request_start) * 1000)
+        sizes.append(len(body))
+    return latencies, sizes, errors
+
+def run_load_test(url, users, requests_per_user, seed=0, dataset=None):
+    n_months, dataset_name = dataset_page(url, dataset)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        results = list(pool.map(simulate_user, [url] * users, [requests_per_user] * users,
+                                [n_months] * users, [dataset_name] * users, [seed + user for user in range(users)]))
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency for user_latencies, _, _ in results for latency in user_latencies]
+    sizes = [size for _, user_sizes, _ in results for size in user_sizes]
+
+    return dict({f'latency_{name}_ms': value for name, value in percentiles(latencies).items()},
+                requests=len(latencies),
+                errors=sum(errors for _, _, errors in results),
+                requests_per_second=len(latencies) / elapsed,
+                response_bytes_mean=float(np.mean(sizes)) if sizes else None)
+
+def load_test(data_path, users, requests_per_user, workers=1, threads=1, env=None, timeout=600, seed=0):
+    # Start gunicorn on data_path, run the load test against it and stop it again
+    port = free_port()
+    url = f'http://127.0.0.1:{port}'
+    process = start_server(data_path, port, workers=workers, threads=threads, env=env)
+    try:
+        start = time.perf_counter()
+        wait_until_ready(url, timeout, process)
+        ready_seconds = time.perf_counter() - start
+        results = run_load_test(url, users, requests_per_user, seed=seed)
+        return dict(results, ready_seconds=ready_seconds, server_memory_mb=server_memory_mb(process))
+    finally:
+        stop_server(process)
+
+def print_results(results):
+    for name, value in results.items():
+        print(f"{name:<22} {value if not isinstance(value, float) else round(value, 2):>12}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test of the date slider callback.')
+    parser.add_argument('--data', default='src/data/extended_streaming_Sept2020-Jun2024.csv',
+                        help='data file for the local server')
+    parser.add_argument('--url', help='test a server that is already running instead of starting one')
+    parser.add_argument('--dataset', help='name of the dataset to test with --url (the default one if not given)')
+    parser.add_argument('--users', type=int, default=8, help='number of concurrent simulated users')
+    parser.add_argument('--requests', type=int, default=50, help='number of slider moves per user')
+    parser.add_argument('--workers', type=int, default=1, help='gunicorn workers of the local server')
+    parser.add_argument('--threads', type=int, default=1, help='gunicorn threads per worker of the local server')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='turn the plot cache and the precomputed plot data off (FIGURE_CACHE_SIZE=0, WARM_PLOT_DATA=false)')
+    parser.add_argument('--timeout', type=float, default=600, help='seconds to wait for the server to be ready')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.url:
+        wait_until_ready(args.url, args.timeout)
+        print_results(run_load_test(args.url, args.users, args.requests, seed=args.seed, dataset=args.dataset))
+    else:
+        env = {'FIGURE_CACHE_SIZE': '0', 'WARM_PLOT_DATA': 'false'} if args.no_cache else {}
+        print_results(load_test(args.data, args.users, args.requests, workers=args.workers, threads=args.threads,
+                                env=env, timeout=args.timeout, seed=args.seed))
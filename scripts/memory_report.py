@@ -0,0 +1,48 @@
+# Memory used by the plays data frame in src/app.py, before and after the compact representation:
+#  - before: the CSV as read by pandas, with object (Python string / date) columns
+#    for the track, artist, uri, 'date' and 'year-month'
+#  - after:  data_store.load_plays (categoricals, int16 month index, int32 ms_played),
+#    which is all app.py keeps (the slider and the aggregates work with the month index)
+#
+# Usage (from the root of the repo):
+#   python scripts/memory_report.py [csv files...]
+# By default the bundled src/data/extended_streaming_*.csv files are used.
+
+import glob
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import data_store
+
+csv_paths = sys.argv[1:] or sorted(glob.glob('src/data/extended_streaming_*.csv'))
+
+def object_representation(csv_path):
+    data = pd.read_csv(csv_path)
+    data['ts'] = pd.to_datetime(data['ts'])
+    data['date'] = data['ts'].dt.date
+    data['year-month'] = data['ts'].dt.strftime('%Y-%m')
+    return data
+
+def compact_representation(csv_path):
+    return data_store.load_plays(csv_path)
+
+def bytes_per_row(data):
+    return data.memory_usage(index=True, deep=True).sum() / len(data)
+
+print(f"{'file':<45} {'rows':>9} {'before (B/row)':>15} {'after (B/row)':>14} {'ratio':>7}")
+
+for csv_path in csv_paths:
+    before = object_representation(csv_path)
+    after = compact_representation(csv_path)
+
+    before_bytes = bytes_per_row(before)
+    after_bytes = bytes_per_row(after)
+
+    print(f"{os.path.basename(csv_path):<45} {len(before):>9} {before_bytes:>15.1f} {after_bytes:>14.1f} {before_bytes / after_bytes:>6.1f}x")
+
+    for column in after.columns:
+        print(f"    {column:<41} {str(after[column].dtype):>25} {after[column].memory_usage(index=False, deep=True) / len(after):>8.1f} B/row")
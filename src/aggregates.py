@@ -0,0 +1,162 @@
+# Pre-computed aggregates used by the plots in app.py
+#
+# The play-level data is only scanned once, at startup, to build a
+# (month x artist) "cube" of play counts and ms_played sums, which is turned
+# into prefix sums over the months (PrefixSumIndex). The callbacks then work
+# out the totals of the selected months from those, so their cost scales with
+# months x artists and not with the number of plays.
+
+import numpy as np
+import pandas as pd
+
+import data_store
+
+ARTIST_COLUMN = 'master_metadata_album_artist_name'
+
+# Plays bucketed at a time when building the cube
+CUBE_CHUNK_ROWS = 10_000_000
+
+# ------------------------------------
+# Build the cube
+
+def build_month_artist_cube(data):
+    # Plays are bucketed by (month index, artist code) with np.bincount rather
+    # than a groupby: each (month, artist) pair is one integer key, and the
+    # cube is the non-zero keys. Plays without an artist (eg. podcasts) get a
+    # key of their own so the monthly counts still match the raw data.
+    months = data['month'].to_numpy()
+    artists = data[ARTIST_COLUMN].cat
+    if len(months) == 0:
+        return pd.DataFrame({'month': np.array([], dtype='int64'),
+                             ARTIST_COLUMN: pd.Categorical.from_codes([], categories=artists.categories),
+                             'count': np.array([], dtype='int64'),
+                             'ms_played': np.array([], dtype='int64')})
+
+    first_month = int(months.min())
+    n_months = int(months.max()) - first_month + 1
+    # Missing artists (code -1) go last
+    n_codes = len(artists.categories) + 1
+    artist_codes = artists.codes.to_numpy()
+    ms = data['ms_played'].to_numpy()
+
+    # In chunks, so the keys of (memory-mapped) datasets much bigger than memory don't all have to fit
+    counts = np.zeros(n_months * n_codes, dtype='int64')
+    ms_played = np.zeros(n_months * n_codes, dtype='float64')
+    for start in range(0, len(months), CUBE_CHUNK_ROWS):
+        chunk = slice(start, start + CUBE_CHUNK_ROWS)
+        codes = artist_codes[chunk].astype('int64')
+        codes[codes < 0] = n_codes - 1
+        keys = (months[chunk].astype('int64') - first_month) * n_codes + codes
+        counts += np.bincount(keys, minlength=n_months * n_codes)
+        # bincount sums weights as float64, which is exact for totals up to 2**53 ms (285,000 years)
+        ms_played += np.bincount(keys, weights=ms[chunk], minlength=n_months * n_codes)
+
+    cells = np.flatnonzero(counts)
+    cell_artists = cells % n_codes
+    cell_artists[cell_artists == n_codes - 1] = -1
+
+    # The cube is small, so int64 sums (so long ranges can't overflow) are fine here
+    return pd.DataFrame({'month': cells // n_codes + first_month,
+                         ARTIST_COLUMN: pd.Categorical.from_codes(cell_artists, categories=artists.categories),
+                         'count': counts[cells].astype('int64'),
+                         'ms_played': ms_played[cells].astype('int64')})
+
+# ------------------------------------
+# Prefix sums over the month axis
+#
+# Cumulative sums of the cube over months: a 1-D array of play counts and a
+# (months x artists) matrix of ms_played, with a row for every month from the
+# first to the last so a month index is also a row number. The totals for any
+# contiguous range of months are then one subtraction of two rows, and the top
+# artists come from an argpartition instead of a groupby + sort.
+
+class PrefixSumIndex:
+    def __init__(self, cube):
+        month_index = cube['month'].to_numpy().astype('int64')
+        self.first_month = int(month_index.min()) if len(month_index) else 0
+        n_months = int(month_index.max()) - self.first_month + 1 if len(month_index) else 0
+        self.months = np.arange(self.first_month, self.first_month + n_months)
+        month_codes = month_index - self.first_month
+
+        # The artists listened to, sorted by name (the order the ties in top_artists are broken in)
+        artists = pd.Categorical(cube[ARTIST_COLUMN])
+        has_artist = artists.codes >= 0
+        observed = np.unique(artists.codes[has_artist])
+        names = artists.categories.to_numpy(dtype=object)[observed]
+        order = np.argsort(names, kind='stable')
+        self.artists = names[order]
+        column_of_code = np.zeros(len(artists.categories), dtype='int64')
+        column_of_code[observed[order]] = np.arange(len(order))
+        artist_codes = column_of_code[artists.codes[has_artist]]
+
+        monthly_counts = np.bincount(month_codes, weights=cube['count'].to_numpy(),
+                                     minlength=n_months).astype('int64')
+
+        # Plays without an artist count towards the histogram but not the top artists
+        # (float64 weights are exact for the ms_played totals, see build_month_artist_cube)
+        cells = month_codes[has_artist] * len(self.artists) + artist_codes
+        monthly_ms = np.bincount(cells, weights=cube['ms_played'].to_numpy()[has_artist],
+                                 minlength=n_months * len(self.artists)).astype('int64')
+        monthly_ms = monthly_ms.reshape(n_months, len(self.artists))
+
+        # Leading row of zeros so the total of months [i, j) is prefix[j] - prefix[i]
+        self.count_prefix = np.concatenate([[0], np.cumsum(monthly_counts)])
+        self.ms_prefix = np.vstack([np.zeros((1, len(self.artists)), dtype='int64'),
+                                    np.cumsum(monthly_ms, axis=0)])
+
+    def month_range(self, start_month, end_month):
+        # Rows of the months [start_month, end_month] (month indices)
+        start = min(max(start_month - self.first_month, 0), len(self.months))
+        end = min(max(end_month - self.first_month + 1, 0), len(self.months))
+        return start, max(start, end)
+
+    def monthly_counts(self, start_month, end_month):
+        start, end = self.month_range(start_month, end_month)
+        counts = np.diff(self.count_prefix[start:end + 1])
+        # Only the months with plays, like a groupby of the plays would give
+        listened = np.flatnonzero(counts)
+        return pd.DataFrame({'month': self.months[start:end][listened], 'count': counts[listened]})
+
+    def top_artists(self, start_month, end_month, n=20):
+        start, end = self.month_range(start_month, end_month)
+        totals = self.ms_prefix[end] - self.ms_prefix[start]
+
+        # Only artists listened to in the range
+        candidates = np.flatnonzero(totals)
+        if len(candidates) > n:
+            candidates = candidates[np.argpartition(-totals[candidates], n - 1)[:n]]
+        # The top n sorted by total (ascending, ties broken by artist name)
+        candidates = candidates[np.lexsort((-candidates, totals[candidates]))]
+
+        return pd.DataFrame({ARTIST_COLUMN: self.artists[candidates], 'total': totals[candidates]})
+
+# ------------------------------------
+# Compact aggregates for the browser
+#
+# Used by the clientside callback (assets/clientside.js): the play count of
+# each month plus a sparse (months x artists) ms_played matrix, stored as the
+# non-zero artist indices and ms_played values of each month.
+
+def client_aggregates(prefix_sums):
+    monthly_counts = np.diff(prefix_sums.count_prefix)
+    monthly_ms = np.diff(prefix_sums.ms_prefix, axis=0)
+
+    # Only the months with plays, like the server side histogram
+    listened = np.flatnonzero(monthly_counts)
+
+    month_artists = []
+    month_ms = []
+    for row in monthly_ms[listened]:
+        nonzero = np.flatnonzero(row)
+        month_artists.append(nonzero.tolist())
+        month_ms.append(row[nonzero].tolist())
+
+    months = prefix_sums.months[listened].tolist()
+    return {
+        'months': months,
+        'month_labels': [data_store.month_label(month) for month in months],
+        'counts': monthly_counts[listened].tolist(),
+        'artists': prefix_sums.artists.tolist(),
+        'month_artists': month_artists,
+        'month_ms': month_ms,
+    }
@@ -1,330 +1,469 @@
-from dash import Dash, html, dcc, Input, Output
+import time
+
+# Used to report how long importing this module takes (see /ready)
+import_start = time.perf_counter()
+
+from dash import Dash, html, dcc, Input, Output, State, ClientsideFunction, no_update
+from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
-import plotly.express as px
-import plotly.io as plt_io
-import pandas as pd
 from dotenv import load_dotenv
+from flask import g, jsonify, request, Response
+import logging
 import os
+from urllib.parse import parse_qs, urlencode
 
-app = Dash(__name__, external_stylesheets=[dbc.themes.LUMEN],
-            meta_tags=[{'name': 'viewport',
-                        'content': 'width=device-width, initial-scale=1.0'}])
-
-app.title = 'Spotify Analysis'
-app._favicon = ('images/favicon.ico')
-server = app.server
+import dataset_registry
+import http_responses
+import time_pyramid
+import timing
 
 # ------------------------------------
-# Load environment variables from .env
-load_dotenv()
-
-# Get the CSV file path from environment variable
-data_path = os.environ.get('DATA_PATH')
-
-# Load in data
-data = pd.read_csv(data_path)
-
-# Convert date time column into two separate columns "date" and "time"
-data['ts'] = pd.to_datetime(data['ts'])
-
-# Create separate 'date' and 'time' columns
-data['date'] = data['ts'].dt.date
-
-# Get a numeric value for the slider
-# Get the min and max dates
-min_date = data['date'].min()
-max_date = data['date'].max()
-
-date_range_df = pd.DataFrame({
-    'date': pd.date_range(start=min_date, end=max_date, freq='ME'),
-    'index': range(1, len(pd.date_range(start=min_date, end=max_date, freq='ME')) + 1)
-})
-
-date_range_df['month-year'] = date_range_df['date'].dt.strftime('%b %Y')
-
-date_range_dictionary = dict(zip(date_range_df['index'], date_range_df['month-year']))
-
-date_range_dictionary_slider = {}
+# Logging (gunicorn doesn't configure logging for the app)
+logger = logging.getLogger('spotify_dashboard')
 
-# Iterate through the items of the existing dictionary
-keys = list(date_range_dictionary.keys())
-values = list(date_range_dictionary.values())
+if not logger.handlers:
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter('[%(asctime)s] [%(process)d] [%(levelname)s] %(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
 
-for i, key in enumerate(keys):
-    if i == 0 or i == len(keys) - 1 or (i + 1) % 3 == 0:  # First, last, and every 3rd value
-        date_range_dictionary_slider[key] = values[i]
-    else:
-        date_range_dictionary_slider[key] = ''
+def environment_flag(name, default=''):
+    return os.environ.get(name, default).lower() in ('1', 'true', 'yes')
 
-# Use "date_range_dictionary_slider" in the  dcc.RangeSlider
+# ------------------------------------
+# APP FACTORY
+# ------------------------------------
+# Creating the app is quick: the data is loaded and the plots are built by a
+# DatasetLoader (see dataset.py), in a background thread by default. Until the
+# data is ready the page shows a loading message and /ready returns 503.
+#
+# Several datasets can be served, picked with ?dataset=<name> in the URL or the
+# dropdown on the page. They are loaded when first asked for and dropped again
+# under a memory budget (see dataset_registry.py).
+#
+# When the file of a loaded dataset changes (eg. a new export), it is reloaded
+# in the background and swapped in without a restart (DATA_RELOAD_SECONDS).
+
+def create_app(data_path=None, load_in_background=None):
+    # Load environment variables from .env
+    load_dotenv()
+
+    # Load the data in a background thread so importing the app (and /healthz) doesn't wait for it.
+    # Turn off with LOAD_DATA_IN_BACKGROUND=false
+    if load_in_background is None:
+        load_in_background = environment_flag('LOAD_DATA_IN_BACKGROUND', 'true')
+
+    # Memory-map the plays (from the columnar store, built if need be) instead of reading them into
+    # memory. Only the raw columns are shared between workers this way, use gunicorn --preload
+    # to share all of the data (see the README)
+    data_mmap = environment_flag('DATA_MMAP')
+
+    # Keep the plays in memory (pandas, the default) or in a SQLite database file that the
+    # plot queries run against, for data that doesn't fit in memory (see plays_database.py)
+    data_backend = os.environ.get('DATA_BACKEND', 'pandas').lower()
+
+    # Work out the top artists exactly, or approximately in memory that doesn't grow with the
+    # number of artists, for datasets with millions of them (see heavy_hitters.py)
+    top_k_engine = os.environ.get('TOP_K_ENGINE', 'exact').lower()
+
+    # Rebuild the plots in the browser instead of on the server when the slider moves
+    # (see assets/clientside.js)
+    clientside_callbacks = environment_flag('CLIENTSIDE_CALLBACKS')
+
+    # Precompute the plot data of every slider range in the background once the data is loaded,
+    # and save it (to PLOT_ARTIFACT_PATH, next to the data by default) for the next start (see warmer.py).
+    # Not needed when the plots are built in the browser. Turn off with WARM_PLOT_DATA=false
+    warm_plot_data = environment_flag('WARM_PLOT_DATA', 'true') and not clientside_callbacks
+
+    app = Dash(__name__, external_stylesheets=[dbc.themes.LUMEN],
+                meta_tags=[{'name': 'viewport',
+                            'content': 'width=device-width, initial-scale=1.0'}],
+                # The layout depends on whether the data is ready yet
+                suppress_callback_exceptions=True)
+
+    app.title = 'Spotify Analysis'
+    app._favicon = ('images/favicon.ico')
+
+    # The datasets: DATA_PATH and/or the ones in DATASETS_DIR
+    registry = dataset_registry.DatasetRegistry.from_environment(
+        data_path, artifact_path = os.environ.get('PLOT_ARTIFACT_PATH'),
+        mmap = data_mmap, clientside = clientside_callbacks, backend = data_backend, top_k = top_k_engine,
+        warm = warm_plot_data)
+    app.dataset_registry = registry
+
+    # Opt-in: keep cProfile profiles of the slowest callbacks (see timing.py)
+    profiler = timing.SlowestProfiles.from_environment()
+
+    # The page for the dataset in the URL is filled in by the render_page callback
+    app.layout = html.Div([
+        dcc.Location(id = 'url', refresh = False),
+        html.Div(id = 'page')
+    ])
+    register_callbacks(app, registry, clientside_callbacks, profiler)
+
+    # The default dataset is loaded straight away, the others when they are first asked for
+    loader = registry.get(background = load_in_background)
+    if loader is None:
+        raise ValueError('No data to show: set DATA_PATH and/or DATASETS_DIR')
+    app.dataset_loader = loader
+
+    # Reload the datasets whose files change, checking every DATA_RELOAD_SECONDS (see dataset_registry.py)
+    registry.start_watching()
+
+    # gzip/brotli compression of the responses (see http_responses.py)
+    compressor = http_responses.ResponseCompressor.from_environment()
+
+    register_health_endpoints(app, registry, loader)
+    register_timing(app, registry, loader, compressor)
+    register_http_caching(app, compressor)
+
+    return app
 
-# add a column to our data frame called month_year
-data['year-month'] = data['ts'].dt.strftime('%Y-%m')
+# ------------------------------------
+# CALLBACKS
+# ------------------------------------
 
-# find a way to get our date value:
-# from a number that is the key in the dictionary
-# extract the year-month assigned to that key in the dictionary
-# turn that into a date (last day of that year-month)
-# and that date should be in the format of eg. pd.to_datetime('2022-06-01').date()
+def register_callbacks(app, registry, clientside_callbacks, profiler):
 
-def get_date_from_slider_value_start(slider_value):
-    year_month = date_range_dictionary.get(slider_value)
-    if year_month:
-        # Get the last day of the month
-        end_of_month = pd.to_datetime(year_month) + pd.offsets.MonthBegin(0)
-        return end_of_month.date()  # Return date object
-    else:
-        return None  # Handle case where slider_value doesn't exist in dictionary
-
-def get_date_from_slider_value_end(slider_value):
-    year_month = date_range_dictionary.get(slider_value)
-    if year_month:
-        # Get the last day of the month
-        end_of_month = pd.to_datetime(year_month) + pd.offsets.MonthEnd(0)
-        return end_of_month.date()  # Return date object
+    # Show the dataset named in the URL (?dataset=<name>), or the default one
+    @app.callback(
+        Output('page', 'children'),
+        Input('url', 'search')
+    )
+    def render_page(search):
+        name = parse_qs((search or '').lstrip('?')).get('dataset', [None])[0]
+        loader = registry.get(name)
+        if loader is None:
+            return message_layout(f"Sorry, there is no data called {name}.")
+        # (taken once, as a reload can swap in a new Dataset at any time)
+        dataset = loader.dataset
+        if dataset is None:
+            return loading_layout(loader)
+        return main_layout(dataset, loader.name, registry.names())
+
+    # Switch dataset from the dropdown
+    @app.callback(
+        Output('url', 'search'),
+        Input('dataset-dropdown', 'value'),
+        prevent_initial_call=True
+    )
+    def select_dataset(name):
+        return '?' + urlencode({'dataset': name})
+
+    # Callback to update plots based on date range slider and the resolution of the histogram
+    def update_plots(selected_dates, resolution, dataset_name):
+        loader = registry.get(dataset_name)
+        # Never wait for the data here, that would hold up a (sync) gunicorn worker for as long as
+        # loading takes. The page only shows the plots once the data is loaded (see render_page),
+        # and until then check_data_ready reloads it when it is
+        dataset = loader.dataset if loader is not None else None
+        if dataset is None:
+            raise PreventUpdate
+        with timing.span('update_plots'):
+            return profiler.run(f'{selected_dates[0]}-{selected_dates[1]}', dataset.update_plots_patch, selected_dates,
+                                resolution)
+
+    # Register the callback, either in the browser or on the server
+    if clientside_callbacks:
+        app.clientside_callback(
+            ClientsideFunction(namespace='spotify', function_name='update_plots'),
+            Output('fig_histogram', 'figure'),
+            Output('fig_top_artists', 'figure'),
+            Output('dateRangeText', 'children'),
+            Input('date-slider', 'value'),
+            State('plot-aggregates', 'data')
+        )
     else:
-        return None  # Handle case where slider_value doesn't exist in dictionary
+        app.callback(
+            Output('fig_histogram', 'figure'),
+            Output('fig_top_artists', 'figure'),
+            Output('dateRangeText', 'children'),
+            Output('histogram-title', 'children'),
+            Input('date-slider', 'value'),
+            Input('histogram-resolution', 'value'),
+            State('dataset-name', 'data')
+        )(update_plots)
+
+    # While loading: check every second whether the data is ready,
+    # then reload the page in the browser to show the dashboard
+    @app.callback(
+        Output('data-ready', 'data'),
+        Input('loading-interval', 'n_intervals'),
+        State('dataset-name', 'data')
+    )
+    def check_data_ready(n_intervals, dataset_name):
+        loader = registry.get(dataset_name)
+        return (loader is not None and loader.finished.is_set()) or no_update
+
+    app.clientside_callback(
+        ClientsideFunction(namespace='spotify', function_name='reload_when_ready'),
+        Output('loading-interval', 'disabled'),
+        Input('data-ready', 'data')
+    )
 
 # ------------------------------------
-# Create custom theme for plots
-
-plt_io.templates["custom"] = plt_io.templates["ggplot2"]
-
-# plt_io.templates["custom"]['layout']['paper_bgcolor'] = '#b2b1ad'
-plt_io.templates["custom"]['layout']['plot_bgcolor'] = '#f0f0ef'
-
-plt_io.templates['custom']['layout']['yaxis']['gridcolor'] = '#ffffff'
-plt_io.templates['custom']['layout']['xaxis']['gridcolor'] = '#ffffff'
+# HEALTH CHECKS
+# ------------------------------------
+# /healthz: the process is up (liveness)
+# /ready:   the data is loaded and the dashboard can be served (readiness)
 
-plt_io.templates['custom']['layout']['colorway'] = ['#56B4E9','#E69F00',  '#CC79A7', '#92d134', '#F0E442', '#0072B2', '#D55E00']
+def register_health_endpoints(app, registry, loader):
 
-plt_io.templates['custom']['layout']['font']['size'] = 16
-plt_io.templates['custom']['layout']['xaxis']['tickfont']['size'] = 13
-plt_io.templates['custom']['layout']['yaxis']['tickfont']['size'] = 13
+    @app.server.route('/healthz')
+    def healthz():
+        return jsonify(status = 'ok')
 
-plt_io.templates['custom']['layout']['margin']['l'] = 20
-plt_io.templates['custom']['layout']['margin']['b'] = 20
-plt_io.templates['custom']['layout']['margin']['t'] = 20
-plt_io.templates['custom']['layout']['margin']['r'] = 20
-plt_io.templates['custom']['layout']['margin']['pad'] = 3
+    @app.server.route('/ready')
+    def ready():
+        # Ready once the default dataset is, the others are loaded when they are asked for
+        status = loader.status()
+        status['import_seconds'] = import_seconds
+        status.update(registry.status())
+        return jsonify(status), (200 if status['ready'] else 503)
 
 # ------------------------------------
-# Histogram plot
-df_hist = (data
-    .groupby('year-month')
-    .size()
-    .reset_index(name = 'count')
-    .sort_values(by='year-month'))
-
-df_hist['month-year'] = pd.to_datetime(df_hist['year-month']).dt.strftime('%b %Y')
-
-
-fig_histogram = px.bar(df_hist, 
-            x='month-year', 
-            y='count', 
-            labels={'month-year': 'Month', 'count': 'Number of songs'},
-            template = 'custom')
-
-# Plot of top 20 artists listened to (based on streaming hours)
-df_summary = (data
-    .groupby('master_metadata_album_artist_name')
-    ['ms_played'].sum() 
-    .reset_index(name='total')
-    .sort_values(by='total', ascending=False)
-    .head(20)
-    .sort_values(by='total'))
-
-df_summary['hours'] = round(df_summary['total']/(1000*60*60), 2)
-
-fig_top_artists = px.bar(df_summary, 
-             y='master_metadata_album_artist_name', 
-             x='hours', 
-             labels={'master_metadata_album_artist_name': 'Artist', 'hours': 'Hours streamed'},
-             template = 'custom')
-
+# TIMING
 # ------------------------------------
-dateRangeText = ""
+# Every response lists the timing spans of its request in a Server-Timing header
+# (shown in the browser dev tools), and /metrics shows histograms of all the
+# spans so far in Prometheus text format (see timing.py)
+
+def register_timing(app, registry, loader, compressor):
+
+    @app.server.before_request
+    def start_timing():
+        timing.start_request()
+        g.request_start = time.perf_counter()
+
+    @app.server.after_request
+    def add_server_timing(response):
+        spans = timing.request_spans()
+        if request.path.endswith('/_dash-update-component'):
+            total = time.perf_counter() - g.request_start
+            # What Dash does around the callback, mostly serializing the plots to JSON
+            callback = sum(seconds for name, seconds in spans if name == 'update_plots')
+            timing.observe('dash_dispatch', total - callback)
+            timing.observe('request', total)
+            spans = spans + [('dash_dispatch', total - callback), ('total', total)]
+        if spans:
+            response.headers['Server-Timing'] = timing.server_timing_header(spans)
+        return response
+
+    @app.server.route('/metrics')
+    def metrics():
+        compression = compressor.stats()
+        extra_metrics = [('import_seconds', 'gauge', 'Time taken to import the app.', import_seconds),
+                         ('loaded_datasets', 'gauge', 'Number of datasets loaded.', len(registry.loaders)),
+                         ('datasets_memory_bytes', 'gauge', 'Memory taken by the loaded datasets.', registry.memory_bytes()),
+                         ('response_bytes_total', 'counter', 'Bytes of the compressed responses before compression.',
+                          compression['bytes_in']),
+                         ('response_compressed_bytes_total', 'counter', 'Bytes of the compressed responses sent.',
+                          compression['bytes_out'])]
+        dataset = loader.dataset
+        if dataset is not None:
+            stats = dataset.plot_cache.stats()
+            extra_metrics += [('data_ready_seconds', 'gauge', 'Time taken to load the data.', loader.data_ready_seconds),
+                              ('data_reloads_total', 'counter', 'Times the data was reloaded after its file changed.',
+                               loader.reloads),
+                              ('plot_cache_hits_total', 'counter', 'Slider ranges served from the plot cache.', stats['hits']),
+                              ('plot_cache_misses_total', 'counter', 'Slider ranges not in the plot cache.', stats['misses'])]
+        return Response(timing.prometheus_text(extra_metrics), mimetype='text/plain; version=0.0.4')
 
 # ------------------------------------
-# CALLBACKS
+# COMPRESSION AND CACHING
 # ------------------------------------
-# Callback to update plots based on date range slider
-@app.callback(
-    Output('fig_histogram', 'figure'),
-    Output('fig_top_artists', 'figure'),
-    Output('dateRangeText', 'children'),
-    Input('date-slider', 'value')
-)
-def update_plots(selected_dates):
-    start_date_num = selected_dates[0]
-    end_date_num = selected_dates[1]
-
-    start_date = get_date_from_slider_value_start(start_date_num)
-    end_date = get_date_from_slider_value_end(end_date_num)
-    
-    # Update histogram plot
-    df_hist = (data[(data['date'] >= start_date) & (data['date'] <= end_date)]
-    .groupby('year-month')
-    .size()
-    .reset_index(name = 'count')
-    .sort_values(by='year-month'))
-
-    df_hist['month-year'] = pd.to_datetime(df_hist['year-month']).dt.strftime('%b %Y')
-
-    filtered_histogram = px.bar(df_hist, 
-                x='month-year', 
-                y='count', 
-                labels={'month-year': 'Month', 'count': 'Number of songs'},
-                template = 'custom')
-
-    filtered_histogram.update_xaxes(tickangle=45)
-
-    filtered_histogram.update_xaxes(tickmode='array', tickvals=df_hist['month-year'],
-                    ticktext=df_hist['month-year'])
-
-    # Update top artists plot
-    filtered_summary = (data[(data['date'] >= start_date) & (data['date'] <= end_date)]
-                        .groupby('master_metadata_album_artist_name')['ms_played'].sum()
-                        .reset_index(name='total')
-                        .sort_values(by='total', ascending=False)
-                        .head(20)
-                        .sort_values(by='total'))
-    
-    filtered_summary['hours'] = round(filtered_summary['total'] / (1000 * 60 * 60), 2)
-    
-    filtered_top_artists = px.bar(filtered_summary, 
-                                  y='master_metadata_album_artist_name', 
-                                  x='hours', 
-                                  labels={'master_metadata_album_artist_name': 'Artist', 'hours': 'Hours Streamed'},
-                                  template = 'custom')
-    
-    filtered_top_artists.update_layout(margin=dict(b=112))
-
-    # Explicitly label every tick on the y-axis
-    filtered_top_artists.update_yaxes(tickmode='array', tickvals=filtered_summary['master_metadata_album_artist_name'],
-                    ticktext=filtered_summary['master_metadata_album_artist_name'])
-
-    
-    # Create text for date range
-    start_date_month_year = start_date.strftime('%b %Y')
-
-    end_date_month_year = end_date.strftime('%b %Y')
-
-    dateRangeText_update = f"{start_date_month_year} - {end_date_month_year}"
-    
-    return filtered_histogram, filtered_top_artists, dateRangeText_update
-
+# Registered after the timing so the compression shows up in Server-Timing
+# (Flask runs the after_request functions last registered first)
+
+def register_http_caching(app, compressor):
+    prefix = app.config.routes_pathname_prefix
+    # Only change when the app does, so the browser can revalidate them with an ETag
+    pages = {prefix, prefix + '_dash-layout', prefix + '_dash-dependencies'}
+    assets_prefix = prefix + app.config.assets_url_path.strip('/') + '/'
+
+    @app.server.after_request
+    def cache_and_compress(response):
+        if request.path in pages:
+            response = http_responses.add_etag(response, request)
+        elif request.path.startswith(assets_prefix):
+            response = http_responses.cache_asset(response, request)
+        return compressor.compress_response(response, request)
 
 # ------------------------------------
 # LAYOUT
 # ------------------------------------
-# Define app layout
 
-app.layout = html.Div([
+def message_layout(message, children=()):
+    return dbc.Container([
+
+        dbc.Row([
+            dbc.Col([
+                html.H1("Spotify Streaming History"),
+                html.H5([message], className = 'pb-3')
+            ],
+            className = "text-center pt-3 ms-2 me-2 bg-primary bg-opacity-10",
+            width = 12)
+        ]),
+
+        *children
+
+    ], fluid = True)
+
+def loading_layout(loader):
+    if loader.error is not None:
+        return message_layout("Sorry, the data could not be loaded.")
+
+    return message_layout("Loading data, the dashboard will appear in a moment...", [
+        dcc.Interval(id = 'loading-interval', interval = 1000),
+        dcc.Store(id = 'data-ready'),
+        dcc.Store(id = 'dataset-name', data = loader.name)
+    ])
+
+def dataset_dropdown(name, names):
+    # Only shown when there is more than one dataset
+    if len(names) < 2:
+        return []
+    return [dbc.Row(
+        dbc.Col([
+            dcc.Dropdown(id = 'dataset-dropdown', options = names, value = name, clearable = False)
+        ], xs = 12, md = 6, lg = 4),
+        justify = 'center', className = 'mt-3')]
+
+def resolution_selector(dataset):
+    # Day, week, month or year bars in the histogram (see time_pyramid.py),
+    # not shown when the plots are built in the browser, which only draws months
+    if dataset.clientside:
+        return []
+    return [dbc.RadioItems(
+        id = 'histogram-resolution',
+        options = [{'label': resolution.capitalize(), 'value': resolution} for resolution in time_pyramid.RESOLUTIONS],
+        value = 'auto',
+        inline = True,
+        className = 'text-center')]
 
-dbc.Container([
+# Define app layout
+def main_layout(dataset, name, names):
+    return html.Div([
+
+    dbc.Container([
+
+        dbc.Row([
+            dbc.Col([
+                html.H1("Spotify Streaming History"),
+            ], 
+            className = "text-center pt-3 ms-2 me-2 bg-primary bg-opacity-10",
+            width = 12)
+        ]),
+
+        dbc.Row(
+            dbc.Col([
+                html.H5(["Analysis of my personal Spotify data.",html.Br(),"Please move the sliders to different months to explore different date ranges."])
+            ], 
+            className = "text-center pb-3 ms-2 me-2 bg-primary bg-opacity-10",
+            width = 12)
+        ),
 
-    dbc.Row([
-        dbc.Col([
-            html.H1("Spotify Streaming History"),
-        ], 
-        className = "text-center pt-3 ms-2 me-2 bg-primary bg-opacity-10",
-        width = 12)
-    ]),
 
-    dbc.Row(
-        dbc.Col([
-            html.H5(["Analysis of my personal Spotify data.",html.Br(),"Please move the sliders to different months to explore different date ranges."])
-        ], 
-        className = "text-center pb-3 ms-2 me-2 bg-primary bg-opacity-10",
-        width = 12)
-    ),
+        *dataset_dropdown(name, names),
 
+        dbc.Row([
 
-    dbc.Row([
+            dbc.Col([
+                dcc.RangeSlider(
+                    id='date-slider',
+                    marks={k: {'label': v, 'style': {'transform': 'rotate(45deg)', 'white-space': 'nowrap', 'margin-top': '10px', 'font-size' : '20px'}} for k, v in dataset.date_range_dictionary_slider.items()},
+                    step=None,
+                    min=min(dataset.date_range_dictionary_slider.keys()),
+                    max=max(dataset.date_range_dictionary_slider.keys()),
+                    value=dataset.default_slider_value,
+                    allowCross = False 
+                )
+            ], className = 'mb-5')
 
-        dbc.Col([
-            dcc.RangeSlider(
-                id='date-slider',
-                marks={k: {'label': v, 'style': {'transform': 'rotate(45deg)', 'white-space': 'nowrap', 'margin-top': '10px', 'font-size' : '20px'}} for k, v in date_range_dictionary_slider.items()},
-                step=None,
-                min=min(date_range_dictionary_slider.keys()),
-                max=max(date_range_dictionary_slider.keys()),
-                value=[min(date_range_dictionary_slider.keys()), max(date_range_dictionary_slider.keys())],
-                allowCross = False 
-            )
-        ], className = 'mb-5')
+        ], className = 'mt-3 me-5 ms-5'),
 
-    ], className = 'mt-3 me-5 ms-5'),
+        # Only holds data when CLIENTSIDE_CALLBACKS is turned on
+        dcc.Store(id = 'plot-aggregates', data = dataset.plot_aggregates),
 
-    dbc.Row([
+        # Which dataset the callbacks should use
+        dcc.Store(id = 'dataset-name', data = name),
 
-        dbc.Col([
-            html.H4(id = 'dateRangeText')
-        ], className = 'text-center p-3 fw-bold text-primary border-bottom',width = 12)
+        dbc.Row([
 
-    ]),
+            dbc.Col([
+                html.H4(id = 'dateRangeText')
+            ], className = 'text-center p-3 fw-bold text-primary border-bottom',width = 12)
 
-    dbc.Row([
+        ]),
 
-        dbc.Col([
+        dbc.Row([
 
-            html.H5(["Number of songs streamed each month"], className = 'text-center'),
-            dcc.Graph(id='fig_histogram', figure=fig_histogram)
+            dbc.Col([
 
-        ], xs=12, sm=12, md=12, lg=6, xl=6
-        ),
+                html.H5([dataset.histogram_title], id = 'histogram-title', className = 'text-center'),
+                *resolution_selector(dataset),
+                dcc.Graph(id='fig_histogram', figure=dataset.fig_histogram)
 
-        dbc.Col([
+            ], xs=12, sm=12, md=12, lg=6, xl=6
+            ),
+
+            dbc.Col([
 
-            html.H5(["Top 20 artists"], className = 'text-center'),
-            dcc.Graph(id='fig_top_artists', figure=fig_top_artists)
+                html.H5(["Top 20 artists"], className = 'text-center'),
+                dcc.Graph(id='fig_top_artists', figure=dataset.fig_top_artists)
 
-        ], xs=12, sm=12, md=12, lg=6, xl=6)
+            ], xs=12, sm=12, md=12, lg=6, xl=6)
 
-    ], className = 'me-5 ms-5 mb-1 mt-2'),
+        ], className = 'me-5 ms-5 mb-1 mt-2'),
 
-    ], fluid = True),
+        ], fluid = True),
 
-    # Footer
-    html.Footer([
-        html.Div([
-            html.A("About", href="https://ameliaes.github.io/", style={'marginRight': '15px', 'textDecoration': 'none', 'color': '#007bff'}),
-            html.A("GitHub", href="https://github.com/ameliaes/", style={'marginRight': '15px', 'textDecoration': 'none', 'color': '#007bff'}),
-            html.A("LinkedIn", href="https://www.linkedin.com/in/ameliaes/", style={'marginRight': '15px', 'textDecoration': 'none', 'color': '#007bff'}),
-            html.A("Blog", href="https://ameliaes.github.io/posts/", style={'marginRight': '15px', 'textDecoration': 'none', 'color': '#007bff'}),
-            html.A("Email", href="mailto:amelia1024k@gmail.com", style={'textDecoration': 'none', 'color': '#007bff'}),
+        # Footer
+        html.Footer([
             html.Div([
-                "Created by Amelia Edmondson-Stait using Python Dash. ",
-                "Licensed under the ",
-                    html.A(
-                    "MIT License",
-                    href="https://github.com/AmeliaES/spotify_dashboard/blob/main/LICENSE",
-                    style={'color': '#007bff', 'textDecoration': 'none'}
-                    ),
-                "."
-            ], style={'color': '#6c757d', 'textAlign': 'center'})
-        ],style={'textAlign': 'center'}
+                html.A("About", href="https://ameliaes.github.io/", style={'marginRight': '15px', 'textDecoration': 'none', 'color': '#007bff'}),
+                html.A("GitHub", href="https://github.com/ameliaes/", style={'marginRight': '15px', 'textDecoration': 'none', 'color': '#007bff'}),
+                html.A("LinkedIn", href="https://www.linkedin.com/in/ameliaes/", style={'marginRight': '15px', 'textDecoration': 'none', 'color': '#007bff'}),
+                html.A("Blog", href="https://ameliaes.github.io/posts/", style={'marginRight': '15px', 'textDecoration': 'none', 'color': '#007bff'}),
+                html.A("Email", href="mailto:amelia1024k@gmail.com", style={'textDecoration': 'none', 'color': '#007bff'}),
+                html.Div([
+                    "Created by Amelia Edmondson-Stait using Python Dash. ",
+                    "Licensed under the ",
+                        html.A(
+                        "MIT License",
+                        href="https://github.com/AmeliaES/spotify_dashboard/blob/main/LICENSE",
+                        style={'color': '#007bff', 'textDecoration': 'none'}
+                        ),
+                    "."
+                ], style={'color': '#6c757d', 'textAlign': 'center'})
+            ],style={'textAlign': 'center'}
+            )
+        ],style={
+            'backgroundColor': '#f8f9fa',
+            'padding': '20px 0',
+            'borderTop': '1px solid #e7e7e7',
+            'width': '100%',
+            'textAlign': 'center',
+            'marginTop': 'auto'  # Push the footer to the bottom
+                }
         )
-    ],style={
-        'backgroundColor': '#f8f9fa',
-        'padding': '20px 0',
-        'borderTop': '1px solid #e7e7e7',
-        'width': '100%',
-        'textAlign': 'center',
-        'marginTop': 'auto'  # Push the footer to the bottom
-            }
+
+    ],
+        style={
+            'display': 'flex',
+            'flexDirection': 'column',
+            'minHeight': '100vh',  # Full viewport height
+        }
     )
 
-],
-    style={
-        'display': 'flex',
-        'flexDirection': 'column',
-        'minHeight': '100vh',  # Full viewport height
-    }
-)
+# ------------------------------------
+app = create_app()
+server = app.server
+
+import_seconds = time.perf_counter() - import_start
+logger.info('Imported app in %.2fs', import_seconds)
+
 # ------------------------------------
 # Run the app
 if __name__ == '__main__':
     app.run_server(debug=True)
-
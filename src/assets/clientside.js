@@ -0,0 +1,85 @@
+// Clientside version of update_plots in app.py, used when CLIENTSIDE_CALLBACKS is turned on.
+// Rebuilds both plots and the date range text in the browser from the compact
+// aggregates in the 'plot-aggregates' dcc.Store, so moving the slider doesn't
+// need a request to the server.
+
+// ms -> hours to 2 decimal places, the same as Python's round(): toFixed() except
+// exact halves (eg. 41.625) go to the even digit
+function roundHours(ms) {
+    const hours = ms / (1000 * 60 * 60);
+    const halves = hours * 200;
+    if (Number.isInteger(halves) && halves % 2 === 1 && halves % 25 === 0 && halves / 200 === hours) {
+        const hundredths = (halves - 1) / 2;
+        return (hundredths % 2 === 0 ? hundredths : hundredths + 1) / 100;
+    }
+    return parseFloat(hours.toFixed(2));
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    spotify: {
+        update_plots: function(selectedDates, aggregates) {
+            const startMonth = aggregates.slider_months[selectedDates[0]];
+            const endMonth = aggregates.slider_months[selectedDates[1]];
+
+            // Monthly counts and total ms_played per artist over the selected months
+            const histogramMonths = [];
+            const histogramCounts = [];
+            const totals = new Float64Array(aggregates.artists.length);
+
+            // (months are month indices, numbers of months since Jan 1970)
+            for (let month = 0; month < aggregates.months.length; month++) {
+                const monthIndex = aggregates.months[month];
+                if (monthIndex < startMonth || monthIndex > endMonth) {
+                    continue;
+                }
+                histogramMonths.push(aggregates.month_labels[month]);
+                histogramCounts.push(aggregates.counts[month]);
+
+                const artists = aggregates.month_artists[month];
+                const ms = aggregates.month_ms[month];
+                for (let i = 0; i < artists.length; i++) {
+                    totals[artists[i]] += ms[i];
+                }
+            }
+
+            // Top 20 artists, in ascending order like the server side plot
+            const listened = [];
+            for (let artist = 0; artist < totals.length; artist++) {
+                if (totals[artist] > 0) {
+                    listened.push(artist);
+                }
+            }
+            listened.sort((a, b) => (totals[b] - totals[a]) || (a - b));
+            const top = listened.slice(0, 20).reverse();
+
+            const artistNames = top.map(artist => aggregates.artists[artist]);
+            const hours = top.map(artist => roundHours(totals[artist]));
+
+            // Start from the server side plots for the full range so the styling is the same
+            const histogram = JSON.parse(JSON.stringify(aggregates.figures.histogram));
+            histogram.data[0].x = histogramMonths;
+            histogram.data[0].y = histogramCounts;
+            histogram.layout.xaxis.tickvals = histogramMonths;
+            histogram.layout.xaxis.ticktext = histogramMonths;
+
+            const topArtists = JSON.parse(JSON.stringify(aggregates.figures.top_artists));
+            topArtists.data[0].x = hours;
+            topArtists.data[0].y = artistNames;
+            topArtists.layout.yaxis.tickvals = artistNames;
+            topArtists.layout.yaxis.ticktext = artistNames;
+
+            const dateRangeText = aggregates.slider_labels[selectedDates[0]] + ' - ' + aggregates.slider_labels[selectedDates[1]];
+
+            return [histogram, topArtists, dateRangeText];
+        },
+
+        // While the server is still loading the data: reload the page once it's ready
+        reload_when_ready: function(ready) {
+            if (ready) {
+                window.location.reload();
+                return true;
+            }
+            return window.dash_clientside.no_update;
+        }
+    }
+});
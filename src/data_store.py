@@ -0,0 +1,273 @@
+# Loading the streaming history used by app.py
+#
+# The data can either be read from the CSV made by scripts/explore_data.py or
+# from a typed columnar store made by scripts/build_data_store.py.
+# The columnar store is a directory next to the CSV (eg. data/my_data.columns/)
+# holding one .npy file per column plus a meta.json with the categories, so
+# loading it skips all of the CSV and timestamp parsing.
+#
+# Either way the plays are kept in memory in a compact form (see compact_plays):
+# the artist, track and uri columns are categoricals (integer codes + one copy
+# of each string), the month is an int16 month index and ms_played is int32.
+#
+# With mmap=True the store's .npy files are memory-mapped read-only instead of
+# read into memory, so every gunicorn worker shares the same pages of the plays
+# (through the OS page cache). Everything built from them (the categories'
+# strings, the aggregates) is still one copy per worker.
+#
+# Several processes can load the same data at once (gunicorn workers, each
+# reloading it when the CSV changes), so building or replacing a store takes
+# an exclusive lock on a file next to it (eg. data/my_data.columns.lock) and
+# reading one a shared lock (see store_lock).
+
+from contextlib import contextmanager
+import fcntl
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+import pandas as pd
+
+STORE_SUFFIX = '.columns'
+STORE_VERSION = 2
+
+# Columns kept as categoricals (stored as integer codes + a list of categories)
+CATEGORICAL_COLUMNS = ['master_metadata_track_name',
+                       'master_metadata_album_artist_name',
+                       'spotify_track_uri']
+
+# ------------------------------------
+# Paths
+
+def store_path_for(data_path):
+    # data/extended_streaming.csv -> data/extended_streaming.columns
+    root, ext = os.path.splitext(data_path)
+    if ext == STORE_SUFFIX:
+        return data_path
+    return root + STORE_SUFFIX
+
+def store_is_fresh(data_path):
+    store_path = store_path_for(data_path)
+    meta_path = os.path.join(store_path, 'meta.json')
+    with store_lock(store_path, shared=True):
+        if not os.path.exists(meta_path):
+            return False
+        # Stores written by an older version are rebuilt rather than read
+        with open(meta_path, 'r') as f:
+            if json.load(f).get('version') != STORE_VERSION:
+                return False
+        # DATA_PATH pointing straight at the store, or the CSV has been removed
+        if store_path == data_path or not os.path.exists(data_path):
+            return True
+        # Don't use a store that is older than the CSV it was built from
+        return os.path.getmtime(meta_path) >= os.path.getmtime(data_path)
+
+def data_signature(data_path):
+    # Changes whenever the data at data_path does (see DatasetLoader.check_for_changes):
+    # the CSV, or for a store its meta.json, which is written last (and replaced with the store)
+    if os.path.isdir(data_path):
+        data_path = os.path.join(data_path, 'meta.json')
+    stat = os.stat(data_path)
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+# ------------------------------------
+# Month index: number of months since Jan 1970, so consecutive months are consecutive integers
+# (the slider, the aggregates and the queries all work with it rather than dates or 'YYYY-MM' strings)
+
+MONTH_NAMES = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+def month_index(ts):
+    return ((ts.dt.year - 1970) * 12 + ts.dt.month - 1).astype('int16')
+
+def month_of(date):
+    # The month index of a single date or timestamp
+    return (date.year - 1970) * 12 + date.month - 1
+
+def month_label(month):
+    # Month index -> 'Jan 2022', the labels of the slider and the plots
+    return f'{MONTH_NAMES[month % 12]} {1970 + month // 12}'
+
+# ------------------------------------
+# Compact in-memory representation
+
+def compact_plays(data):
+    ts = pd.to_datetime(data['ts'], utc=True)
+
+    compact = pd.DataFrame({
+        'ts': ts,
+        'month': month_index(ts),
+        'ms_played': data['ms_played'].astype('int32'),
+    })
+
+    for column in CATEGORICAL_COLUMNS:
+        compact[column] = data[column].astype('category')
+
+    return compact
+
+# ------------------------------------
+# Read / write
+
+def read_csv(data_path):
+    data = pd.read_csv(data_path)
+    data['ts'] = pd.to_datetime(data['ts'])
+    return data
+
+# Store locks held by the current thread, so a thread already holding one doesn't wait for itself
+held_locks = threading.local()
+
+@contextmanager
+def store_lock(store_path, shared=False):
+    # Exclusive (to build or replace the store) or shared (to read it) lock on
+    # store_path + '.lock'. flock locks are per open file, so this also keeps
+    # the threads of one process apart
+    key = os.path.abspath(store_path)
+    held = held_locks.__dict__.setdefault('paths', set())
+    if key in held:
+        yield
+        return
+    with open(key + '.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        held.add(key)
+        try:
+            yield
+        finally:
+            held.discard(key)
+            # (closing the file releases the lock)
+
+def temporary_store_path(store_path):
+    # Stores are written to a temporary directory which then replaces the store
+    # (see replace_store), so workers reading (or memory-mapping) the old store
+    # are never affected (one per thread, so two threads never write to the same one)
+    tmp_path = f'{store_path}.tmp-{os.getpid()}-{threading.get_ident()}'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    return tmp_path
+
+def replace_store(tmp_path, store_path):
+    # Under the store's lock, so no other process replaces it or reads it between the two renames
+    with store_lock(store_path):
+        old_path = f'{store_path}.old-{os.getpid()}-{threading.get_ident()}'
+        if os.path.exists(store_path):
+            os.rename(store_path, old_path)
+        os.rename(tmp_path, store_path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+def write_meta(path, rows, columns, categories):
+    meta = {
+        'version': STORE_VERSION,
+        'rows': rows,
+        'columns': columns,
+        'categories': categories,
+    }
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+def write_store(data, store_path):
+    tmp_path = temporary_store_path(store_path)
+
+    data = compact_plays(data)
+    columns = {
+        'ts': data['ts'].dt.tz_localize(None).to_numpy(dtype='datetime64[ns]'),
+        'month': data['month'].to_numpy(),
+        'ms_played': data['ms_played'].to_numpy(),
+    }
+
+    categories = {}
+    for column in CATEGORICAL_COLUMNS:
+        columns[column] = data[column].cat.codes.to_numpy()
+        categories[column] = data[column].cat.categories.tolist()
+
+    for name, values in columns.items():
+        np.save(os.path.join(tmp_path, name + '.npy'), values)
+
+    write_meta(tmp_path, len(data), list(columns.keys()), categories)
+    replace_store(tmp_path, store_path)
+
+class StoreWriter:
+    # Writes a store chunk by chunk, for data that doesn't fit in memory
+    # (eg. scripts/generate_history.py). The number of rows and the categories
+    # have to be known up front: each chunk is a dict of arrays with 'ts'
+    # (UTC datetime64[ns]), 'ms_played' and the integer codes (-1 for missing)
+    # of the CATEGORICAL_COLUMNS.
+    def __init__(self, store_path, rows, categories):
+        self.store_path = store_path
+        self.rows = rows
+        self.categories = categories
+        self.position = 0
+        self.tmp_path = temporary_store_path(store_path)
+
+        dtypes = {'ts': 'datetime64[ns]', 'month': 'int16', 'ms_played': 'int32'}
+        for column in CATEGORICAL_COLUMNS:
+            dtypes[column] = 'int16' if len(categories[column]) < np.iinfo('int16').max else 'int32'
+
+        self.columns = {name: np.lib.format.open_memmap(os.path.join(self.tmp_path, name + '.npy'),
+                                                        mode='w+', dtype=dtype, shape=(rows,))
+                        for name, dtype in dtypes.items()}
+
+    def append(self, chunk):
+        ts = np.asarray(chunk['ts'], dtype='datetime64[ns]')
+        end = self.position + len(ts)
+        if end > self.rows:
+            raise ValueError(f'More than the {self.rows} rows expected written to {self.store_path}')
+
+        self.columns['ts'][self.position:end] = ts
+        self.columns['month'][self.position:end] = ts.astype('datetime64[M]').astype('int64')
+        self.columns['ms_played'][self.position:end] = chunk['ms_played']
+        for column in CATEGORICAL_COLUMNS:
+            self.columns[column][self.position:end] = chunk[column]
+        self.position = end
+
+    def close(self):
+        if self.position != self.rows:
+            raise ValueError(f'{self.position} rows written to {self.store_path}, {self.rows} expected')
+        for values in self.columns.values():
+            values.flush()
+        self.columns = {}
+        write_meta(self.tmp_path, self.rows, ['ts', 'month', 'ms_played'] + CATEGORICAL_COLUMNS, self.categories)
+        replace_store(self.tmp_path, self.store_path)
+
+def read_store(store_path, mmap=False):
+    # (shared lock, so the store isn't replaced half way through reading it)
+    with store_lock(store_path, shared=True):
+        with open(os.path.join(store_path, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+
+        if meta['version'] != STORE_VERSION:
+            raise ValueError(f"Unsupported data store version {meta['version']} in {store_path}")
+
+        def load(name):
+            return np.load(os.path.join(store_path, name + '.npy'), mmap_mode='r' if mmap else None)
+
+        # Everything below wraps the loaded arrays without copying them
+        # (the timestamps are stored in UTC so they only need to be labelled as UTC)
+        columns = {
+            'ts': pd.DatetimeIndex(load('ts').view('int64'), dtype=pd.DatetimeTZDtype('ns', 'UTC'), copy=False),
+            'month': load('month'),
+            'ms_played': load('ms_played'),
+        }
+
+        for column in CATEGORICAL_COLUMNS:
+            columns[column] = pd.Categorical.from_codes(load(column), categories=meta['categories'][column])
+
+        return pd.DataFrame(columns, copy=False)
+
+def ensure_store(data_path):
+    # Build the store from the CSV if there isn't an up to date one
+    store_path = store_path_for(data_path)
+    if not store_is_fresh(data_path):
+        with store_lock(store_path):
+            # Another process may have built it while this one waited for the lock
+            if not store_is_fresh(data_path):
+                write_store(read_csv(data_path), store_path)
+    return store_path
+
+def load_plays(data_path, mmap=False):
+    # Memory-mapping needs the store, so build it first if need be
+    if mmap:
+        return read_store(ensure_store(data_path), mmap=True)
+    # Prefer the columnar store when there is an up to date one, otherwise parse the CSV
+    if store_is_fresh(data_path):
+        return read_store(store_path_for(data_path))
+    return compact_plays(read_csv(data_path))
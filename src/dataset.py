@@ -0,0 +1,483 @@
+# Everything the dashboard derives from one streaming history:
+# the slider dictionaries, the pre-computed aggregates, the plot cache and the
+# plots for the default date range.
+#
+# A Dataset is built in one go (in the background, see DatasetLoader) and is
+# not changed afterwards, so a callback that gets hold of one always sees a
+# consistent set of data. When the data file changes a new Dataset is built
+# next to it and swapped in (see DatasetLoader.reload).
+
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+
+import plotly.io as plt_io
+
+import aggregates
+import data_store
+import figure_cache
+import figures
+import heavy_hitters
+import plays_database
+import time_pyramid
+import timing
+import warmer
+
+logger = logging.getLogger('spotify_dashboard')
+
+# Where the plays live and the plot queries run (DATA_BACKEND, see app.py):
+#   pandas  in memory, aggregated into prefix sums at start up (see aggregates.py)
+#   sqlite  in a SQLite database file, queried for each slider range (see plays_database.py)
+BACKENDS = ('pandas', 'sqlite')
+
+# How the top artists of a slider range are worked out with the pandas backend (TOP_K_ENGINE, see app.py):
+#   exact   from prefix sums over a months x artists matrix (see aggregates.py)
+#   sketch  approximately, from a summary of the biggest artists of each month (see heavy_hitters.py),
+#           for datasets with too many artists for the matrix
+TOP_K_ENGINES = ('exact', 'sketch')
+
+# ------------------------------------
+# Create custom theme for plots
+
+def register_plot_template():
+    if 'custom' in plt_io.templates:
+        return
+
+    plt_io.templates["custom"] = plt_io.templates["ggplot2"]
+
+    # plt_io.templates["custom"]['layout']['paper_bgcolor'] = '#b2b1ad'
+    plt_io.templates["custom"]['layout']['plot_bgcolor'] = '#f0f0ef'
+
+    plt_io.templates['custom']['layout']['yaxis']['gridcolor'] = '#ffffff'
+    plt_io.templates['custom']['layout']['xaxis']['gridcolor'] = '#ffffff'
+
+    plt_io.templates['custom']['layout']['colorway'] = ['#56B4E9','#E69F00',  '#CC79A7', '#92d134', '#F0E442', '#0072B2', '#D55E00']
+
+    plt_io.templates['custom']['layout']['font']['size'] = 16
+    plt_io.templates['custom']['layout']['xaxis']['tickfont']['size'] = 13
+    plt_io.templates['custom']['layout']['yaxis']['tickfont']['size'] = 13
+
+    plt_io.templates['custom']['layout']['margin']['l'] = 20
+    plt_io.templates['custom']['layout']['margin']['b'] = 20
+    plt_io.templates['custom']['layout']['margin']['t'] = 20
+    plt_io.templates['custom']['layout']['margin']['r'] = 20
+    plt_io.templates['custom']['layout']['margin']['pad'] = 3
+
+# ------------------------------------
+# Dataset
+
+def histogram_title(level):
+    # The heading of the histogram for the resolution of its bars
+    return f"Number of songs streamed each {level}"
+
+class Dataset:
+    def __init__(self, data_path, mmap=False, clientside=False, backend='pandas', top_k='exact'):
+        self.data_path = data_path
+        self.backend = backend
+        self.clientside = clientside
+        self.top_k = top_k
+
+        register_plot_template()
+
+        if backend == 'sqlite':
+            # The plays stay on disk: open the database (built from the data the first time)
+            with timing.span('open_database'):
+                self.database = plays_database.PlaysDatabase.open(data_path)
+            data = None
+            min_date, max_date = self.database.date_range()
+        else:
+            # Load in data
+            # (uses the columnar store built by scripts/build_data_store.py if there is one,
+            # otherwise reads the CSV and parses the timestamps)
+            with timing.span('load_plays'):
+                data = data_store.load_plays(data_path, mmap=mmap)
+            self.database = None
+
+            # Get the min and max dates
+            min_date = data['ts'].min().date()
+            max_date = data['ts'].max().date()
+
+        # Get a numeric value for the slider: slider value 1 is the month of the first play
+        # and each value after that is the next month, up to the last whole month
+        # (a month ending after the last play isn't on the slider)
+        self.first_month = data_store.month_of(min_date)
+        last_month = data_store.month_of(max_date)
+        if (max_date + datetime.timedelta(days=1)).day != 1:
+            last_month -= 1
+        slider_values = range(1, last_month - self.first_month + 2)
+
+        self.date_range_dictionary = {value: data_store.month_label(self.month_from_slider_value(value))
+                                      for value in slider_values}
+
+        self.date_range_dictionary_slider = {}
+
+        # Iterate through the items of the existing dictionary
+        keys = list(self.date_range_dictionary.keys())
+        values = list(self.date_range_dictionary.values())
+
+        for i, key in enumerate(keys):
+            if i == 0 or i == len(keys) - 1 or (i + 1) % 3 == 0:  # First, last, and every 3rd value
+                self.date_range_dictionary_slider[key] = values[i]
+            else:
+                self.date_range_dictionary_slider[key] = ''
+
+        self.data = data
+        self.month_prefix_sums = None
+        self.artist_sketches = None
+
+        if (data is not None and top_k == 'exact') or clientside:
+            # Pre-compute a (month x artist) cube of play counts and ms_played sums
+            # so the callbacks never have to scan the raw plays again
+            # (with the sqlite backend only for the clientside aggregates, summed up by the database)
+            with timing.span('month_artist_cube'):
+                if data is not None:
+                    cube = aggregates.build_month_artist_cube(data)
+                else:
+                    cube = self.database.month_artist_cube()
+
+            # Cumulative sums of the cube over the months, so the totals for any slider
+            # range are a single subtraction (see aggregates.PrefixSumIndex).
+            # Only the prefix sums are kept, the cube isn't needed once they are built
+            with timing.span('prefix_sums'):
+                self.month_prefix_sums = aggregates.PrefixSumIndex(cube)
+            del cube
+
+        # Plays per day, week, month and year, for the histogram at other resolutions
+        # (see time_pyramid.py)
+        with timing.span('time_pyramid'):
+            if data is not None:
+                self.time_pyramid = time_pyramid.TimePyramid.from_plays(data['ts'])
+            else:
+                self.time_pyramid = time_pyramid.TimePyramid(*self.database.day_counts())
+
+        # What the per-month counts and top artists of a slider range are worked out with:
+        # the prefix sums, the monthly summaries of the biggest artists, or SQL queries against the database
+        if backend == 'sqlite':
+            self.plot_queries = self.database
+        elif top_k == 'sketch':
+            with timing.span('artist_sketches'):
+                self.artist_sketches = heavy_hitters.MonthlyTopK.from_environment(data, aggregates.ARTIST_COLUMN)
+            self.plot_queries = heavy_hitters.SketchPlotQueries(self.time_pyramid, self.artist_sketches)
+        else:
+            self.plot_queries = self.month_prefix_sums
+
+        # Cache of the plots for each slider range (see figure_cache.py)
+        # The namespace changes with the data file so a shared cache never serves old plots
+        # (and with the sketches, which give approximate plots, so they are never mixed up with exact ones)
+        namespace = figure_cache.data_namespace(data_path)
+        if self.artist_sketches is not None:
+            namespace += f'-sketch{self.artist_sketches.capacity}'
+        self.plot_cache = figure_cache.FigureCache.from_environment(namespace=namespace)
+
+        # Plot data of every slider range, filled in the background by a warmer.PlotDataWarmer
+        self.precomputed = {}
+
+        # Plots for the default (full) date range
+        # These go through update_plots so they are also added to the plot cache
+        self.default_slider_value = [min(self.date_range_dictionary_slider.keys()), max(self.date_range_dictionary_slider.keys())]
+
+        with timing.span('default_plots'):
+            (self.fig_histogram, self.fig_top_artists, self.dateRangeText,
+             self.histogram_title) = self.update_plots(self.default_slider_value)
+
+        # Compact aggregates for the clientside callback:
+        # monthly counts, a sparse (month x artist) ms_played matrix, the month of each
+        # slider value and the default plots to use as a starting point
+        self.plot_aggregates = None
+
+        if clientside:
+            with timing.span('client_aggregates'):
+                self.plot_aggregates = aggregates.client_aggregates(self.month_prefix_sums)
+                self.plot_aggregates['slider_months'] = {value: self.month_from_slider_value(value)
+                                                         for value in self.date_range_dictionary}
+                self.plot_aggregates['slider_labels'] = self.date_range_dictionary
+                self.plot_aggregates['figures'] = {'histogram': json.loads(plt_io.to_json(self.fig_histogram)),
+                                                   'top_artists': json.loads(plt_io.to_json(self.fig_top_artists))}
+
+    def memory_bytes(self):
+        # Roughly how much memory the dataset takes: the plays, the aggregates and the precomputed plot data
+        # (the sqlite backend's plays are on disk, in the OS page cache rather than the process)
+        total = 0
+        if self.data is not None:
+            total += self.data.memory_usage(index=True, deep=True).sum()
+        if self.month_prefix_sums is not None:
+            total += self.month_prefix_sums.count_prefix.nbytes + self.month_prefix_sums.ms_prefix.nbytes
+            total += self.month_prefix_sums.months.nbytes + self.month_prefix_sums.artists.nbytes
+            total += sum(len(artist) for artist in self.month_prefix_sums.artists)
+        total += self.time_pyramid.nbytes()
+        if self.artist_sketches is not None:
+            total += self.artist_sketches.nbytes()
+        # (about 1KB of lists per precomputed slider range)
+        total += 1024 * len(self.precomputed)
+        return int(total)
+
+    def month_from_slider_value(self, slider_value):
+        # The month index (see data_store.month_index) of a slider value
+        return self.first_month + slider_value - 1
+
+    # ------------------------------------
+    # Plots for a date range
+
+    def update_plots(self, selected_dates, resolution='auto'):
+        # Complete figures (for the plots in the initial layout)
+        plot_data = self.plot_data(selected_dates)
+        level, bars, counts = self.histogram_bars(selected_dates, resolution, plot_data)
+
+        with timing.span('figures'):
+            return (figures.histogram_figure(bars, counts, time_pyramid.LEVEL_TITLES[level]),
+                    figures.top_artists_figure(plot_data['artists'], plot_data['hours']),
+                    plot_data['date_range_text'],
+                    histogram_title(level))
+
+    def update_plots_patch(self, selected_dates, resolution='auto'):
+        # Only the parts of the figures that change with the date range, as
+        # dash.Patch updates of the figures already in the browser (see figures.py)
+        plot_data = self.plot_data(selected_dates)
+        level, bars, counts = self.histogram_bars(selected_dates, resolution, plot_data)
+
+        with timing.span('patches'):
+            return (figures.histogram_patch(bars, counts, time_pyramid.LEVEL_TITLES[level]),
+                    figures.top_artists_patch(plot_data['artists'], plot_data['hours']),
+                    plot_data['date_range_text'],
+                    histogram_title(level))
+
+    def histogram_bars(self, selected_dates, resolution, plot_data):
+        # The level of the histogram for the resolution picked and its bars (see time_pyramid.py):
+        # the months are in the plot data already, the other levels come from the pyramid
+        start_month = self.month_from_slider_value(selected_dates[0])
+        end_month = self.month_from_slider_value(selected_dates[1])
+        # (the clientside callback only draws months, see assets/clientside.js)
+        level = 'month' if self.clientside else self.time_pyramid.level_for(start_month, end_month, resolution)
+        if level == 'month':
+            return level, plot_data['months'], plot_data['counts']
+
+        with timing.span('histogram_bars'):
+            bars, counts = self.time_pyramid.bars(level, start_month, end_month)
+        return level, bars, counts
+
+    def plot_data(self, selected_dates):
+        start_date_num = selected_dates[0]
+        end_date_num = selected_dates[1]
+
+        # Precomputed by the warmer, if it has got to this range yet
+        plot_data = self.precomputed.get(f"{start_date_num}-{end_date_num}")
+        if plot_data is not None:
+            return plot_data
+
+        # Otherwise the data for a range is only worked out the first time it is selected
+        return self.plot_cache.get_or_set(f"data-{start_date_num}-{end_date_num}",
+                                          lambda: self.build_plot_data(start_date_num, end_date_num))
+
+    def build_plot_data(self, start_date_num, end_date_num):
+        start_month = self.month_from_slider_value(start_date_num)
+        end_month = self.month_from_slider_value(end_date_num)
+
+        # Histogram: number of songs each month
+        with timing.span('monthly_counts'):
+            df_hist = self.plot_queries.monthly_counts(start_month, end_month)
+
+            month_labels = [data_store.month_label(month) for month in df_hist['month'].tolist()]
+
+        # Top artists: hours streamed
+        with timing.span('top_artists'):
+            filtered_summary = self.plot_queries.top_artists(start_month, end_month, n = 20)
+
+            filtered_summary['hours'] = round(filtered_summary['total'] / (1000 * 60 * 60), 2)
+
+        # Create text for date range
+        dateRangeText_update = f"{data_store.month_label(start_month)} - {data_store.month_label(end_month)}"
+
+        return {'months': month_labels,
+                'counts': df_hist['count'].tolist(),
+                'artists': filtered_summary['master_metadata_album_artist_name'].tolist(),
+                'hours': filtered_summary['hours'].tolist(),
+                'date_range_text': dateRangeText_update}
+
+# ------------------------------------
+# Loading a Dataset in the background
+
+# Forking while a loading thread is half way through (eg. gunicorn --preload
+# forking its workers) would leave the workers with a half loaded dataset and
+# no thread to finish it, so wait for the data before forking. The workers
+# then share the loaded data with the master.
+# (the loaders are only weakly referenced so a dropped loader can be freed)
+loaders = weakref.WeakSet()
+
+def wait_for_loading_threads():
+    for loader in list(loaders):
+        loader.wait_for_loading_thread()
+
+os.register_at_fork(before=wait_for_loading_threads)
+
+class DatasetLoader:
+    def __init__(self, data_path, mmap=False, clientside=False, backend='pandas', top_k='exact', warm=False,
+                 artifact_path=None, on_ready=None):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown data backend {backend!r} (expected one of {', '.join(BACKENDS)})")
+        if top_k not in TOP_K_ENGINES:
+            raise ValueError(f"Unknown top artists engine {top_k!r} (expected one of {', '.join(TOP_K_ENGINES)})")
+        if top_k == 'sketch' and backend != 'pandas':
+            raise ValueError(f"The sketch top artists engine needs the pandas backend (not {backend!r})")
+
+        self.data_path = data_path
+        self.mmap = mmap
+        self.clientside = clientside
+        self.backend = backend
+        self.top_k = top_k
+        # Precompute the plot data of every slider range once the data is ready (see warmer.py)
+        self.warm = warm
+        self.artifact_path = artifact_path or (warmer.artifact_path_for(data_path) if data_path else None)
+        # Called with the loader once the data is ready (see dataset_registry.py)
+        self.on_ready = on_ready
+
+        self.dataset = None
+        self.warmer = None
+        self.error = None
+        self.ready = threading.Event()
+        # Set once loading has finished, whether it worked or not
+        self.finished = threading.Event()
+        self.data_ready_seconds = None
+        self.thread = None
+
+        # What the data file looked like when it was loaded, and a change seen since
+        # that is waiting to stay the same for a whole check (see check_for_changes)
+        self.data_signature = None
+        self.changed_signature = None
+        self.reloads = 0
+        self.last_reload = None
+        self.reload_error = None
+        self.closed = False
+
+        loaders.add(self)
+
+    def build_dataset(self):
+        return Dataset(self.data_path, mmap=self.mmap, clientside=self.clientside, backend=self.backend,
+                       top_k=self.top_k)
+
+    def load(self):
+        start = time.perf_counter()
+        try:
+            self.data_signature = data_store.data_signature(self.data_path)
+            self.dataset = self.build_dataset()
+        except Exception as error:
+            self.error = error
+            self.finished.set()
+            logger.exception('Loading %s failed', self.data_path)
+            return
+        self.data_ready_seconds = time.perf_counter() - start
+        if self.warm:
+            self.warmer = warmer.PlotDataWarmer(self.dataset, self.artifact_path)
+        self.ready.set()
+        self.finished.set()
+        logger.info('Data from %s ready in %.2fs', self.data_path, self.data_ready_seconds)
+
+        if self.warmer is not None:
+            self.warmer.start()
+        if self.on_ready is not None:
+            self.on_ready(self)
+
+    def start(self, background=True, target=None, args=()):
+        target = target or self.load
+        if not background:
+            target(*args)
+            return
+        self.thread = threading.Thread(target=target, args=args, name='dataset-loader', daemon=True)
+        self.thread.start()
+
+    # ------------------------------------
+    # Reloading the data when the file changes
+
+    def check_for_changes(self, background=True):
+        # Called every DATA_RELOAD_SECONDS by the registry (see dataset_registry.py): reload the data
+        # once its file has changed and then stayed the same for a whole check, so a file that
+        # is still being copied in isn't read half written
+        if self.closed or not self.finished.is_set() or (self.thread is not None and self.thread.is_alive()):
+            return
+        try:
+            signature = data_store.data_signature(self.data_path)
+        except OSError:
+            # Removed, or in the middle of being replaced: keep serving the data already loaded
+            return
+        if signature == self.data_signature:
+            self.changed_signature = None
+        elif signature != self.changed_signature:
+            self.changed_signature = signature
+        else:
+            self.changed_signature = None
+            self.start(background, target=self.reload, args=(signature,))
+
+    def reload(self, signature):
+        # Build a Dataset from the new data while the old one keeps being served, then swap it in.
+        # The callbacks get the Dataset once (see wait) and only use that one, so one running
+        # during the swap still sees a consistent set of data, and nothing waits for the reload
+        logger.info('%s has changed, reloading it', self.data_path)
+        start = time.perf_counter()
+        try:
+            with timing.PeakMemory() as memory, timing.span('reload_dataset'):
+                dataset = self.build_dataset()
+        except Exception as error:
+            # Only tried again once the file changes again
+            self.data_signature = signature
+            self.reload_error = error
+            logger.exception('Reloading %s failed, still serving the data loaded before', self.data_path)
+            return
+        rebuild_seconds = time.perf_counter() - start
+
+        new_warmer = warmer.PlotDataWarmer(dataset, self.artifact_path) if self.warm else None
+        old_warmer = self.warmer
+
+        swap_start = time.perf_counter()
+        self.dataset, self.warmer = dataset, new_warmer
+        swap_seconds = time.perf_counter() - swap_start
+
+        self.data_signature = signature
+        self.error = self.reload_error = None
+        self.ready.set()
+        self.reloads += 1
+        self.last_reload = {'rebuild_seconds': round(rebuild_seconds, 3),
+                            'swap_ms': round(swap_seconds * 1000, 4),
+                            'memory_before_mb': None if memory.start_bytes is None else round(memory.start_bytes / 1e6, 1),
+                            'peak_memory_mb': None if memory.peak_bytes is None else round(memory.peak_bytes / 1e6, 1)}
+        logger.info('Reloaded %s in %.2fs (swapped in %.3fms), peak memory during the rebuild %s MB (%s MB before)',
+                    self.data_path, rebuild_seconds, swap_seconds * 1000,
+                    self.last_reload['peak_memory_mb'], self.last_reload['memory_before_mb'])
+
+        if old_warmer is not None:
+            old_warmer.stop()
+        if new_warmer is not None:
+            new_warmer.start()
+        if self.on_ready is not None:
+            self.on_ready(self)
+
+    def wait_for_loading_thread(self):
+        if self.thread is not None and self.thread.is_alive() and self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def wait(self, timeout=None):
+        # The Dataset, or None if it isn't ready within timeout seconds (or couldn't be loaded)
+        self.finished.wait(timeout)
+        return self.dataset
+
+    def close(self):
+        # Stop any background work on the dataset so it can be freed
+        self.closed = True
+        if self.warmer is not None:
+            self.warmer.stop()
+
+    def status(self):
+        status = {'ready': self.ready.is_set(),
+                  'data_path': self.data_path,
+                  'backend': self.backend,
+                  'top_k': self.top_k,
+                  'data_ready_seconds': self.data_ready_seconds,
+                  'error': None if self.error is None else repr(self.error),
+                  'reloads': self.reloads,
+                  'last_reload': self.last_reload,
+                  'reload_error': None if self.reload_error is None else repr(self.reload_error)}
+        if self.warmer is not None:
+            status.update(self.warmer.status())
+        return status
@@ -0,0 +1,215 @@
+# Registry of the datasets (streaming histories) served by one app
+#
+# Configured with environment variables (or .env):
+#   DATA_PATH          a single dataset, named after the file (data/alice.csv -> alice)
+#   DATASETS_DIR       a directory of datasets: every CSV file and columnar store
+#                      (see data_store.py) in it is a dataset named after the file.
+#                      New files are picked up when they are first asked for
+#                      (looking for them at most every RESCAN_SECONDS).
+#   DEFAULT_DATASET    the dataset shown when the URL doesn't name one
+#                      (DATA_PATH's dataset if it is set, otherwise the first by name)
+#   DATASET_MEMORY_MB  memory budget for the loaded datasets (default 1024)
+#   DATA_RELOAD_SECONDS how often to check whether the files of the loaded
+#                      datasets have changed (default 10, 0 to never check)
+#
+# The page shows the dataset named in the URL (?dataset=alice, see app.py).
+# Datasets are only loaded when they are first asked for (in the background,
+# see dataset.DatasetLoader), and once the loaded datasets take more memory
+# than the budget the least recently used ones are dropped (and loaded again
+# if they are asked for later). The default dataset is always kept.
+#
+# A loaded dataset whose file changes (eg. a new export copied over the old
+# one) is rebuilt in the background and swapped in once it is ready, without
+# a restart (see dataset.DatasetLoader.reload). Until then the old data keeps
+# being served.
+
+from collections import OrderedDict
+import logging
+import os
+import threading
+import time
+import weakref
+
+from dataset import DatasetLoader
+
+logger = logging.getLogger('spotify_dashboard')
+
+DEFAULT_MEMORY_BUDGET_MB = 1024
+
+DEFAULT_RELOAD_SECONDS = 10
+
+# Least time between two looks for new files in DATASETS_DIR, so requests
+# for datasets that don't exist (eg. ?dataset=<random>) don't each scan it
+RESCAN_SECONDS = 5
+
+# A fork (eg. gunicorn --preload) doesn't copy the watcher threads: each worker
+# watches (and reloads) its own datasets, and the parent stops watching so it
+# doesn't hold a second copy of reloaded data that no worker uses
+# (only weakly referenced so a registry can be freed, like the warmers)
+registries = weakref.WeakSet()
+
+def stop_watching_in_parent():
+    for registry in list(registries):
+        registry.stop_watching()
+
+def restart_watching_in_child():
+    for registry in list(registries):
+        registry.restart_watching()
+
+os.register_at_fork(after_in_parent=stop_watching_in_parent, after_in_child=restart_watching_in_child)
+
+def dataset_name(path):
+    # data/alice.csv -> alice, data/alice.columns -> alice
+    return os.path.splitext(os.path.basename(path.rstrip(os.sep)))[0]
+
+def find_datasets(directory):
+    paths = {}
+    for entry in sorted(os.scandir(directory), key=lambda entry: entry.name):
+        if entry.name.endswith('.csv') and entry.is_file():
+            paths[dataset_name(entry.path)] = entry.path
+        elif entry.name.endswith('.columns') and entry.is_dir():
+            # A CSV and the store built from it are the same dataset (load_plays picks the store if it is up to date)
+            paths.setdefault(dataset_name(entry.path), entry.path)
+    return paths
+
+class DatasetRegistry:
+    def __init__(self, paths, default_name, memory_budget_bytes, datasets_dir=None, artifact_paths=None,
+                 reload_seconds=0, **loader_options):
+        self.paths = dict(paths)
+        self.default_name = default_name
+        self.memory_budget_bytes = memory_budget_bytes
+        self.datasets_dir = datasets_dir
+        self.artifact_paths = artifact_paths or {}
+        self.reload_seconds = reload_seconds
+        self.scanned_at = time.monotonic()
+        # Passed on to each DatasetLoader (mmap, clientside, warm)
+        self.loader_options = loader_options
+
+        self.loaders = OrderedDict()  # least recently used first
+        self.lock = threading.Lock()
+
+        self.watcher = None
+        self.watching = threading.Event()
+
+        registries.add(self)
+
+    @classmethod
+    def from_environment(cls, data_path=None, artifact_path=None, **loader_options):
+        data_path = data_path or os.environ.get('DATA_PATH')
+        datasets_dir = os.environ.get('DATASETS_DIR')
+
+        paths = find_datasets(datasets_dir) if datasets_dir else {}
+        default_name = None
+        artifact_paths = {}
+        if data_path:
+            default_name = dataset_name(data_path)
+            paths[default_name] = data_path
+            artifact_paths[default_name] = artifact_path
+        default_name = os.environ.get('DEFAULT_DATASET', default_name or next(iter(sorted(paths)), None))
+
+        memory_budget_mb = float(os.environ.get('DATASET_MEMORY_MB', DEFAULT_MEMORY_BUDGET_MB))
+        reload_seconds = float(os.environ.get('DATA_RELOAD_SECONDS', DEFAULT_RELOAD_SECONDS))
+        return cls(paths, default_name, int(memory_budget_mb * 1e6), datasets_dir=datasets_dir,
+                   artifact_paths=artifact_paths, reload_seconds=reload_seconds, **loader_options)
+
+    def names(self):
+        with self.lock:
+            return sorted(self.paths)
+
+    def path_for(self, name):
+        # (called with the lock held)
+        if name not in self.paths and self.datasets_dir and time.monotonic() - self.scanned_at >= RESCAN_SECONDS:
+            # Maybe added since the directory was last looked at
+            self.scanned_at = time.monotonic()
+            self.paths.update((found, path) for found, path in find_datasets(self.datasets_dir).items()
+                              if found not in self.paths)
+        return self.paths.get(name)
+
+    def get(self, name=None, background=True):
+        # The DatasetLoader of a dataset (starting to load it if it isn't loaded),
+        # or None if there is no dataset called name
+        name = name or self.default_name
+        with self.lock:
+            loader = self.loaders.get(name)
+            if loader is not None:
+                self.loaders.move_to_end(name)
+                return loader
+
+            data_path = self.path_for(name)
+            if data_path is None:
+                return None
+
+            loader = DatasetLoader(data_path, artifact_path=self.artifact_paths.get(name),
+                                   on_ready=self.loaded, **self.loader_options)
+            loader.name = name
+            loader.memory_bytes = 0
+            self.loaders[name] = loader
+
+        logger.info('Loading dataset %s from %s', name, data_path)
+        loader.start(background=background)
+        return loader
+
+    def loaded(self, loader):
+        loader.memory_bytes = loader.dataset.memory_bytes()
+        self.evict_over_budget(keep=loader.name)
+
+    def memory_bytes(self):
+        return sum(loader.memory_bytes for loader in list(self.loaders.values()))
+
+    def evict_over_budget(self, keep=None):
+        with self.lock:
+            total = self.memory_bytes()
+            for name, loader in list(self.loaders.items()):
+                if total <= self.memory_budget_bytes:
+                    break
+                # Only loaded datasets are dropped, never the default one (or the one just loaded)
+                if name in (self.default_name, keep) or not loader.ready.is_set():
+                    continue
+                del self.loaders[name]
+                loader.close()
+                total -= loader.memory_bytes
+                logger.info('Dropped dataset %s (%.1fMB) to stay within the %.0fMB memory budget',
+                            name, loader.memory_bytes / 1e6, self.memory_budget_bytes / 1e6)
+
+    def status(self):
+        with self.lock:
+            loaded = {name: round(loader.memory_bytes / 1e6, 1) for name, loader in self.loaders.items()}
+        return {'datasets': len(self.paths),
+                'loaded_datasets_mb': loaded,
+                'memory_mb': round(sum(loaded.values()), 1),
+                'memory_budget_mb': self.memory_budget_bytes / 1e6,
+                'reload_seconds': self.reload_seconds if self.watching.is_set() else None}
+
+    # ------------------------------------
+    # Watching the data files
+
+    def start_watching(self):
+        # Check the files of the loaded datasets every reload_seconds, in a background thread
+        if self.reload_seconds <= 0 or self.watching.is_set():
+            return
+        self.watching.set()
+        self.watcher = threading.Thread(target=self.watch, name='data-watcher', daemon=True)
+        self.watcher.start()
+
+    def stop_watching(self):
+        self.watching.clear()
+
+    def restart_watching(self):
+        if self.watcher is not None:
+            self.watching.clear()
+            self.start_watching()
+
+    def watch(self):
+        watcher = threading.current_thread()
+        while True:
+            time.sleep(self.reload_seconds)
+            # Stopped, or replaced by a new watcher (after a fork)
+            if not self.watching.is_set() or self.watcher is not watcher:
+                return
+            self.check_for_changes()
+
+    def check_for_changes(self):
+        with self.lock:
+            loaders = list(self.loaders.values())
+        for loader in loaders:
+            loader.check_for_changes()
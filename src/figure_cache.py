@@ -0,0 +1,180 @@
+# Cache of the serialized plots returned by the callbacks in app.py
+#
+# The date slider only has a few dozen positions, so there are only about
+# a thousand different (start, end) ranges. The cache keeps the JSON of the
+# plots for the most recently used ranges (LRU) so repeated ranges are not
+# rebuilt.
+#
+# Two backends:
+#  - 'memory': an in-process OrderedDict (one cache per gunicorn worker)
+#  - 'filesystem': one JSON file per range in a directory, shared by all
+#    gunicorn workers on the machine. The file mtime is used as the "last used" time.
+#
+# Configured with environment variables (or .env):
+#   FIGURE_CACHE_SIZE  maximum number of ranges kept (default 256, 0 turns the cache off)
+#   FIGURE_CACHE_DIR   directory for the filesystem backend (memory backend if not set)
+
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+from plotly.utils import PlotlyJSONEncoder
+
+import timing
+
+logger = logging.getLogger('spotify_dashboard')
+
+DEFAULT_SIZE = 256
+
+# ------------------------------------
+# Backends
+
+class MemoryBackend:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+class FileSystemBackend:
+    def __init__(self, max_size, directory):
+        self.max_size = max_size
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path_for(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + '.json')
+
+    def get(self, key):
+        path = self.path_for(key)
+        try:
+            with open(path, 'r') as f:
+                value = f.read()
+            # Mark as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return value
+
+    def set(self, key, value):
+        path = self.path_for(key)
+        # Write to a temporary file first so other workers never read a half written file
+        # (a unique one, as two threads of a worker can write the same range at once)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(value)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        self.evict()
+
+    def entries(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json'):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    pass  # evicted by another worker
+        return entries
+
+    def evict(self):
+        entries = self.entries()
+        if len(entries) <= self.max_size:
+            return
+        entries.sort()
+        for _, path in entries[:len(entries) - self.max_size]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def __len__(self):
+        return len(self.entries())
+
+# ------------------------------------
+# Cache
+
+class FigureCache:
+    # namespace should change whenever the data does (eg. a hash of the data file's
+    # path, size and mtime) so a shared cache never serves plots of old data
+    def __init__(self, max_size=DEFAULT_SIZE, directory=None, namespace=''):
+        self.max_size = max_size
+        self.namespace = namespace
+        if directory:
+            self.backend = FileSystemBackend(max_size, os.path.join(directory, namespace or 'default'))
+        else:
+            self.backend = MemoryBackend(max_size)
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_environment(cls, namespace=''):
+        return cls(max_size=int(os.environ.get('FIGURE_CACHE_SIZE', DEFAULT_SIZE)),
+                   directory=os.environ.get('FIGURE_CACHE_DIR'),
+                   namespace=namespace)
+
+    def get(self, key):
+        if self.max_size <= 0:
+            return None
+        with timing.span('plot_cache_get'):
+            value = self.backend.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return json.loads(value)
+
+    def set(self, key, value):
+        if self.max_size > 0:
+            with timing.span('plot_cache_set'):
+                try:
+                    self.backend.set(key, json.dumps(value, cls=PlotlyJSONEncoder))
+                except OSError as error:
+                    # Not cached this time (eg. the disk is full), the plots are still returned
+                    logger.warning('Could not add %s to the plot cache: %s', key, error)
+        return value
+
+    def get_or_set(self, key, build):
+        value = self.get(key)
+        if value is None:
+            value = self.set(key, build())
+        return value
+
+    def stats(self):
+        return {'backend': type(self.backend).__name__,
+                'size': len(self.backend),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses}
+
+def data_namespace(data_path):
+    # Identify a data file by its path, size and modification time
+    stat = os.stat(data_path)
+    signature = f'{os.path.abspath(data_path)}:{stat.st_size}:{stat.st_mtime_ns}'
+    return hashlib.sha1(signature.encode()).hexdigest()[:16]
@@ -0,0 +1,88 @@
+# Builds the two bar charts of the dashboard as plain figure dicts
+#
+# This gives the same figures (the same JSON) as the px.bar calls plus the
+# update_xaxes / update_yaxes / update_layout calls the plots were made with,
+# without plotly.express and the validation of every property: for a few
+# dozen bars that overhead was most of the time of the callback.
+# (scripts/benchmark_figures.py compares the two)
+#
+# The 'custom' template (see dataset.register_plot_template) is resolved into
+# a dict once and shared by all the figures, so don't modify it.
+#
+# When the slider moves only the bars and the tick labels change, so the
+# callback sends dash.Patch updates of just those (histogram_patch and
+# top_artists_patch) instead of whole figures with their layout and template.
+
+from dash import Patch
+import plotly.io as plt_io
+
+resolved_templates = {}
+
+def resolved_template(name='custom'):
+    if name not in resolved_templates:
+        resolved_templates[name] = plt_io.templates[name].to_plotly_json()
+    return resolved_templates[name]
+
+def bar_figure(x, y, x_title, y_title, orientation, template='custom'):
+    # What px.bar(..., x=, y=, labels=, template=) gives for a single trace of bars
+    template = resolved_template(template)
+    return {
+        'data': [{
+            'alignmentgroup': 'True',
+            'hovertemplate': f'{x_title}=%{{x}}<br>{y_title}=%{{y}}<extra></extra>',
+            'legendgroup': '',
+            'marker': {'color': template['layout']['colorway'][0], 'pattern': {'shape': ''}},
+            'name': '',
+            'offsetgroup': '',
+            'orientation': orientation,
+            'showlegend': False,
+            'textposition': 'auto',
+            'type': 'bar',
+            'x': x,
+            'xaxis': 'x',
+            'y': y,
+            'yaxis': 'y',
+        }],
+        'layout': {
+            'barmode': 'relative',
+            'legend': {'tracegroupgap': 0},
+            'template': template,
+            'xaxis': {'anchor': 'y', 'domain': [0.0, 1.0], 'title': {'text': x_title}},
+            'yaxis': {'anchor': 'x', 'domain': [0.0, 1.0], 'title': {'text': y_title}},
+        },
+    }
+
+def histogram_figure(months, counts, x_title='Month'):
+    # Number of songs each month (or day, week or year), with every bar labelled at 45 degrees
+    figure = bar_figure(months, counts, x_title, 'Number of songs', 'v')
+    figure['layout']['xaxis'].update(tickangle=45, tickmode='array', tickvals=months, ticktext=months)
+    return figure
+
+def top_artists_figure(artists, hours):
+    # Horizontal bars of hours streamed, with every artist labelled
+    figure = bar_figure(hours, artists, 'Hours Streamed', 'Artist', 'h')
+    figure['layout']['margin'] = {'b': 112}
+    figure['layout']['yaxis'].update(tickmode='array', tickvals=artists, ticktext=artists)
+    return figure
+
+# ------------------------------------
+# Partial updates of the figures above
+
+def histogram_patch(months, counts, x_title='Month'):
+    patch = Patch()
+    patch['data'][0]['x'] = months
+    patch['data'][0]['y'] = counts
+    # The resolution of the bars can change too
+    patch['data'][0]['hovertemplate'] = f'{x_title}=%{{x}}<br>Number of songs=%{{y}}<extra></extra>'
+    patch['layout']['xaxis']['title']['text'] = x_title
+    patch['layout']['xaxis']['tickvals'] = months
+    patch['layout']['xaxis']['ticktext'] = months
+    return patch
+
+def top_artists_patch(artists, hours):
+    patch = Patch()
+    patch['data'][0]['x'] = hours
+    patch['data'][0]['y'] = artists
+    patch['layout']['yaxis']['tickvals'] = artists
+    patch['layout']['yaxis']['ticktext'] = artists
+    return patch
@@ -0,0 +1,185 @@
+# Approximate top artists (or tracks) by time streamed, in memory that doesn't
+# grow with the number of artists (TOP_K_ENGINE=sketch, see app.py)
+#
+# The exact top artists (aggregates.PrefixSumIndex) keep a months x artists
+# matrix, which for millions of artists (eg. many users' histories in one
+# dataset) no longer fits. Instead each month keeps a weighted Space-Saving
+# summary of at most `capacity` artists:
+#
+#   items     the artists kept (category codes)
+#   estimate  an overestimate of each one's ms_played that month
+#   error     how much the estimate can be over by
+#   floor     the most ms_played any artist not kept can have had that month
+#
+# The summaries are built in one pass over the plays, a chunk at a time: the
+# chunk's ms_played per (month, artist) is added to that month's summary, an
+# artist not already in it starting from the summary's floor (as it may have
+# been dropped before), and only the `capacity` biggest estimates are kept.
+# The biggest estimate dropped becomes the new floor. So for every artist:
+#
+#   estimate - error <= ms_played <= estimate   if it is in the summary
+#   ms_played <= floor                          if it isn't
+#
+# The top artists of a slider range merge the summaries of its months: the
+# estimates of each artist are summed, with lower and upper bounds from the
+# errors and floors, and the top n are the biggest estimates. Those are exact
+# when no artist's upper bound reaches the n-th lower bound
+# (see TopKResult.guaranteed), which scripts/benchmark_top_k.py checks
+# against the exact results.
+#
+# Configured with environment variables (or .env):
+#   SKETCH_CAPACITY  artists kept per month (default 500)
+
+import os
+
+import numpy as np
+import pandas as pd
+
+import aggregates
+
+DEFAULT_CAPACITY = 500
+
+# Plays added to the summaries at a time
+CHUNK_ROWS = 1_000_000
+
+# ------------------------------------
+# One month's summary
+
+class Summary:
+    def __init__(self, items, estimates, errors, floor):
+        self.items = items
+        self.estimates = estimates
+        self.errors = errors
+        self.floor = floor
+
+    @classmethod
+    def empty(cls):
+        return cls(np.zeros(0, dtype='int64'), np.zeros(0, dtype='int64'), np.zeros(0, dtype='int64'), 0)
+
+    def add(self, items, weights, capacity):
+        # The summary with the (exact) weights of the unique items added
+        all_items = np.concatenate([self.items, items])
+        unique, inverse = np.unique(all_items, return_inverse=True)
+        kept = np.zeros(len(unique), dtype=bool)
+        kept[inverse[:len(self.items)]] = True
+
+        # (float64 sums are exact up to 2**53 ms, see aggregates.build_month_artist_cube)
+        estimates = np.bincount(inverse, weights=np.concatenate([self.estimates, weights]),
+                                minlength=len(unique)).astype('int64')
+        errors = np.zeros(len(unique), dtype='int64')
+        errors[inverse[:len(self.items)]] = self.errors
+        # Artists new to the summary may have been dropped from it before
+        estimates[~kept] += self.floor
+        errors[~kept] = self.floor
+
+        floor = self.floor
+        if len(unique) > capacity:
+            order = np.argpartition(-estimates, capacity - 1)
+            floor = max(floor, int(estimates[order[capacity:]].max()))
+            keep = np.sort(order[:capacity])
+            unique, estimates, errors = unique[keep], estimates[keep], errors[keep]
+        return Summary(unique, estimates, errors, floor)
+
+    def nbytes(self):
+        return self.items.nbytes + self.estimates.nbytes + self.errors.nbytes
+
+# ------------------------------------
+# Top n of a range of months
+
+class TopKResult:
+    def __init__(self, items, names, estimates, lower, upper, next_upper):
+        # Biggest first (category codes and names), with the bounds of each and
+        # the biggest upper bound of those not in the top n
+        self.items = items
+        self.names = names
+        self.estimates = estimates
+        self.lower = lower
+        self.upper = upper
+        self.next_upper = next_upper
+
+    def guaranteed(self):
+        # The top n are exactly the right artists (though maybe not in the right order)
+        # if none of the others can have more than the smallest of them
+        return len(self.lower) == 0 or self.next_upper < self.lower.min()
+
+class MonthlyTopK:
+    def __init__(self, months, codes, weights, names, capacity=DEFAULT_CAPACITY):
+        # months: month index of each play, codes: the artist (or track) category code
+        # of each play (-1 for none), weights: its ms_played, names: the categories
+        self.names = np.asarray(names, dtype=object)
+        self.capacity = capacity
+        self.summaries = {}
+
+        for start in range(0, len(months), CHUNK_ROWS):
+            chunk = slice(start, start + CHUNK_ROWS)
+            chunk_codes = codes[chunk].astype('int64')
+            has_item = chunk_codes >= 0
+            chunk_months = months[chunk].astype('int64')[has_item]
+            chunk_codes = chunk_codes[has_item]
+
+            # ms_played per (month, item) in the chunk
+            keys = chunk_months * len(self.names) + chunk_codes
+            unique, inverse = np.unique(keys, return_inverse=True)
+            sums = np.bincount(inverse, weights=weights[chunk][has_item]).astype('int64')
+
+            unique_months = unique // len(self.names)
+            boundaries = np.flatnonzero(np.diff(unique_months)) + 1
+            for month_keys, month_sums in zip(np.split(unique, boundaries), np.split(sums, boundaries)):
+                month = int(month_keys[0] // len(self.names))
+                summary = self.summaries.get(month, Summary.empty())
+                self.summaries[month] = summary.add(month_keys % len(self.names), month_sums, capacity)
+
+    @classmethod
+    def from_environment(cls, data, column):
+        capacity = int(os.environ.get('SKETCH_CAPACITY', DEFAULT_CAPACITY))
+        return cls(data['month'].to_numpy(), data[column].cat.codes.to_numpy(), data['ms_played'].to_numpy(),
+                   data[column].cat.categories, capacity=capacity)
+
+    def nbytes(self):
+        return sum(summary.nbytes() for summary in self.summaries.values())
+
+    def top(self, start_month, end_month, n=20):
+        summaries = [self.summaries[month] for month in range(start_month, end_month + 1) if month in self.summaries]
+        if not summaries:
+            empty = np.zeros(0, dtype='int64')
+            return TopKResult(empty, self.names[empty], empty, empty, empty, 0)
+
+        items = np.concatenate([summary.items for summary in summaries])
+        unique, inverse = np.unique(items, return_inverse=True)
+
+        def summed(values):
+            return np.bincount(inverse, weights=np.concatenate(values), minlength=len(unique)).astype('int64')
+
+        estimates = summed([summary.estimates for summary in summaries])
+        lower = estimates - summed([summary.errors for summary in summaries])
+        # Months an artist isn't kept in add up to their floor
+        floors = np.array([summary.floor for summary in summaries], dtype='int64')
+        floors_kept = summed([np.full(len(summary.items), summary.floor) for summary in summaries])
+        upper = estimates + floors.sum() - floors_kept
+
+        # Biggest estimates first, ties broken by name
+        order = np.lexsort((self.names[unique], -estimates))
+        top, others = order[:n], order[n:]
+        # An artist in none of the summaries can have at most the sum of the floors
+        next_upper = max(int(upper[others].max()) if len(others) else 0, int(floors.sum()))
+        return TopKResult(unique[top], self.names[unique[top]], estimates[top], lower[top], upper[top], next_upper)
+
+# ------------------------------------
+# Plot queries
+
+class SketchPlotQueries:
+    # The plot queries of aggregates.PrefixSumIndex without its months x artists
+    # matrix: the monthly counts come from the month level of the time pyramid
+    # (see time_pyramid.py) and the top artists from the monthly summaries
+    def __init__(self, time_pyramid, artists):
+        self.months = time_pyramid.levels['month']
+        self.artists = artists
+
+    def monthly_counts(self, start_month, end_month):
+        in_range = (self.months.buckets >= start_month) & (self.months.buckets <= end_month) & (self.months.counts > 0)
+        return pd.DataFrame({'month': self.months.buckets[in_range], 'count': self.months.counts[in_range]})
+
+    def top_artists(self, start_month, end_month, n=20):
+        # The same data frame as PrefixSumIndex.top_artists (ascending by total)
+        result = self.artists.top(start_month, end_month, n)
+        return pd.DataFrame({aggregates.ARTIST_COLUMN: result.names[::-1], 'total': result.estimates[::-1]})
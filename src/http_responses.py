@@ -0,0 +1,137 @@
+# Compression and HTTP caching of the responses of app.server (see app.py)
+#
+# Compression: responses of a compressible type (JSON, HTML, JavaScript,
+# CSS...) of at least COMPRESS_MIN_BYTES are sent brotli or gzip compressed,
+# whichever the browser accepts (brotli needs the optional brotli package).
+# That covers the callback responses (the plots) and the page, layout and
+# Dash's JavaScript bundles. Compressed static files are kept (LRU) so each
+# is only compressed once per worker.
+#
+# Caching:
+#  - the page, /_dash-layout and /_dash-dependencies get an ETag and
+#    Cache-Control: no-cache, so the browser asks again each time but gets a
+#    304 with no body if they haven't changed
+#  - files in assets/ (images, favicon, clientside.js) are linked with their
+#    mtime in the URL (?m=...), so those can be cached for a year without asking
+#    again. Flask already gives them an ETag for conditional requests.
+#  - Dash's own JavaScript (/_dash-component-suites/) already has fingerprinted
+#    URLs and a year long max-age
+#
+# Configured with environment variables (or .env):
+#   RESPONSE_COMPRESSION  set to false to turn compression off
+#   COMPRESS_MIN_BYTES    smallest response compressed (default 500)
+
+import gzip
+import hashlib
+import os
+
+import figure_cache
+import timing
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DEFAULT_MIN_BYTES = 500
+
+# Compressed static files kept per worker
+COMPRESSED_CACHE_SIZE = 64
+
+# Levels for responses compressed on every request: most of the gain for little time
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+COMPRESSIBLE_MIMETYPES = {'application/json', 'application/javascript', 'text/javascript', 'text/html',
+                          'text/css', 'text/plain', 'image/svg+xml'}
+
+ASSETS_MAX_AGE = 365 * 24 * 60 * 60
+
+# ------------------------------------
+# Compression
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+class ResponseCompressor:
+    def __init__(self, enabled=True, min_bytes=DEFAULT_MIN_BYTES):
+        self.enabled = enabled
+        self.min_bytes = min_bytes
+        # Preferred first
+        self.encodings = ['br', 'gzip'] if brotli is not None else ['gzip']
+        self.cache = figure_cache.MemoryBackend(COMPRESSED_CACHE_SIZE)
+        # Bytes of the responses before and after compression (for /metrics)
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    @classmethod
+    def from_environment(cls):
+        return cls(enabled=os.environ.get('RESPONSE_COMPRESSION', 'true').lower() in ('1', 'true', 'yes'),
+                   min_bytes=int(os.environ.get('COMPRESS_MIN_BYTES', DEFAULT_MIN_BYTES)))
+
+    def compress_response(self, response, request):
+        if (not self.enabled or response.status_code != 200 or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+
+        # The same URL can be sent compressed or not
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(self.encodings)
+        if encoding is None:
+            return response
+
+        # Static files are sent straight from disk, read them in to compress them
+        response.direct_passthrough = False
+        data = response.get_data()
+        if len(data) < self.min_bytes:
+            return response
+
+        # Only responses that can't change under the same URL or ETag are kept
+        # (the fingerprinted files and ones with an ETag), not the callbacks
+        cache_key = None
+        if request.method == 'GET' and (response.get_etag()[0] or response.cache_control.max_age):
+            cache_key = f'{encoding}:{request.full_path}:{response.get_etag()[0]}'
+
+        compressed = self.cache.get(cache_key) if cache_key else None
+        if compressed is None:
+            with timing.span('compress'):
+                compressed = compress(data, encoding)
+            if cache_key:
+                self.cache.set(cache_key, compressed)
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        # The compressed body isn't byte for byte the same, so the ETag can only be a weak one
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+
+        self.bytes_in += len(data)
+        self.bytes_out += len(compressed)
+        return response
+
+    def stats(self):
+        return {'bytes_in': self.bytes_in, 'bytes_out': self.bytes_out}
+
+# ------------------------------------
+# Caching
+
+def add_etag(response, request):
+    # For responses that are the same until the app (or its data) changes: the
+    # browser always revalidates, and gets a 304 without a body if nothing changed
+    if request.method != 'GET' or response.status_code != 200:
+        return response
+    response.set_etag(hashlib.sha1(response.get_data()).hexdigest(), weak=True)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+def cache_asset(response, request):
+    # Asset URLs with their mtime in them (?m=...) change whenever the file does
+    if response.status_code == 200 and 'm' in request.args:
+        response.cache_control.public = True
+        response.cache_control.max_age = ASSETS_MAX_AGE
+        response.cache_control.immutable = True
+        response.cache_control.no_cache = None
+    return response
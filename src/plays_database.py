@@ -0,0 +1,238 @@
+# SQLite backend for the plot queries (DATA_BACKEND=sqlite, see app.py)
+#
+# By default the plays are loaded into memory and aggregated with pandas and
+# numpy (see data_store.py and aggregates.py), so the size of a dataset is
+# limited by the memory of each gunicorn worker. With this backend the plays
+# live in a SQLite database file next to the data (data/my_data.sqlite,
+# built from the CSV or the columnar store the first time it is needed) and
+# the per-month counts and the top artists of a slider range are SQL queries
+# against it. Only the pages SQLite reads are in memory, and they are shared
+# by the workers through the OS page cache.
+#
+#   month_artist  the play count and ms_played sum of each (month, artist),
+#                 indexed by month: what the plot queries run against
+#   artists       (id, name)
+#   days          the play count of each day, for the day/week/year histogram (see time_pyramid.py)
+#   meta          (key, value): version, rows and the first and last play dates
+#
+# Summing the plays of a range of months for every query would mean reading
+# up to every play (several seconds for 10M plays), so like the pandas
+# backend (see aggregates.build_month_artist_cube) the plays are summed up by
+# (month, artist) once, when the database is built. The plays themselves
+# aren't written to it: no query reads them, and the CSV or columnar store
+# they come from is kept anyway.
+#
+# The month is the month index of data_store.py (months since Jan 1970), the
+# queries take the same month indices as aggregates.PrefixSumIndex and return
+# the same data frames, so either backend gives the same plots.
+
+import os
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+import aggregates
+import data_store
+import time_pyramid
+
+DATABASE_SUFFIX = '.sqlite'
+DATABASE_VERSION = 3
+
+# Plays summed up at a time when building the database
+INSERT_CHUNK_ROWS = 500_000
+
+MONTHLY_COUNTS_QUERY = '''
+    SELECT month, sum(plays)
+    FROM month_artist
+    WHERE month BETWEEN ? AND ?
+    GROUP BY month
+    ORDER BY month'''
+
+# Ties are broken by artist name, like PrefixSumIndex.top_artists
+TOP_ARTISTS_QUERY = '''
+    SELECT artists.name, top.total
+    FROM (SELECT artist_id, sum(ms_played) AS total
+          FROM month_artist
+          WHERE month BETWEEN ? AND ? AND artist_id IS NOT NULL
+          GROUP BY artist_id
+          HAVING total > 0) AS top
+    JOIN artists ON artists.id = top.artist_id
+    ORDER BY top.total DESC, artists.name
+    LIMIT ?'''
+
+MONTH_ARTIST_CUBE_QUERY = '''
+    SELECT month_artist.month, artists.name, month_artist.plays, month_artist.ms_played
+    FROM month_artist LEFT JOIN artists ON artists.id = month_artist.artist_id
+    ORDER BY month_artist.month, month_artist.artist_id'''
+
+# ------------------------------------
+# Paths
+
+def database_path_for(data_path):
+    # data/extended_streaming.csv (or .columns) -> data/extended_streaming.sqlite
+    return os.path.splitext(data_path.rstrip(os.sep))[0] + DATABASE_SUFFIX
+
+def database_is_fresh(data_path):
+    database_path = database_path_for(data_path)
+    if not os.path.exists(database_path):
+        return False
+    # Databases written by an older version (or half written ones) are rebuilt rather than read
+    try:
+        if read_meta(database_path).get('version') != str(DATABASE_VERSION):
+            return False
+    except sqlite3.DatabaseError:
+        return False
+    if not os.path.exists(data_path):
+        return True
+    # Don't use a database that is older than the data it was built from
+    source_path = os.path.join(data_path, 'meta.json') if os.path.isdir(data_path) else data_path
+    return os.path.getmtime(database_path) >= os.path.getmtime(source_path)
+
+def read_meta(database_path):
+    connection = sqlite3.connect(f'file:{database_path}?mode=ro', uri=True)
+    try:
+        return dict(connection.execute('SELECT key, value FROM meta'))
+    finally:
+        connection.close()
+
+# ------------------------------------
+# Build
+
+def month_artist_sums(months, artist_codes, ms_played):
+    # The play count and ms_played sum of each (month, artist code) with plays, sorted by month then
+    # artist (-1, plays without an artist, first). Summed a chunk of plays at a time, only keeping the
+    # (month, artist) pairs seen so far rather than a dense months x artists array
+    n_codes = int(artist_codes.max()) + 2 if len(artist_codes) else 1
+    keys = np.zeros(0, dtype='int64')
+    counts = sums = np.zeros(0)
+    for start in range(0, len(months), INSERT_CHUNK_ROWS):
+        end = start + INSERT_CHUNK_ROWS
+        chunk_keys = months[start:end].astype('int64') * n_codes + artist_codes[start:end] + 1
+        keys, inverse = np.unique(np.concatenate([keys, chunk_keys]), return_inverse=True)
+        # (float64 sums are exact up to 2**53 ms, see aggregates.build_month_artist_cube)
+        counts = np.bincount(inverse, weights=np.concatenate([counts, np.ones(len(chunk_keys))]), minlength=len(keys))
+        sums = np.bincount(inverse, weights=np.concatenate([sums, ms_played[start:end]]), minlength=len(keys))
+    return keys // n_codes, keys % n_codes - 1, counts.astype('int64'), sums.astype('int64')
+
+def write_database(data_path, database_path):
+    # The plays are read memory-mapped from the columnar store (built first if
+    # need be) and inserted in chunks, so the whole dataset is never in memory
+    data = data_store.load_plays(data_path, mmap=True)
+
+    artist = data[aggregates.ARTIST_COLUMN]
+    artist_codes = artist.cat.codes.to_numpy()
+    months = data['month'].to_numpy()
+    ms_played = data['ms_played'].to_numpy()
+
+    # Written to a temporary file first so other workers never open a half written database
+    tmp_path = f'{database_path}.{os.getpid()}.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    connection = sqlite3.connect(tmp_path)
+    try:
+        connection.execute('PRAGMA journal_mode = OFF')
+        connection.execute('PRAGMA synchronous = OFF')
+        connection.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        connection.execute('CREATE TABLE artists (id INTEGER PRIMARY KEY, name TEXT NOT NULL)')
+
+        connection.executemany('INSERT INTO artists VALUES (?, ?)', enumerate(artist.cat.categories.tolist()))
+
+        first_day, day_counts = time_pyramid.day_counts(data['ts'])
+        connection.execute('CREATE TABLE days (day INTEGER PRIMARY KEY, plays INTEGER NOT NULL)')
+        connection.executemany('INSERT INTO days VALUES (?, ?)',
+                               ((first_day + i, count) for i, count in enumerate(day_counts.tolist()) if count))
+
+        connection.execute('''CREATE TABLE month_artist (month INTEGER NOT NULL, artist_id INTEGER,
+                                                         plays INTEGER NOT NULL, ms_played INTEGER NOT NULL)''')
+        month_artist = month_artist_sums(months, artist_codes, ms_played)
+        # Plays without an artist (eg. podcasts) have code -1
+        artist_ids = month_artist[1].astype(object)
+        artist_ids[month_artist[1] < 0] = None
+        connection.executemany('INSERT INTO month_artist VALUES (?, ?, ?, ?)',
+                               zip(month_artist[0].tolist(), artist_ids.tolist(),
+                                   month_artist[2].tolist(), month_artist[3].tolist()))
+        # Built after the inserts, which is much quicker than keeping it up to date while inserting.
+        # Covering, so the queries only read the index
+        connection.execute('CREATE INDEX month_artist_month ON month_artist (month, artist_id, plays, ms_played)')
+
+        meta = {'version': DATABASE_VERSION,
+                'rows': len(data),
+                'min_date': data['ts'].min().date().isoformat() if len(data) else '',
+                'max_date': data['ts'].max().date().isoformat() if len(data) else ''}
+        connection.executemany('INSERT INTO meta VALUES (?, ?)', [(key, str(value)) for key, value in meta.items()])
+        connection.commit()
+    finally:
+        connection.close()
+
+    os.replace(tmp_path, database_path)
+
+def ensure_database(data_path):
+    # Build the database from the data if there isn't an up to date one
+    database_path = database_path_for(data_path)
+    if not database_is_fresh(data_path):
+        write_database(data_path, database_path)
+    return database_path
+
+# ------------------------------------
+# Queries
+
+class PlaysDatabase:
+    def __init__(self, database_path):
+        self.database_path = database_path
+        # sqlite3 connections can't be shared between threads (or forked processes),
+        # so each thread of each process opens its own
+        self.local = threading.local()
+
+    @classmethod
+    def open(cls, data_path):
+        return cls(ensure_database(data_path))
+
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None or self.local.pid != os.getpid():
+            connection = sqlite3.connect(f'file:{self.database_path}?mode=ro', uri=True)
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+        return connection
+
+    def meta(self):
+        return dict(self.connection().execute('SELECT key, value FROM meta'))
+
+    def date_range(self):
+        # The dates of the first and last plays
+        meta = self.meta()
+        return pd.Timestamp(meta['min_date']).date(), pd.Timestamp(meta['max_date']).date()
+
+    def monthly_counts(self, start_month, end_month):
+        rows = self.connection().execute(MONTHLY_COUNTS_QUERY, (start_month, end_month)).fetchall()
+        return pd.DataFrame({'month': np.array([month for month, _ in rows], dtype='int64'),
+                             'count': np.array([count for _, count in rows], dtype='int64')})
+
+    def top_artists(self, start_month, end_month, n=20):
+        rows = self.connection().execute(TOP_ARTISTS_QUERY, (start_month, end_month, n)).fetchall()
+        # Ascending by total, like PrefixSumIndex.top_artists
+        rows.reverse()
+        return pd.DataFrame({aggregates.ARTIST_COLUMN: [name for name, _ in rows],
+                             'total': np.array([total for _, total in rows], dtype='int64')})
+
+    def day_counts(self):
+        # The first day and the plays of each day from it, like time_pyramid.day_counts
+        rows = self.connection().execute('SELECT day, plays FROM days ORDER BY day').fetchall()
+        if not rows:
+            return 0, np.zeros(0, dtype='int64')
+        first_day = rows[0][0]
+        counts = np.zeros(rows[-1][0] - first_day + 1, dtype='int64')
+        counts[[day - first_day for day, _ in rows]] = [plays for _, plays in rows]
+        return first_day, counts
+
+    def month_artist_cube(self):
+        # The same (month x artist) cube as aggregates.build_month_artist_cube (for the clientside aggregates)
+        rows = self.connection().execute(MONTH_ARTIST_CUBE_QUERY).fetchall()
+        cube = pd.DataFrame(rows, columns=['month', aggregates.ARTIST_COLUMN, 'count', 'ms_played'])
+        cube['month'] = cube['month'].astype('int64')
+        cube['count'] = cube['count'].astype('int64')
+        cube['ms_played'] = cube['ms_played'].astype('int64')
+        return cube
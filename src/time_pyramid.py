@@ -0,0 +1,183 @@
+# Play counts at day, week, month and year resolution, for the histogram
+#
+# The slider picks a range of whole months, but the histogram can show that
+# range by day, week, month or year (the resolution selector above it). The
+# plays are only bucketed once, by day, when the data is loaded; each level of
+# the pyramid is then summed up from the one below it:
+#
+#   day    plays per day (days since Jan 1 1970, UTC like the month index)
+#   week   from the days, weeks starting on a Monday
+#   month  from the days (the same months as data_store.month_index)
+#   year   from the months
+#
+# Each level is a count per bucket plus the first day of every bucket, so the
+# bars of a range are a slice of one level: no callback goes back to the plays.
+# Only weeks and years can be cut by the ends of a range (which are whole
+# months), those edge buckets are summed from the days instead.
+#
+# The level drawn is the one asked for, or the next coarser one if that would
+# be more than MAX_BARS bars, so every histogram has a bounded number of bars
+# however far the range is zoomed out. 'auto' is the finest level that fits.
+
+import numpy as np
+
+import data_store
+
+LEVELS = ('day', 'week', 'month', 'year')
+RESOLUTIONS = ('auto',) + LEVELS
+
+# Most bars drawn in the histogram
+MAX_BARS = 60
+
+# Plays bucketed at a time when counting the plays per day
+DAY_CHUNK_ROWS = 10_000_000
+
+NS_PER_DAY = 24 * 60 * 60 * 10**9
+
+# Jan 1 1970 was a Thursday: day 0 is in the week starting 3 days before it
+WEEK_OFFSET_DAYS = 3
+
+# ------------------------------------
+# Counting the plays per day
+
+def day_counts(ts):
+    # The first day and the number of plays of each day from it (days since Jan 1 1970)
+    # of a column of UTC timestamps (see data_store.load_plays)
+    # (.values is the datetime64[ns] array in UTC, without copying it)
+    ns = np.asarray(ts.values).view('int64')
+    if len(ns) == 0:
+        return 0, np.zeros(0, dtype='int64')
+    first_day = int(ns.min() // NS_PER_DAY)
+    n_days = int(ns.max() // NS_PER_DAY) - first_day + 1
+
+    # In chunks, like aggregates.build_month_artist_cube
+    counts = np.zeros(n_days, dtype='int64')
+    for start in range(0, len(ns), DAY_CHUNK_ROWS):
+        counts += np.bincount(ns[start:start + DAY_CHUNK_ROWS] // NS_PER_DAY - first_day, minlength=n_days)
+    return first_day, counts
+
+# ------------------------------------
+# Buckets of each level
+
+def week_of_day(days):
+    return (days + WEEK_OFFSET_DAYS) // 7
+
+def first_day_of_week(weeks):
+    return weeks * 7 - WEEK_OFFSET_DAYS
+
+def month_of_day(days):
+    return days.astype('datetime64[D]').astype('datetime64[M]').astype('int64')
+
+def first_day_of_month(months):
+    return months.astype('datetime64[M]').astype('datetime64[D]').astype('int64')
+
+def year_of_month(months):
+    return months // 12
+
+def first_day_of_year(years):
+    return first_day_of_month(years * 12)
+
+def day_label(day):
+    date = np.datetime64(int(day), 'D').astype(object)
+    return f'{date.day} {data_store.MONTH_NAMES[date.month - 1]} {date.year}'
+
+# Each level: the level below it, the bucket of each of its buckets,
+# the first day of each bucket and the label of a bucket
+LEVEL_BUCKETS = {
+    'week': ('day', week_of_day, first_day_of_week, lambda week: day_label(first_day_of_week(week))),
+    'month': ('day', month_of_day, first_day_of_month, data_store.month_label),
+    'year': ('month', year_of_month, first_day_of_year, lambda year: str(1970 + year)),
+}
+
+# Titles of the histogram's x axis
+LEVEL_TITLES = {'day': 'Day', 'week': 'Week starting', 'month': 'Month', 'year': 'Year'}
+
+class Level:
+    def __init__(self, buckets, counts, first_days, label):
+        # Consecutive bucket numbers (days, weeks, months or years since 1970)
+        # and the plays in each, with the first day of each bucket plus the day
+        # after the last one
+        self.buckets = buckets
+        self.counts = counts
+        self.first_days = first_days
+        self.label = label
+
+    def nbytes(self):
+        return self.buckets.nbytes + self.counts.nbytes + self.first_days.nbytes
+
+# ------------------------------------
+# Pyramid
+
+class TimePyramid:
+    def __init__(self, first_day, counts):
+        days = np.arange(first_day, first_day + len(counts), dtype='int64')
+        self.first_day = first_day
+        # Leading zero so the plays of days [i, j) are day_prefix[j] - day_prefix[i]
+        self.day_prefix = np.concatenate([[0], np.cumsum(counts)])
+
+        self.levels = {'day': Level(days, counts, np.append(days, first_day + len(counts)), day_label)}
+        for level in LEVELS[1:]:
+            below, bucket_of, first_day_of, label = LEVEL_BUCKETS[level]
+            below = self.levels[below]
+            bucket_of_below = bucket_of(below.buckets)
+            if len(bucket_of_below):
+                first_bucket = int(bucket_of_below[0])
+                buckets = np.arange(first_bucket, int(bucket_of_below[-1]) + 1, dtype='int64')
+                level_counts = np.bincount(bucket_of_below - first_bucket, weights=below.counts,
+                                           minlength=len(buckets)).astype('int64')
+            else:
+                buckets = level_counts = np.zeros(0, dtype='int64')
+            first_days = first_day_of(np.append(buckets, buckets[-1] + 1 if len(buckets) else 0))
+            self.levels[level] = Level(buckets, level_counts, first_days, label)
+
+    @classmethod
+    def from_plays(cls, ts):
+        return cls(*day_counts(ts))
+
+    def nbytes(self):
+        return self.day_prefix.nbytes + sum(level.nbytes() for level in self.levels.values())
+
+    def plays_between(self, start_day, end_day):
+        # Plays of the days [start_day, end_day)
+        start = min(max(start_day - self.first_day, 0), len(self.day_prefix) - 1)
+        end = min(max(end_day - self.first_day, 0), len(self.day_prefix) - 1)
+        return int(self.day_prefix[max(start, end)] - self.day_prefix[start])
+
+    def bucket_range(self, level, start_month, end_month):
+        # Buckets [i, j) of the level overlapping the months [start_month, end_month]
+        # and the days [start_day, end_day) of those months
+        start_day, end_day = first_day_of_month(np.array([start_month, end_month + 1]))
+        first_days = self.levels[level].first_days
+        i = max(np.searchsorted(first_days, start_day, side='right') - 1, 0)
+        j = min(np.searchsorted(first_days, end_day, side='left'), len(first_days) - 1)
+        return int(i), max(int(i), int(j)), int(start_day), int(end_day)
+
+    def n_bars(self, level, start_month, end_month):
+        i, j, _, _ = self.bucket_range(level, start_month, end_month)
+        return j - i
+
+    def level_for(self, start_month, end_month, resolution='auto'):
+        # The level asked for (the finest for 'auto'), or the first coarser one with few enough bars
+        requested = LEVELS.index(resolution) if resolution in LEVELS else 0
+        for level in LEVELS[requested:]:
+            if self.n_bars(level, start_month, end_month) <= MAX_BARS:
+                return level
+        return LEVELS[-1]
+
+    def bars(self, level, start_month, end_month):
+        # Labels and play counts of the buckets of the level in the months [start_month, end_month]
+        # (only the buckets with plays, like the monthly counts)
+        i, j, start_day, end_day = self.bucket_range(level, start_month, end_month)
+        buckets = self.levels[level]
+        counts = buckets.counts[i:j].copy()
+        first_days = buckets.first_days[i:j + 1]
+
+        # Buckets cut by either end of the range: only the days inside it
+        if len(counts) and first_days[0] < start_day:
+            counts[0] = self.plays_between(start_day, min(first_days[1], end_day))
+        if len(counts) and first_days[-1] > end_day:
+            counts[-1] = self.plays_between(max(first_days[-2], start_day), end_day)
+
+        listened = np.flatnonzero(counts)
+        return ([buckets.label(bucket) for bucket in buckets.buckets[i:j][listened].tolist()],
+                counts[listened].tolist())
@@ -0,0 +1,224 @@
+# Timing of the stages of the start up data pipeline and of the slider callback
+#
+# Code is timed with named spans:
+#
+#     with timing.span('top_artists'):
+#         ...
+#
+# Every span is added to a histogram per span name (shown in Prometheus text
+# format by /metrics, see app.py) and, during a request, to the list of spans
+# of that request, which app.py sends back in a Server-Timing header so the
+# browser dev tools show where the time of each slider move went.
+#
+# Histograms are per process, so with several gunicorn workers each worker
+# reports its own.
+#
+# SlowestProfiles is an opt-in profiler (PROFILE_SLOWEST=N) that runs the
+# callback under cProfile and keeps the profiles of the N slowest calls as
+# .prof files in PROFILE_DIR (open them with eg. snakeviz, or turn them into
+# flame graphs with flameprof).
+#
+# PeakMemory samples the resident memory of the process while a block runs,
+# eg. the rebuild of a Dataset when its data file changes (see dataset.py).
+
+from contextlib import contextmanager
+import cProfile
+import heapq
+import os
+import re
+import threading
+import time
+
+from flask import g, has_request_context
+
+# Upper bounds of the histogram buckets, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+METRIC_PREFIX = 'spotify_dashboard'
+
+# ------------------------------------
+# Histograms
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self.lock:
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    self.counts[i] += 1
+                    break
+            else:
+                self.counts[-1] += 1
+            self.sum += seconds
+            self.count += 1
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.counts), self.sum, self.count
+
+histograms = {}
+histograms_lock = threading.Lock()
+
+def reset_locks_after_fork():
+    # A fork while another thread (eg. the plot data warmer) holds one of the
+    # locks would leave it locked forever in the child
+    global histograms_lock
+    histograms_lock = threading.Lock()
+    for histogram in histograms.values():
+        histogram.lock = threading.Lock()
+
+os.register_at_fork(after_in_child=reset_locks_after_fork)
+
+def observe(name, seconds):
+    histogram = histograms.get(name)
+    if histogram is None:
+        with histograms_lock:
+            histogram = histograms.setdefault(name, Histogram())
+    histogram.observe(seconds)
+
+# ------------------------------------
+# Spans
+
+def start_request():
+    g.spans = []
+
+def request_spans():
+    return g.get('spans', []) if has_request_context() else []
+
+@contextmanager
+def span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        observe(name, seconds)
+        if has_request_context() and 'spans' in g:
+            g.spans.append((name, seconds))
+
+def server_timing_header(spans):
+    # Server-Timing: cache;dur=0.3, top_artists;dur=1.2 (durations in ms)
+    return ', '.join(f'{name};dur={seconds * 1000:.2f}' for name, seconds in spans)
+
+# ------------------------------------
+# Memory
+
+def rss_bytes():
+    # Resident memory of this process (None where there is no /proc, eg. macOS)
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+class PeakMemory:
+    # The most resident memory the process had while a with block ran, sampled every interval seconds:
+    #
+    #     with timing.PeakMemory() as memory:
+    #         ...
+    #     memory.peak_bytes, memory.start_bytes
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.start_bytes = None
+        self.peak_bytes = None
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def sample(self):
+        current = rss_bytes()
+        if current is not None:
+            self.peak_bytes = max(self.peak_bytes or 0, current)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def __enter__(self):
+        self.start_bytes = self.peak_bytes = rss_bytes()
+        if self.start_bytes is not None:
+            self.thread = threading.Thread(target=self.run, name='peak-memory', daemon=True)
+            self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.sample()
+        return False
+
+# ------------------------------------
+# /metrics
+
+def prometheus_text(extra_metrics=()):
+    # extra_metrics: (name, type, help, value) of other metrics to include (eg. the plot cache counters)
+    name = f'{METRIC_PREFIX}_span_seconds'
+    lines = [f'# HELP {name} Time spent in each stage of the data pipeline and callbacks.',
+             f'# TYPE {name} histogram']
+
+    with histograms_lock:
+        items = sorted(histograms.items())
+
+    for span_name, histogram in items:
+        counts, total, count = histogram.snapshot()
+        cumulative = 0
+        for bound, bucket_count in zip(list(histogram.buckets) + ['+Inf'], counts):
+            cumulative += bucket_count
+            lines.append(f'{name}_bucket{{span="{span_name}",le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_sum{{span="{span_name}"}} {total}')
+        lines.append(f'{name}_count{{span="{span_name}"}} {count}')
+
+    for metric, metric_type, help_text, value in extra_metrics:
+        metric = f'{METRIC_PREFIX}_{metric}'
+        lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} {metric_type}', f'{metric} {value}']
+
+    return '\n'.join(lines) + '\n'
+
+# ------------------------------------
+# Profiles of the slowest calls
+
+class SlowestProfiles:
+    def __init__(self, keep=0, directory='profiles'):
+        self.keep = keep
+        self.directory = directory
+        self.slowest = []  # min-heap of (seconds, path)
+        self.lock = threading.Lock()
+        if keep > 0:
+            os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_environment(cls):
+        return cls(keep=int(os.environ.get('PROFILE_SLOWEST', 0)),
+                   directory=os.environ.get('PROFILE_DIR', 'profiles'))
+
+    def run(self, label, function, *args):
+        if self.keep <= 0:
+            return function(*args)
+
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            return profile.runcall(function, *args)
+        finally:
+            self.record(label, time.perf_counter() - start, profile)
+
+    def record(self, label, seconds, profile):
+        with self.lock:
+            if len(self.slowest) >= self.keep and seconds <= self.slowest[0][0]:
+                return
+            safe_label = re.sub(r'[^A-Za-z0-9_.-]', '_', label)
+            path = os.path.join(self.directory, f'{seconds * 1000:09.2f}ms-{safe_label}-{os.getpid()}.prof')
+            profile.dump_stats(path)
+            heapq.heappush(self.slowest, (seconds, path))
+            if len(self.slowest) > self.keep:
+                _, evicted = heapq.heappop(self.slowest)
+                try:
+                    os.remove(evicted)
+                except FileNotFoundError:
+                    pass
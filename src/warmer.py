@@ -0,0 +1,173 @@
+# Background precomputation of the plot data of every slider range
+#
+# The date slider only stops at whole months (step=None), so every possible
+# (start, end) range is known as soon as the data is loaded: about a thousand
+# of them for the bundled data. PlotDataWarmer works out the plot data of all
+# of them in a background thread (most likely ranges first) and puts them in
+# Dataset.precomputed, after which no slider move needs any work beyond
+# building the Patch updates.
+#
+# The results are saved in a small gzipped JSON artifact (next to the data by
+# default, or PLOT_ARTIFACT_PATH) which later restarts load instead of
+# recomputing. The artifact records the data namespace (see
+# figure_cache.data_namespace), so it is ignored once the data changes.
+#
+# Warming never blocks readiness: until a range is precomputed it is worked
+# out (and cached) on demand as before.
+
+import gzip
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import weakref
+
+logger = logging.getLogger('spotify_dashboard')
+
+ARTIFACT_VERSION = 1
+
+def artifact_path_for(data_path):
+    # data/extended_streaming.csv -> data/extended_streaming.plots.json.gz
+    return os.path.splitext(data_path.rstrip(os.sep))[0] + '.plots.json.gz'
+
+def slider_ranges(n_months):
+    # Every (start, end) slider range, the most likely first: the full range,
+    # then the ranges with one handle still at either end (moving a single handle
+    # from the default), then all the others
+    ranges = [(start, end) for start in range(1, n_months + 1) for end in range(start, n_months + 1)]
+    return sorted(ranges, key=lambda r: (r != (1, n_months), r[0] != 1 and r[1] != n_months, r))
+
+# ------------------------------------
+# Artifact
+#
+# Month labels and artist names are stored once, in lists, and each range
+# refers to them by index:
+#   {"s-e": [month indices, counts, artist indices, hours, date range text]}
+
+def write_artifact(path, namespace, precomputed):
+    months, artists = {}, {}
+    ranges = {}
+    for key, plot_data in precomputed.items():
+        ranges[key] = [[months.setdefault(month, len(months)) for month in plot_data['months']],
+                       plot_data['counts'],
+                       [artists.setdefault(artist, len(artists)) for artist in plot_data['artists']],
+                       plot_data['hours'],
+                       plot_data['date_range_text']]
+
+    artifact = {'version': ARTIFACT_VERSION,
+                'namespace': namespace,
+                'months': list(months),
+                'artists': list(artists),
+                'ranges': ranges}
+
+    # Written to a temporary file first so other workers never read a half written artifact
+    # (a unique one, so two loaders of the same process never write to the same file)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as raw, gzip.open(raw, 'wt', encoding='utf-8') as f:
+            json.dump(artifact, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+def read_artifact(path, namespace):
+    # The precomputed plot data, or None if there is no artifact for this data
+    if not os.path.exists(path):
+        return None
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        artifact = json.load(f)
+    if artifact.get('version') != ARTIFACT_VERSION or artifact.get('namespace') != namespace:
+        return None
+
+    months, artists = artifact['months'], artifact['artists']
+    return {key: {'months': [months[i] for i in month_indices],
+                  'counts': counts,
+                  'artists': [artists[i] for i in artist_indices],
+                  'hours': hours,
+                  'date_range_text': date_range_text}
+            for key, (month_indices, counts, artist_indices, hours, date_range_text) in artifact['ranges'].items()}
+
+# ------------------------------------
+# Warmer
+
+# A fork (eg. gunicorn --preload) doesn't copy the warmer threads,
+# so carry on warming in the child if they hadn't finished
+# (only weakly referenced so the datasets of dropped warmers can be freed)
+warmers = weakref.WeakSet()
+
+def restart_unfinished_warmers():
+    for warmer in list(warmers):
+        warmer.restart_if_unfinished()
+
+os.register_at_fork(after_in_child=restart_unfinished_warmers)
+
+class PlotDataWarmer:
+    def __init__(self, dataset, artifact_path):
+        self.dataset = dataset
+        self.artifact_path = artifact_path
+        self.ranges = slider_ranges(len(dataset.date_range_dictionary))
+        self.done = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+
+        warmers.add(self)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='plot-data-warmer', daemon=True)
+        self.thread.start()
+
+    def restart_if_unfinished(self):
+        if self.thread is not None and not self.done.is_set() and not self.stopped.is_set():
+            self.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        start = time.perf_counter()
+        namespace = self.dataset.plot_cache.namespace
+        precomputed = self.dataset.precomputed
+
+        try:
+            saved = read_artifact(self.artifact_path, namespace)
+        except (OSError, ValueError) as error:
+            logger.warning('Could not read %s: %s', self.artifact_path, error)
+            saved = None
+        if saved is not None:
+            precomputed.update(saved)
+            logger.info('Loaded the plot data of %d slider ranges from %s in %.2fs',
+                        len(saved), self.artifact_path, time.perf_counter() - start)
+
+        todo = [(s, e) for s, e in self.ranges if f'{s}-{e}' not in precomputed]
+        if todo:
+            logger.info('Precomputing the plot data of %d slider ranges of %s', len(todo), self.dataset.data_path)
+            next_report = 0.1
+            for i, (s, e) in enumerate(todo, start=1):
+                if self.stopped.is_set():
+                    logger.info('Stopped precomputing the plot data of %s', self.dataset.data_path)
+                    return
+                precomputed[f'{s}-{e}'] = self.dataset.build_plot_data(s, e)
+                if i / len(todo) >= next_report:
+                    logger.info('Precomputed %d/%d slider ranges (%.0f%%) of %s in %.2fs',
+                                i, len(todo), 100 * i / len(todo), self.dataset.data_path, time.perf_counter() - start)
+                    next_report += 0.1
+
+            try:
+                write_artifact(self.artifact_path, namespace, precomputed)
+                logger.info('Saved the plot data of %d slider ranges to %s', len(precomputed), self.artifact_path)
+            except OSError as error:
+                logger.warning('Could not save %s: %s', self.artifact_path, error)
+
+        self.done.set()
+        logger.info('All %d slider ranges of %s ready in %.2fs',
+                    len(self.ranges), self.dataset.data_path, time.perf_counter() - start)
+
+    def status(self):
+        return {'precomputed_ranges': sum(f'{s}-{e}' in self.dataset.precomputed for s, e in self.ranges),
+                'slider_ranges': len(self.ranges)}